@@ -3,12 +3,14 @@ from pathlib import Path
 import logging
 from sklearn.model_selection import StratifiedShuffleSplit
 
+from scripts.frame_io import find_artifact, read_frame
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Define constants
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
-INPUT_FILE = PROJECT_ROOT / "data" / "derived" / "cleaned_threaded_comments.csv"
+INPUT_FILE = find_artifact(PROJECT_ROOT / "data" / "derived", "cleaned_threaded_comments") # Parquet if present, else CSV
 OUTPUT_DIR = PROJECT_ROOT / "data" / "annotate"
 OUTPUT_FILE = OUTPUT_DIR / "relevance_sample.csv"
 SAMPLE_SIZE = 500
@@ -31,7 +33,7 @@ def sample_for_relevance(input_path: Path, output_path: Path, n: int, stratify_c
 
     try:
         logging.info(f"Reading input data from {input_path}...")
-        df = pd.read_csv(input_path)
+        df = read_frame(input_path)
         logging.info(f"Read {len(df)} comments.")
 
         # Check if stratify column exists
@@ -1,14 +1,15 @@
 # scripts/annotate/sample_for_sentiment.py
-import pandas as pd
 from sklearn.model_selection import StratifiedShuffleSplit
 import logging
 import os
 
+from scripts.frame_io import find_artifact, read_frame
+
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # --- Configuration ---
-INPUT_PATH = "data/derived/comments_with_relevance.csv"
+INPUT_PATH = find_artifact("data/derived", "comments_with_relevance") # Parquet if present, else CSV
 OUTPUT_PATH = "data/annotate/sample/sentiment_sample.csv"
 SAMPLE_SIZE = 1000
 STRATIFY_COLUMN = "company_name"
@@ -18,7 +19,7 @@ RANDOM_STATE = 42
 # --- Load Data ---
 logging.info(f"Loading data from {INPUT_PATH}")
 try:
-    df = pd.read_csv(INPUT_PATH)
+    df = read_frame(INPUT_PATH)
     logging.info(f"Loaded {len(df)} total rows.")
 except FileNotFoundError:
     logging.error(f"Error: Input data file not found at {INPUT_PATH}")
@@ -1,7 +1,14 @@
 import os
+import io
 import json
+import time
+import argparse
+import contextlib
+import functools
+import numpy as np
 import pandas as pd
 import re
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 try:
     from dateutil.relativedelta import relativedelta
@@ -66,6 +73,51 @@ def parse_relative_timestamp(timestamp_str, current_dt):
          # Handle parsing errors or unparseable formats
         return pd.NaT
 
+# --- Vectorized Timestamp Parsing (one parse per unique string) ---
+TIMESTAMP_CACHE_SIZE = 4096 # Bound on cached (timestamp_text, current_dt) fallback parses
+_RELATIVE_UNIT_SECONDS = {'m': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+_RELATIVE_MAX_SECONDS = 10**9 # Larger offsets go through the scalar path (overflow handling)
+
+@functools.lru_cache(maxsize=TIMESTAMP_CACHE_SIZE)
+def _parse_timestamp_cached(timestamp_str, current_dt):
+    return parse_relative_timestamp(timestamp_str, current_dt)
+
+def parse_relative_timestamps(timestamps, current_dt):
+    """
+    Vectorized equivalent of applying parse_relative_timestamp to every value.
+
+    Values are deduplicated first, so the cost grows with the number of unique
+    timestamp strings ("5w", "2d", "July 25", ...) rather than with rows.
+    Minute/hour/day/week offsets are resolved with str.extract plus timedelta
+    arithmetic; everything else (years, absolute dates) goes through a bounded
+    cache around the scalar parser.
+    Returns a datetime64 Series aligned with the input.
+    """
+    timestamps = pd.Series(timestamps)
+    codes, uniques = pd.factorize(timestamps) # NaN/None get code -1 -> NaT
+    parsed = pd.Series(pd.NaT, index=range(len(uniques)), dtype='datetime64[ns]')
+    if DATEUTIL_AVAILABLE and len(uniques):
+        uniq = pd.Series(uniques, dtype=object)
+        norm = uniq[uniq.map(lambda v: isinstance(v, str))].str.lower().str.strip()
+
+        just_now = norm.index[norm == "just now"]
+        parsed[just_now] = pd.Timestamp(current_dt)
+
+        rel = norm.drop(just_now).str.extract(r"^(\d+)\s*([mhdwy])")
+        rel = rel[rel[0].notna() & rel[1].isin(list(_RELATIVE_UNIT_SECONDS))]
+        seconds = rel[0].map(int) * rel[1].map(_RELATIVE_UNIT_SECONDS)
+        seconds = seconds[seconds < _RELATIVE_MAX_SECONDS]
+        parsed[seconds.index] = pd.Timestamp(current_dt) - pd.to_timedelta(seconds.astype('int64'), unit='s')
+
+        rest = norm.index.difference(just_now).difference(seconds.index)
+        if len(rest):
+            fallback = [_parse_timestamp_cached(uniq[i], current_dt) for i in rest]
+            parsed[rest] = pd.to_datetime(pd.Series(fallback, index=rest, dtype=object), errors='coerce')
+
+    values = parsed.to_numpy()[codes] if len(uniques) else np.full(len(codes), np.datetime64('NaT'), 'datetime64[ns]')
+    values[codes < 0] = np.datetime64('NaT')
+    return pd.Series(values, index=timestamps.index, name=timestamps.name)
+
 # --- Helper Function to Parse Filename Post Date ---
 def parse_filename_date(filename_str):
     """
@@ -82,6 +134,83 @@ def parse_filename_date(filename_str):
         return pd.NaT
 
 
+# --- Helper Functions Shared by the Batch and Streaming Readers ---
+# Output column order for every per-file CSV/Parquet
+FINAL_COLS = ['company_name', 'post_date', 'id', 'parent_id', 'comment_text', 'comment_date', 'comment_type', 'reaction_count']
+
+def extract_comment_fields(comment_json):
+    """Pulls the fields we keep out of one raw comment dict from the extractor."""
+    return {
+        # Get comment text and timestamp text
+        'comment_text': comment_json.get('text', None), # Use original 'text' field
+        'timestamp_text': comment_json.get('timestamp_text', None),
+        # Get reaction count and comment type (with defaults)
+        'reaction_count': comment_json.get('reaction_count', 0),
+        'comment_type': comment_json.get('comment_type', 'unknown'),
+        # Get comment ID and parent ID (with defaults)
+        'id': comment_json.get('id', None),
+        'parent_id': comment_json.get('parent_id', None),
+    }
+
+
+def build_comment_frame(df, company_name, post_date, now, verbose=True):
+    """
+    Adds comment_date, company_name and post_date to a frame of extracted
+    comment fields, selects FINAL_COLS and formats the date columns.
+    Returns the formatted DataFrame, or None if the columns could not be selected.
+    """
+    # --- Calculate Comment Date ---
+    if DATEUTIL_AVAILABLE:
+        if verbose:
+            print("  Calculating approximate comment dates...")
+        df['comment_date'] = parse_relative_timestamps(df['timestamp_text'], now)
+    else:
+        df['comment_date'] = pd.NaT
+        if verbose:
+            print("  Warning: 'python-dateutil' library not found. comment_date column will be empty.")
+
+    # --- Add Company Name and Post Date ---
+    df['company_name'] = company_name
+    # Assign the pre-parsed post_date datetime object
+    df['post_date'] = post_date
+
+
+    # --- Select and Rename Final Columns ---
+    # Define desired columns including the new ones, including id and parent_id
+    # Place id and parent_id after post_date for clarity
+    final_cols = FINAL_COLS
+    try:
+        # Ensure all desired columns exist before selecting
+        # Note: 'text' -> 'comment_text', others added directly
+        missing_cols = [col for col in final_cols if col not in df.columns]
+        if missing_cols:
+            print(f"  Error selecting final columns: Required columns {missing_cols} not found in DataFrame.")
+            print(f"  Available columns before final selection: {df.columns.tolist()}")
+            return None
+
+        df = df[final_cols].copy() # Select the columns in the desired order
+
+    except Exception as e: # Catch any other potential error during selection
+         print(f"  Error during final column selection: {e}")
+         print(f"  Available columns before selection attempt: {df.columns.tolist()}")
+         return None
+
+    # --- Format Date Columns (before saving) ---
+    if 'comment_date' in df.columns:
+        # Convert to datetime first (handles NaT safely), then format YYYY-MM-DD
+        df['comment_date'] = pd.to_datetime(df['comment_date']).dt.strftime('%Y-%m-%d')
+        # Optional: Replace NaT string with empty string if preferred
+        df['comment_date'] = df['comment_date'].replace('NaT', '', regex=False)
+
+    if 'post_date' in df.columns:
+         # Format post_date to YYYY-MM-DD HH:MM:SS
+         df['post_date'] = pd.to_datetime(df['post_date']).dt.strftime('%Y-%m-%d %H:%M:%S')
+         # Handle potential NaT from filename parsing
+         df['post_date'] = df['post_date'].replace('NaT', '', regex=False)
+
+    return df
+
+
 # --- Function to process a SINGLE specified comment JSON file ---
 def process_comment_file(json_file_path, output_csv_path, company_name, post_date):
     """
@@ -113,23 +242,7 @@ def process_comment_file(json_file_path, output_csv_path, company_name, post_dat
         # Extract needed fields from JSON
         for comment_json in data:
             if isinstance(comment_json, dict):
-                # Get comment text and timestamp text
-                comment_text = comment_json.get('text', None) # Use original 'text' field
-                timestamp_text = comment_json.get('timestamp_text', None)
-                # Get reaction count and comment type (with defaults)
-                reaction_count = comment_json.get('reaction_count', 0)
-                comment_type = comment_json.get('comment_type', 'unknown')
-                # Get comment ID and parent ID (with defaults)
-                comment_id_val = comment_json.get('id', None)
-                parent_id_val = comment_json.get('parent_id', None)
-                comments_in_file.append({
-                    'comment_text': comment_text,
-                    'timestamp_text': timestamp_text,
-                    'reaction_count': reaction_count,
-                    'comment_type': comment_type,
-                    'id': comment_id_val,             # Add new field
-                    'parent_id': parent_id_val         # Add new field
-                })
+                comments_in_file.append(extract_comment_fields(comment_json))
             else:
                 print(f"  Warning: Found non-dictionary item in list within '{filename}'. Skipping item.")
                 continue # Skip this item but continue processing others
@@ -147,68 +260,320 @@ def process_comment_file(json_file_path, output_csv_path, company_name, post_dat
 
     # Convert to Pandas DataFrame
     df = pd.DataFrame(comments_in_file)
+    df = build_comment_frame(df, company_name, post_date, datetime.now())
+    if df is None:
+        return False # Indicate failure
 
-    # --- Calculate Comment Date ---
-    if DATEUTIL_AVAILABLE:
-        print("  Calculating approximate comment dates...")
-        now = datetime.now()
-        df['comment_date'] = df['timestamp_text'].apply(lambda ts: parse_relative_timestamp(ts, now))
-    else:
-        df['comment_date'] = pd.NaT
-        print("  Warning: 'python-dateutil' library not found. comment_date column will be empty.")
+    # --- Save to CSV ---
+    print(f"  Saving comments to: {output_csv_path}...")
+    try:
+        df.to_csv(output_csv_path, index=False, encoding='utf-8')
+        print(f"  Successfully saved comments to: {os.path.basename(output_csv_path)}")
+        return True # Indicate success
+    except Exception as e:
+        print(f"  Error: Could not save DataFrame to CSV file '{output_csv_path}': {e}")
+        return False # Indicate failure
 
-    # --- Add Company Name and Post Date ---
-    df['company_name'] = company_name
-    # Assign the pre-parsed post_date datetime object
-    df['post_date'] = post_date
 
+# --- Streaming Reader for Large Scrape Files ---
+STREAM_READ_SIZE = 1 << 16   # Characters read from disk per refill
+STREAM_CHUNK_ROWS = 10_000   # Comments buffered before each CSV/Parquet write
+STREAM_THRESHOLD_BYTES = 50 * 1024 * 1024 # Files at least this large are streamed by __main__
 
-    # --- Select and Rename Final Columns ---
-    # Define desired columns including the new ones, including id and parent_id
-    # Place id and parent_id after post_date for clarity
-    final_cols = ['company_name', 'post_date', 'id', 'parent_id', 'comment_text', 'comment_date', 'comment_type', 'reaction_count']
-    try:
-        # Ensure all desired columns exist before selecting
-        # Note: 'text' -> 'comment_text', others added directly
-        missing_cols = [col for col in final_cols if col not in df.columns]
-        if missing_cols:
-            print(f"  Error selecting final columns: Required columns {missing_cols} not found in DataFrame.")
-            print(f"  Available columns before final selection: {df.columns.tolist()}")
-            return False
+_JSON_TYPE_NAMES = {'{': dict, '"': str, 't': bool, 'f': bool, 'n': type(None)}
 
-        df = df[final_cols] # Select the columns in the desired order
+def iter_json_array(f, read_size=STREAM_READ_SIZE):
+    """
+    Yields the items of a top-level JSON array from an open text file one at
+    a time, holding only the current item (plus one read buffer) in memory.
+    The caller must already have consumed the opening '['.
+    Raises json.JSONDecodeError (a ValueError) on malformed or truncated input,
+    including a trailing comma before ']' and anything but whitespace after it,
+    both of which json.load rejects as well.
+    """
+    decoder = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+    expect_comma = after_comma = False
+    while True:
+        # Skip whitespace, refilling the buffer as needed
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\n\r":
+                pos += 1
+            if pos < len(buf) or eof:
+                break
+            more = f.read(read_size)
+            eof = not more
+            buf, pos = buf[pos:] + more, 0
+        if pos >= len(buf):
+            raise json.JSONDecodeError("Unterminated array", buf, pos)
+
+        ch = buf[pos]
+        if ch == ']':
+            if after_comma:
+                raise json.JSONDecodeError("Trailing comma before ']'", buf, pos)
+            _check_no_extra_data(f, buf[pos + 1:], read_size)
+            return
+        if expect_comma:
+            if ch != ',':
+                raise json.JSONDecodeError("Expecting ',' delimiter", buf, pos)
+            pos += 1
+            expect_comma, after_comma = False, True
+            continue
+
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+            # A value ending exactly at the buffer edge may be cut short (e.g. a number)
+            complete = end < len(buf) or eof
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            complete = False
+        if not complete:
+            # Grow geometrically so one huge item is not re-parsed once per refill
+            more = f.read(max(read_size, len(buf) - pos))
+            eof = not more
+            buf, pos = buf[pos:] + more, 0
+            continue
+
+        yield item
+        pos, expect_comma, after_comma = end, True, False
+        if pos > read_size:
+            buf, pos = buf[pos:], 0
+
+
+def _check_no_extra_data(f, rest, read_size):
+    """Raises json.JSONDecodeError if anything but whitespace follows the closing ']'."""
+    while True:
+        if rest.strip():
+            raise json.JSONDecodeError("Extra data after the top-level array", rest, len(rest) - len(rest.lstrip()))
+        rest = f.read(read_size)
+        if not rest:
+            return
+
+
+def _as_text(series):
+    """Values as the CSV writes them (str of each value), missing values as None."""
+    return series.map(lambda v: None if pd.isna(v) else str(v)).astype(object)
+
+
+def _write_chunk(df, output_path, writer, first_chunk):
+    """Appends one formatted chunk to a CSV or Parquet output. Returns the Parquet writer (if any)."""
+    if output_path.endswith(('.parquet', '.pq')):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        # build_comment_frame leaves values as the scrape has them (reaction_count may be "1.2K"),
+        # so every column is text, as in the CSV; combine_company_csv types them downstream.
+        # The schema is fixed so an all-null column in one chunk cannot change the file's types.
+        schema = pa.schema([(c, pa.string()) for c in FINAL_COLS])
+        if writer is None:
+            writer = pq.ParquetWriter(output_path, schema)
+        table = df[FINAL_COLS].apply(_as_text)
+        writer.write_table(pa.Table.from_pandas(table, schema=schema, preserve_index=False))
+    else:
+        df.to_csv(output_path, mode='w' if first_chunk else 'a', header=first_chunk, index=False, encoding='utf-8')
+    return writer
 
-    except Exception as e: # Catch any other potential error during selection
-         print(f"  Error during final column selection: {e}")
-         print(f"  Available columns before selection attempt: {df.columns.tolist()}")
-         return False
 
-    # --- Format Date Columns (before saving) ---
-    if 'comment_date' in df.columns:
-        # Convert to datetime first (handles NaT safely), then format YYYY-MM-DD
-        df['comment_date'] = pd.to_datetime(df['comment_date']).dt.strftime('%Y-%m-%d')
-        # Optional: Replace NaT string with empty string if preferred
-        df['comment_date'] = df['comment_date'].replace('NaT', '', regex=False)
+def stream_comment_file(json_file_path, output_path, company_name, post_date, chunk_size=STREAM_CHUNK_ROWS):
+    """
+    Streaming variant of process_comment_file for very large scrape files.
 
-    if 'post_date' in df.columns:
-         # Format post_date to YYYY-MM-DD HH:MM:SS
-         df['post_date'] = pd.to_datetime(df['post_date']).dt.strftime('%Y-%m-%d %H:%M:%S')
-         # Handle potential NaT from filename parsing
-         df['post_date'] = df['post_date'].replace('NaT', '', regex=False)
+    Pulls comment objects out of the top-level JSON array one at a time and
+    writes the output in chunks of at most chunk_size rows, so memory stays
+    flat regardless of file size. Writes Parquet if output_path ends in
+    .parquet/.pq, CSV otherwise. Produces the same columns and formatting
+    as process_comment_file.
 
+    Returns True on success, False on failure (any partial output is removed).
+    """
+    filename = os.path.basename(json_file_path)
+    print(f"Streaming file: {filename} -> {os.path.basename(output_path)}")
+
+    now = datetime.now()
+    pending = []
+    rows_written = 0
+    writer = None
+
+    def flush():
+        nonlocal writer, rows_written
+        df = build_comment_frame(pd.DataFrame(pending), company_name, post_date, now, verbose=rows_written == 0)
+        if df is None:
+            raise ValueError("could not build output columns")
+        writer = _write_chunk(df, output_path, writer, first_chunk=rows_written == 0)
+        rows_written += len(df)
+        pending.clear()
 
-    # --- Save to CSV ---
-    print(f"  Saving comments to: {output_csv_path}...")
     try:
-        df.to_csv(output_csv_path, index=False, encoding='utf-8')
-        print(f"  Successfully saved comments to: {os.path.basename(output_csv_path)}")
-        return True # Indicate success
+        with open(json_file_path, 'r', encoding='utf-8') as f:
+            # Find the first non-whitespace character to check the top-level type
+            first = f.read(1)
+            while first and first.isspace():
+                first = f.read(1)
+            if not first:
+                print(f"  Warning: File '{filename}' is empty. Skipping.")
+                return False # Indicate failure
+            if first != '[':
+                found = _JSON_TYPE_NAMES.get(first, float if first in '-0123456789' else object)
+                print(f"  Warning: Expected a list of comments in '{filename}', but found type {found}. Skipping file.")
+                return False # Indicate failure
+
+            for comment_json in iter_json_array(f):
+                if isinstance(comment_json, dict):
+                    pending.append(extract_comment_fields(comment_json))
+                    if len(pending) >= chunk_size:
+                        flush()
+                else:
+                    print(f"  Warning: Found non-dictionary item in list within '{filename}'. Skipping item.")
+                    continue # Skip this item but continue processing others
+
+        if pending:
+            flush()
+
+    except json.JSONDecodeError:
+        print(f"  Error: Could not decode JSON from file '{filename}'. Skipping.")
+        failed = True
     except Exception as e:
-        print(f"  Error: Could not save DataFrame to CSV file '{output_csv_path}': {e}")
+        print(f"  Error: An unexpected error occurred while streaming '{filename}': {e}")
+        failed = True
+    else:
+        failed = False
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if failed:
+        # Remove the half-written output so a failed file never looks processed
+        if (rows_written or writer is not None) and os.path.exists(output_path):
+            os.remove(output_path)
+        return False # Indicate failure
+
+    if rows_written == 0:
+        print(f"  No valid comments were extracted from '{filename}'.")
         return False # Indicate failure
 
+    print(f"  Successfully streamed {rows_written} comments to: {os.path.basename(output_path)}")
+    return True # Indicate success
+
+
+# --- Per-File Driver Shared by the Interactive and Batch Entry Points ---
+DEI_PHASES = ["before_DEI", "after_DEI"]
+MANIFEST_COLS = ['company_name', 'phase', 'file', 'status', 'post_date', 'output', 'message', 'seconds']
+
+def process_json_path(json_file_path, company_name):
+    """
+    Processes one scrape file into a CSV next to it (same name, .csv extension).
+    The post date comes from the filename; files of STREAM_THRESHOLD_BYTES or
+    more are streamed. Returns True on success, False on failure.
+    """
+    json_file_name = os.path.basename(json_file_path)
+    file_name_str = os.path.splitext(json_file_name)[0] # Filename without extension
+
+    # Construct the output CSV filename and path
+    # Output name is same as input, but with .csv extension, in the same directory
+    output_csv_path = os.path.join(os.path.dirname(json_file_path), f"{file_name_str}.csv")
+
+    # --- Parse Post Date from Filename ---
+    post_date_dt = parse_filename_date(file_name_str)
+    if pd.isna(post_date_dt):
+        print(f"Error: Could not determine post date from filename '{json_file_name}'. Skipping file.")
+        return False
+
+    # --- Process the Single File ---
+    print("-" * 20)
+    # Large scrapes are streamed in bounded chunks instead of loaded whole
+    if os.path.getsize(json_file_path) >= STREAM_THRESHOLD_BYTES:
+        process_fn = stream_comment_file
+    else:
+        process_fn = process_comment_file
+    return process_fn(json_file_path, output_csv_path, company_name, post_date_dt)
+
+
+def _batch_worker(task):
+    """Runs process_json_path in a pool worker and returns one manifest record."""
+    company_name, phase, json_file_path = task
+    log = io.StringIO()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(log):
+            ok = process_json_path(json_file_path, company_name)
+    except Exception as e: # Never let one file take down the pool
+        print(f"  Error: {e}", file=log)
+        ok = False
+    # Keep the warnings/errors the per-file functions printed as the manifest message
+    issues = [line.strip() for line in log.getvalue().splitlines() if 'Error' in line or 'Warning' in line]
+    file_name_str = os.path.splitext(os.path.basename(json_file_path))[0]
+    post_date_dt = parse_filename_date(file_name_str) if ok else pd.NaT
+    return {
+        'company_name': company_name,
+        'phase': phase,
+        'file': os.path.basename(json_file_path),
+        'status': 'success' if ok else 'failed',
+        'post_date': '' if pd.isna(post_date_dt) else post_date_dt.strftime('%Y-%m-%d %H:%M:%S'),
+        'output': os.path.join(os.path.dirname(json_file_path), f"{file_name_str}.csv") if ok else '',
+        'message': ' | '.join(issues),
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+def discover_json_files(raw_data_dir, companies=None, phases=DEI_PHASES):
+    """Lists (company, phase, path) for every data/raw/<Company>/<Phase>/*.json file."""
+    tasks = []
+    for company_name in sorted(os.listdir(raw_data_dir)):
+        if companies and company_name not in companies:
+            continue
+        for phase in phases:
+            phase_dir = os.path.join(raw_data_dir, company_name, phase)
+            if not os.path.isdir(phase_dir):
+                continue
+            for f in sorted(os.listdir(phase_dir)):
+                if f.endswith('.json'):
+                    tasks.append((company_name, phase, os.path.join(phase_dir, f)))
+    return tasks
+
+
+def run_batch(raw_data_dir, manifest_path, workers=None, companies=None, phases=DEI_PHASES):
+    """
+    Processes every scrape file under raw_data_dir in a process pool and writes
+    a per-file summary manifest (CSV). Returns the manifest DataFrame.
+    """
+    tasks = discover_json_files(raw_data_dir, companies, phases)
+    if not tasks:
+        print(f"No JSON files found under '{raw_data_dir}'.")
+        return pd.DataFrame(columns=MANIFEST_COLS)
+
+    workers = workers or os.cpu_count() or 1
+    print(f"Processing {len(tasks)} files with {workers} worker processes...")
+    # Largest files first so a big scrape does not start last and hold up the pool
+    ordered = sorted(tasks, key=lambda t: os.path.getsize(t[2]), reverse=True)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        records = list(pool.map(_batch_worker, ordered))
+
+    manifest = pd.DataFrame(records, columns=MANIFEST_COLS).sort_values(['company_name', 'phase', 'file'])
+    manifest.to_csv(manifest_path, index=False, encoding='utf-8')
+
+    for _, rec in manifest[manifest['status'] == 'failed'].iterrows():
+        print(f"  FAILED {rec['company_name']}/{rec['phase']}/{rec['file']}: {rec['message']}")
+    counts = manifest.groupby(['company_name', 'phase'])['status'].value_counts().unstack(fill_value=0)
+    print(counts.to_string())
+    print(f"Manifest written to: {manifest_path}")
+    return manifest
+
+
+def _parse_args():
+    ap = argparse.ArgumentParser(description="Convert raw Facebook comment JSON scrapes to per-file CSVs.")
+    ap.add_argument("--all", action="store_true",
+                    help="Non-interactive: process every data/raw/<Company>/<Phase>/ directory")
+    ap.add_argument("--raw-dir", default=None, help="Raw data root (default: <repo>/data/raw)")
+    ap.add_argument("--companies", nargs="+", default=None, help="Only these company folders (with --all)")
+    ap.add_argument("--phases", nargs="+", choices=DEI_PHASES, default=DEI_PHASES, help="Phases to process (with --all)")
+    ap.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    ap.add_argument("--manifest", default=None,
+                    help="Summary manifest CSV (default: <repo>/data/derived/json_processing_manifest.csv)")
+    return ap.parse_args()
+
 
 if __name__ == "__main__":
+    args = _parse_args()
     print("Facebook Comment Processor (Batch Mode)")
     print("-" * 30)
     if not DATEUTIL_AVAILABLE:
@@ -216,28 +581,32 @@ if __name__ == "__main__":
         print("!! Please run: pip install python-dateutil")
         print("-" * 30)
 
-    # --- Get User Input ---
-    company_folder_name = input("Enter the company name (folder name, e.g., Google): ")
-    dei_phase = ""
-    while dei_phase not in ["before_DEI", "after_DEI"]:
-        dei_phase = input("Enter the phase ('before_DEI' or 'after_DEI'): ")
-        if dei_phase not in ["before_DEI", "after_DEI"]:
-            print("Invalid input. Please enter 'before_DEI' or 'after_DEI'.")
-
-
     # --- Define Base Paths Relative to Script Location ---
     script_dir = os.path.dirname(__file__)
     base_data_dir = os.path.abspath(os.path.join(script_dir, '..', '..', 'data')) # Go up two levels to root, then data/
-    raw_data_dir = os.path.join(base_data_dir, 'raw')
-    derived_data_dir = os.path.join(base_data_dir, 'derived') # Keep this for now, might be used elsewhere? Or remove if confirmed unused.
+    raw_data_dir = args.raw_dir or os.path.join(base_data_dir, 'raw')
+    derived_data_dir = os.path.join(base_data_dir, 'derived') # Holds the batch manifest
 
-    # Ensure derived data directory exists - REMOVE IF UNUSED
+    # Ensure derived data directory exists
     os.makedirs(derived_data_dir, exist_ok=True)
 
+    # --- Non-Interactive Batch Mode ---
+    if args.all:
+        manifest_path = args.manifest or os.path.join(derived_data_dir, 'json_processing_manifest.csv')
+        manifest = run_batch(raw_data_dir, manifest_path, args.workers, args.companies, args.phases)
+        exit(1 if (manifest['status'] == 'failed').any() else 0)
+
+    # --- Get User Input ---
+    company_folder_name = input("Enter the company name (folder name, e.g., Google): ")
+    dei_phase = ""
+    while dei_phase not in DEI_PHASES:
+        dei_phase = input("Enter the phase ('before_DEI' or 'after_DEI'): ")
+        if dei_phase not in DEI_PHASES:
+            print("Invalid input. Please enter 'before_DEI' or 'after_DEI'.")
+
     # --- Construct Path to the comments-json Directory ---
     # Updated path construction to include DEI phase
     company_raw_path = os.path.join(raw_data_dir, company_folder_name)
-    # comments_json_dir = os.path.join(company_raw_path, 'comments-json') # Old specific subfolder
     target_data_dir = os.path.join(company_raw_path, dei_phase) # New path with DEI phase
 
     if not os.path.isdir(target_data_dir):
@@ -256,25 +625,8 @@ if __name__ == "__main__":
         exit()
 
     for json_file_name in json_files:
-        file_name_str = os.path.splitext(json_file_name)[0] # Filename without extension
         json_file_path = os.path.join(target_data_dir, json_file_name)
-
-        # Construct the output CSV filename and path
-        # Output name is same as input, but with .csv extension
-        output_csv_name = f"{file_name_str}.csv"
-        # Output path is the same directory as the input JSON file
-        output_csv_path = os.path.join(target_data_dir, output_csv_name)
-
-        # --- Parse Post Date from Filename ---
-        post_date_dt = parse_filename_date(file_name_str)
-        if pd.isna(post_date_dt):
-            print(f"Error: Could not determine post date from filename '{json_file_name}'. Skipping file.")
-            fail_count += 1
-            continue # Skip to the next file
-
-        # --- Process the Single File ---
-        print("-" * 20)
-        if process_comment_file(json_file_path, output_csv_path, company_folder_name, post_date_dt):
+        if process_json_path(json_file_path, company_folder_name):
             success_count += 1
         else:
             fail_count += 1
@@ -0,0 +1,183 @@
+"""frame_io.py
+
+Typed, compressed storage for the derived pipeline artifacts in data/derived/.
+
+Parquet is the native format for every stage (combine → graph → clean →
+relevance → EDA): dates and timedeltas keep their dtypes, ``company_name`` and
+``comment_type`` are stored dictionary-encoded as categoricals, and files are
+zstd-compressed. CSV stays available as an export format; CSV inputs are
+coerced to the same schema on read so downstream code sees identical dtypes
+whichever format an artifact was written in.
+
+Scripts importing this module are run from the repository root as modules,
+e.g. ``python -m scripts.preprocess.clean_comments``.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Iterator
+
+import pandas as pd
+
+FORMATS = ("parquet", "csv")
+DEFAULT_FORMAT = "parquet"
+PARQUET_COMPRESSION = "zstd"
+
+# Schema applied to derived artifacts (only columns that are present)
+CATEGORICAL_COLS = ("company_name", "comment_type")
+DATETIME_COLS = ("post_date", "comment_date")
+TIMEDELTA_COLS = ("time_since_root",)
+NULLABLE_INT_COLS = ("has_DEI", "before_DEI", "depth", "sibling_count")
+
+_SUFFIXES = {"parquet": ".parquet", "csv": ".csv"}
+
+
+def artifact_path(directory: Path | str, stem: str, fmt: str = DEFAULT_FORMAT) -> Path:
+    """Return ``directory/stem`` with the suffix for ``fmt``."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}; expected one of {FORMATS}")
+    return Path(directory) / f"{stem}{_SUFFIXES[fmt]}"
+
+
+def find_artifact(directory: Path | str, stem: str) -> Path:
+    """Return the Parquet artifact if it exists, else the CSV one (which may not exist)."""
+    parquet = artifact_path(directory, stem, "parquet")
+    return parquet if parquet.exists() else artifact_path(directory, stem, "csv")
+
+
+def apply_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """Coerce known pipeline columns to their storage dtypes (in place) and return ``df``."""
+    for col in CATEGORICAL_COLS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+    for col in DATETIME_COLS:
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            # ISO8601 accepts both "YYYY-MM-DD" and "YYYY-MM-DD HH:MM:SS" in one column
+            df[col] = pd.to_datetime(df[col], errors="coerce", format="ISO8601")
+    for col in TIMEDELTA_COLS:
+        if col in df.columns and not pd.api.types.is_timedelta64_dtype(df[col]):
+            df[col] = pd.to_timedelta(df[col], errors="coerce")
+    for col in NULLABLE_INT_COLS:
+        # CSV round-trips turn integer columns with gaps into float64
+        if col in df.columns and pd.api.types.is_float_dtype(df[col]):
+            df[col] = df[col].astype("Int64")
+    return df
+
+
+def read_frame(path: Path | str, columns: list[str] | None = None, dtype: dict | None = None) -> pd.DataFrame:
+    """Read a derived artifact (format chosen by suffix) with the pipeline schema applied.
+
+    ``dtype`` is passed to ``read_csv`` for CSV inputs, as in ``iter_frames``.
+    """
+    path = Path(path)
+    if path.suffix in {".parquet", ".pq"}:
+        return apply_schema(pd.read_parquet(path, columns=columns))
+    if path.suffix == ".csv":
+        return apply_schema(pd.read_csv(path, usecols=columns, dtype=dtype))
+    raise ValueError("Only .csv or .parquet files are supported.")
+
+
+def frame_columns(path: Path | str) -> list[str]:
+    """Column names of a derived artifact, read from the Parquet schema or the CSV header only."""
+    path = Path(path)
+    if path.suffix in {".parquet", ".pq"}:
+        import pyarrow.parquet as pq
+
+        return pq.ParquetFile(path).schema_arrow.names
+    if path.suffix == ".csv":
+        return pd.read_csv(path, nrows=0).columns.tolist()
+    raise ValueError("Only .csv or .parquet files are supported.")
+
+
+def write_frame(df: pd.DataFrame, path: Path | str) -> None:
+    """Write a derived artifact; Parquet gets the typed schema and compression."""
+    path = Path(path)
+    if path.suffix in {".parquet", ".pq"}:
+        apply_schema(df.copy()).to_parquet(path, index=False, compression=PARQUET_COMPRESSION)
+    elif path.suffix == ".csv":
+        df.to_csv(path, index=False)
+    else:
+        raise ValueError("Only .csv or .parquet outputs are supported.")
+
+
+def iter_frames(
+    path: Path | str,
+    chunk_rows: int,
+    columns: list[str] | None = None,
+    dtype: dict | None = None,
+) -> Iterator[pd.DataFrame]:
+    """Yield a derived artifact in chunks of at most ``chunk_rows`` rows, schema applied.
+
+    ``dtype`` is passed to ``read_csv`` for CSV inputs so that a chunk in which
+    a text column happens to be all empty is not inferred as float.
+    """
+    path = Path(path)
+    if path.suffix in {".parquet", ".pq"}:
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=columns):
+            yield apply_schema(batch.to_pandas())
+    elif path.suffix == ".csv":
+        for chunk in pd.read_csv(path, chunksize=chunk_rows, usecols=columns, dtype=dtype):
+            yield apply_schema(chunk)
+    else:
+        raise ValueError("Only .csv or .parquet files are supported.")
+
+
+class ChunkedFrameWriter:
+    """Append DataFrame chunks to one derived artifact (CSV or Parquet, by suffix).
+
+    The Parquet schema is fixed by the first chunk, with all-null columns
+    widened to strings and dictionary indices to int32, so later chunks with
+    different null patterns or category counts still fit. ``dtypes`` casts
+    the given columns in every chunk, so their type does not depend on the
+    first chunk (e.g. a prediction column that is empty there). Use as a
+    context manager; the file is complete once it has been closed.
+    """
+
+    def __init__(self, path: Path | str, dtypes: dict | None = None):
+        self.path = Path(path)
+        self.dtypes = dtypes or {}
+        if self.path.suffix not in {".parquet", ".pq", ".csv"}:
+            raise ValueError("Only .csv or .parquet outputs are supported.")
+        self.rows_written = 0
+        self._writer = None
+        self._schema = None
+        self._started = False
+
+    def write(self, df: pd.DataFrame) -> None:
+        casts = {column: dtype for column, dtype in self.dtypes.items() if column in df.columns}
+        if casts:
+            df = df.astype(casts)
+        if self.path.suffix == ".csv":
+            df.to_csv(self.path, mode="a" if self._started else "w", header=not self._started, index=False)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(apply_schema(df.copy()), preserve_index=False)
+            if self._writer is None:
+                fields = []
+                for field in table.schema:
+                    if pa.types.is_null(field.type):
+                        field = field.with_type(pa.string())
+                    elif pa.types.is_dictionary(field.type):
+                        field = field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+                    fields.append(field)
+                self._schema = pa.schema(fields, metadata=table.schema.metadata)
+                self._writer = pq.ParquetWriter(self.path, self._schema, compression=PARQUET_COMPRESSION)
+            self._writer.write_table(table.cast(self._schema))
+        self._started = True
+        self.rows_written += len(df)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self) -> "ChunkedFrameWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -1,82 +1,265 @@
 # scripts/model/apply_relevance_model.py
-import pandas as pd
-from setfit import SetFitModel
+# Run from the repository root: python -m scripts.model.apply_relevance_model
+import argparse
+import functools
+import hashlib
+import json
 import logging
 import os
+import shutil
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from scripts.frame_io import ChunkedFrameWriter, artifact_path, find_artifact, iter_frames, read_frame, write_frame
+from scripts.model.embedding_cache import model_fingerprint
+from scripts.model.inference_pool import InferencePool
+from scripts.model.onnx_relevance import ONNX_SUBDIR
+from scripts.model.relevance_inference import (
+    BACKENDS,
+    TOKEN_BUDGET,
+    load_relevance_model,
+    open_embedding_cache,
+    predict_relevance,
+)
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # --- Configuration ---
 MODEL_LOAD_PATH = "models/relevance_setfit_model"
-DATA_PATH = "data/derived/cleaned_threaded_comments.csv"
-OUTPUT_PATH = "data/derived/comments_with_relevance.csv"
+DERIVED_DIR = "data/derived"
+OUTPUT_FORMAT = "parquet" # Set to "csv" to export CSV instead
+DATA_PATH = find_artifact(DERIVED_DIR, "cleaned_threaded_comments") # Parquet if present, else CSV
+OUTPUT_PATH = artifact_path(DERIVED_DIR, "comments_with_relevance", OUTPUT_FORMAT)
 TEXT_COLUMN = "full_text" # Column with text to predict on
 NEW_LABEL_COLUMN = "relevance" # Name for the added prediction column
+LABEL_DTYPES = {NEW_LABEL_COLUMN: "Int64"} # Output dtype of the prediction column in chunked runs
+EMBEDDING_CACHE_DIR = os.path.join(DERIVED_DIR, "embedding_cache") # Per-model body embeddings
+PROGRESS_COLS = ["chunk", "rows_in", "rows_scored", "part_file", "seconds"]
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Apply the SetFit relevance model to the cleaned comments.")
+    parser.add_argument("--cache-dir", default=EMBEDDING_CACHE_DIR,
+                        help="Embedding cache directory (vectors are keyed by text hash and model fingerprint)")
+    parser.add_argument("--no-cache", action="store_true", help="Embed every text without the embedding cache")
+    parser.add_argument("--max-tokens", type=int, default=TOKEN_BUDGET,
+                        help="Padded-token budget per length-bucketed batch (0 uses fixed-size batches)")
+    parser.add_argument("--chunk-rows", type=int, default=0,
+                        help="Score in resumable chunks of this many rows (0 scores everything at once)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Encode in this many worker processes, each holding its own copy of the model")
+    parser.add_argument("--torch-threads", type=int, default=1,
+                        help="torch intra-op threads per worker process (with --workers > 1)")
+    parser.add_argument("--backend", choices=BACKENDS, default="torch",
+                        help="Model body runtime; the onnx ones need export_relevance_model first")
+    return parser.parse_args()
+
+
+def scoring_run_id(model_dir, backend="torch"):
+    """
+    run_id for score_in_chunks: the body fingerprint plus a hash of the head
+    (model_head.pkl, or the onnx/ export for the ONNX backends). The embedding
+    cache is keyed by the body alone; chunked output must also change with a
+    retrained head, e.g. after --head-search.
+    """
+    model_dir = Path(model_dir)
+    if backend == "torch":
+        head_files = [model_dir / "model_head.pkl"]
+    else:
+        head_files = sorted((model_dir / ONNX_SUBDIR).glob("*"))
+    digest = hashlib.sha256()
+    for path in head_files:
+        if path.is_file():
+            digest.update(path.name.encode("utf-8"))
+            digest.update(path.read_bytes())
+    run_id = f"{model_fingerprint(model_dir)}-{digest.hexdigest()[:16]}"
+    return run_id if backend == "torch" else f"{run_id}-{backend}"
+
+
+def _parts_dir(out_path):
+    return f"{out_path}.parts"
+
+
+def score_in_chunks(predict, src, out_path, chunk_rows, run_id="", columns=None, dtypes=None):
+    """
+    Scores src in slices of chunk_rows rows and writes out_path, resumably.
+
+    Each scored slice is written to <out_path>.parts/part-NNNNN.<ext> and then
+    recorded in progress.csv there; a restart skips the chunks already recorded.
+    run.json pins the input (path, size, mtime), chunk_rows and run_id (e.g. the
+    model fingerprint); if any of them changed, the parts are discarded and
+    scoring starts over. Once every chunk is done, the parts are concatenated
+    into out_path and the parts directory is removed. predict maps a list of
+    texts to predictions for NEW_LABEL_COLUMN or, if columns is given, to a
+    DataFrame with those columns. dtypes fixes the output dtype of those
+    columns (default LABEL_DTYPES), so a first chunk without any text does not
+    decide it. Returns the number of rows written.
+    """
+    parts_dir = _parts_dir(out_path)
+    progress_path = os.path.join(parts_dir, "progress.csv")
+    run_path = os.path.join(parts_dir, "run.json")
+    stat = os.stat(src)
+    run = {"src": os.path.abspath(src), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+           "chunk_rows": chunk_rows, "run_id": run_id}
+
+    previous = None
+    if os.path.exists(run_path):
+        with open(run_path, encoding="utf-8") as f:
+            previous = json.load(f)
+    if os.path.isdir(parts_dir) and previous != run:
+        logging.warning(f"Input, chunk size or model changed since the last run; discarding {parts_dir}.")
+        shutil.rmtree(parts_dir)
+    if not os.path.isdir(parts_dir):
+        os.makedirs(parts_dir)
+        with open(run_path, "w", encoding="utf-8") as f:
+            json.dump(run, f)
+        pd.DataFrame(columns=PROGRESS_COLS).to_csv(progress_path, index=False)
+
+    progress = pd.read_csv(progress_path)
+    done = set(progress["chunk"])
+    if done:
+        logging.info(f"Resuming: {len(done)} chunks already scored.")
+
+    suffix = os.path.splitext(str(out_path))[1]
+    for chunk_id, chunk in enumerate(iter_frames(src, chunk_rows)):
+        if chunk_id in done:
+            continue
+        start = time.perf_counter()
+        rows_in = len(chunk)
+        chunk = chunk.dropna(subset=[TEXT_COLUMN]).copy()
+        texts = chunk[TEXT_COLUMN].astype(str).tolist()
+        if columns is None:
+            chunk[NEW_LABEL_COLUMN] = predict(texts) if len(chunk) else []
+        else:
+            scored = predict(texts) if len(chunk) else pd.DataFrame(columns=columns)
+            for column in columns:
+                chunk[column] = scored[column].to_numpy()
+
+        part_file = f"part-{chunk_id:05d}{suffix}"
+        tmp_path = os.path.join(parts_dir, f"tmp-{part_file}")
+        write_frame(chunk, tmp_path)
+        os.replace(tmp_path, os.path.join(parts_dir, part_file))
+        record = [chunk_id, rows_in, len(chunk), part_file, round(time.perf_counter() - start, 3)]
+        pd.DataFrame([record], columns=PROGRESS_COLS).to_csv(progress_path, mode="a", header=False, index=False)
+        logging.info(f"Chunk {chunk_id}: scored {len(chunk)} of {rows_in} rows in {record[-1]:.1f}s.")
+
+    progress = pd.read_csv(progress_path).sort_values("chunk")
+    if dtypes is None:
+        dtypes = LABEL_DTYPES if columns is None else {}
+    with ChunkedFrameWriter(out_path, dtypes=dtypes) as writer:
+        for part_file in progress["part_file"]:
+            writer.write(read_frame(os.path.join(parts_dir, part_file)))
+    shutil.rmtree(parts_dir)
+    return writer.rows_written
+
+
+def _print_summary(n_predictions):
+    print(f"\n--- Prediction Summary ---")
+    print(f"Model used: {MODEL_LOAD_PATH}")
+    print(f"Input data: {DATA_PATH}")
+    print(f"Number of predictions: {n_predictions}")
+    print(f"Output saved to: {OUTPUT_PATH}")
+    print("------------------------")
+
+
+def main():
+    args = _parse_args()
+
+    # --- Load Model ---
+    logging.info(f"Loading model from {MODEL_LOAD_PATH} ({args.backend} backend)")
+    try:
+        model = load_relevance_model(MODEL_LOAD_PATH, args.backend)
+        logging.info("Model loaded successfully.")
+    except Exception as e:
+        logging.error(f"Error loading model from {MODEL_LOAD_PATH}: {e}")
+        exit()
+
+    cache = None if args.no_cache else open_embedding_cache(args.cache_dir, MODEL_LOAD_PATH, args.backend)
+    pool = None
+    if args.workers > 1:
+        logging.info(f"Starting {args.workers} inference workers with {args.torch_threads} torch threads each.")
+        pool = InferencePool(MODEL_LOAD_PATH, args.workers, args.torch_threads, max_tokens=args.max_tokens,
+                             loader=functools.partial(load_relevance_model, backend=args.backend))
+
+    def predict(texts):
+        return predict_relevance(model, texts, cache=cache, max_tokens=args.max_tokens, pool=pool)
+
+    try:
+        _score(args, predict)
+    finally:
+        if pool is not None:
+            pool.close()
+    if cache is not None:
+        logging.info(f"Embedding cache: {cache.stats()}")
+
+
+def _score(args, predict):
+    """Loads the data, applies predict (list of texts -> labels) and saves the output."""
+    if args.chunk_rows > 0:
+        os.makedirs(os.path.dirname(OUTPUT_PATH), exist_ok=True)
+        logging.info(f"Scoring {DATA_PATH} in chunks of {args.chunk_rows} rows...")
+        run_id = scoring_run_id(MODEL_LOAD_PATH, args.backend)
+        n_rows = score_in_chunks(predict, DATA_PATH, OUTPUT_PATH, args.chunk_rows, run_id=run_id)
+        _print_summary(n_rows)
+        return
+
+    # --- Load Data ---
+    logging.info(f"Loading data for prediction from {DATA_PATH}")
+    try:
+        df = read_frame(DATA_PATH)
+        logging.info(f"Loaded {len(df)} rows for prediction.")
+    except FileNotFoundError:
+        logging.error(f"Error: Data file not found at {DATA_PATH}")
+        exit()
+    except Exception as e:
+        logging.error(f"Error loading data: {e}")
+        exit()
+
+    # --- Validate Data ---
+    if TEXT_COLUMN not in df.columns:
+        logging.error(f"Error: Text column '{TEXT_COLUMN}' not found in {DATA_PATH}. Available columns: {df.columns.tolist()}")
+        exit()
+
+    # Handle potential NaN values in the text column
+    df.dropna(subset=[TEXT_COLUMN], inplace=True)
+    logging.info(f"{len(df)} rows remaining after removing NaNs in '{TEXT_COLUMN}'.")
+
+    if len(df) == 0:
+        logging.error("No data remaining after handling NaNs. Exiting.")
+        exit()
+
+    # --- Predict ---
+    logging.info("Predicting relevance on the dataset...")
+    texts_to_predict = df[TEXT_COLUMN].astype(str).tolist()
+    start = time.perf_counter()
+    try:
+        predictions = predict(texts_to_predict)
+        logging.info(f"Prediction finished in {time.perf_counter() - start:.1f}s.")
+    except Exception as e:
+        logging.error(f"Error during prediction: {e}")
+        exit()
+
+    # --- Add Predictions and Save ---
+    df[NEW_LABEL_COLUMN] = predictions
+    logging.info(f"Added predictions to column '{NEW_LABEL_COLUMN}'.")
+
+    # Ensure output directory exists
+    output_dir = os.path.dirname(OUTPUT_PATH)
+    os.makedirs(output_dir, exist_ok=True)
+
+    logging.info(f"Saving predictions to {OUTPUT_PATH}")
+    try:
+        write_frame(df, OUTPUT_PATH)
+        logging.info("Predictions saved successfully.")
+    except Exception as e:
+        logging.error(f"Error saving predictions to {OUTPUT_PATH}: {e}")
+        exit()
+
+    _print_summary(len(df))
+
 
-# --- Load Model ---
-logging.info(f"Loading model from {MODEL_LOAD_PATH}")
-try:
-    model = SetFitModel.from_pretrained(MODEL_LOAD_PATH)
-    logging.info("Model loaded successfully.")
-except Exception as e:
-    logging.error(f"Error loading model from {MODEL_LOAD_PATH}: {e}")
-    exit()
-
-# --- Load Data ---
-logging.info(f"Loading data for prediction from {DATA_PATH}")
-try:
-    df = pd.read_csv(DATA_PATH)
-    logging.info(f"Loaded {len(df)} rows for prediction.")
-except FileNotFoundError:
-    logging.error(f"Error: Data file not found at {DATA_PATH}")
-    exit()
-except Exception as e:
-    logging.error(f"Error loading data: {e}")
-    exit()
-
-# --- Validate Data ---
-if TEXT_COLUMN not in df.columns:
-    logging.error(f"Error: Text column '{TEXT_COLUMN}' not found in {DATA_PATH}. Available columns: {df.columns.tolist()}")
-    exit()
-
-# Handle potential NaN values in the text column
-df.dropna(subset=[TEXT_COLUMN], inplace=True)
-logging.info(f"{len(df)} rows remaining after removing NaNs in '{TEXT_COLUMN}'.")
-
-if len(df) == 0:
-    logging.error("No data remaining after handling NaNs. Exiting.")
-    exit()
-
-# --- Predict ---
-logging.info("Predicting relevance on the dataset...")
-texts_to_predict = df[TEXT_COLUMN].astype(str).tolist()
-try:
-    predictions = model.predict(texts_to_predict)
-    logging.info("Prediction finished.")
-except Exception as e:
-    logging.error(f"Error during prediction: {e}")
-    exit()
-
-# --- Add Predictions and Save ---
-df[NEW_LABEL_COLUMN] = predictions
-logging.info(f"Added predictions to column '{NEW_LABEL_COLUMN}'.")
-
-# Ensure output directory exists
-output_dir = os.path.dirname(OUTPUT_PATH)
-os.makedirs(output_dir, exist_ok=True)
-
-logging.info(f"Saving predictions to {OUTPUT_PATH}")
-try:
-    df.to_csv(OUTPUT_PATH, index=False)
-    logging.info("Predictions saved successfully.")
-except Exception as e:
-    logging.error(f"Error saving predictions to {OUTPUT_PATH}: {e}")
-    exit()
-
-print(f"\n--- Prediction Summary ---")
-print(f"Model used: {MODEL_LOAD_PATH}")
-print(f"Input data: {DATA_PATH}")
-print(f"Number of predictions: {len(df)}")
-print(f"Output saved to: {OUTPUT_PATH}")
-print("------------------------") 
\ No newline at end of file
+if __name__ == "__main__":
+    main()
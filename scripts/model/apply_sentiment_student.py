@@ -0,0 +1,120 @@
+# scripts/model/apply_sentiment_student.py
+# Run from the repository root: python -m scripts.model.apply_sentiment_student
+"""Scores stance and purchase intention with the distilled student (distill_sentiment_model.py).
+
+Comments are embedded by the student's body, through the shared embedding
+cache, bucketing and worker pool of apply_relevance_model.py. The two NumPy
+heads then run on the vectors. Adds student_pred_stance_label /
+student_pred_pi_label (-1/0/1, like the gpt4o_pred_* columns) and their
+probabilities (*_conf).
+"""
+import argparse
+import functools
+import logging
+import os
+
+from scripts.frame_io import artifact_path, find_artifact, read_frame, write_frame
+from scripts.model.apply_relevance_model import TEXT_COLUMN, score_in_chunks
+from scripts.model.distill_sentiment_model import AXES, STUDENT_DIR, STUDENT_PREFIX, SentimentStudent
+from scripts.model.embedding_cache import model_fingerprint
+from scripts.model.inference_pool import InferencePool
+from scripts.model.relevance_inference import (
+    BACKENDS,
+    TOKEN_BUDGET,
+    embed_with_cache,
+    load_relevance_model,
+    open_embedding_cache,
+)
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Configuration ---
+DERIVED_DIR = "data/derived"
+OUTPUT_FORMAT = "parquet" # Set to "csv" to export CSV instead
+DATA_PATH = find_artifact(DERIVED_DIR, "comments_with_relevance") # Parquet if present, else CSV
+OUTPUT_PATH = artifact_path(DERIVED_DIR, "comments_with_student_sentiment", OUTPUT_FORMAT)
+EMBEDDING_CACHE_DIR = os.path.join(DERIVED_DIR, "embedding_cache")
+PRED_COLS = [f"{STUDENT_PREFIX}_pred_{axis}_{kind}" for axis in AXES for kind in ("label", "conf")]
+PRED_DTYPES = {column: "Int64" if column.endswith("_label") else "float64" for column in PRED_COLS}
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Apply the distilled stance/PI student to comments.")
+    parser.add_argument("--student-dir", default=STUDENT_DIR)
+    parser.add_argument("--input", default=DATA_PATH)
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    parser.add_argument("--cache-dir", default=EMBEDDING_CACHE_DIR,
+                        help="Embedding cache directory (shared with apply_relevance_model for the same body)")
+    parser.add_argument("--no-cache", action="store_true", help="Embed every text without the embedding cache")
+    parser.add_argument("--max-tokens", type=int, default=TOKEN_BUDGET,
+                        help="Padded-token budget per length-bucketed batch (0 uses fixed-size batches)")
+    parser.add_argument("--chunk-rows", type=int, default=0,
+                        help="Score in resumable chunks of this many rows (0 scores everything at once)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Encode in this many worker processes, each holding its own copy of the body")
+    parser.add_argument("--torch-threads", type=int, default=1,
+                        help="torch intra-op threads per worker process (with --workers > 1)")
+    parser.add_argument("--backend", choices=BACKENDS, default="torch",
+                        help="Body runtime; the onnx ones need export_relevance_model first")
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_args()
+    student = SentimentStudent.load(args.student_dir)
+    body_dir = student.meta["body_dir"]
+    if model_fingerprint(body_dir) != student.meta.get("body_fingerprint"):
+        logging.warning(f"The body in {body_dir} changed since the student was distilled; re-run "
+                        "distill_sentiment_model for predictions that match its report.")
+    if args.backend != student.meta.get("backend", "torch"):
+        logging.warning(f"Scoring with the {args.backend} body; the heads were fit on "
+                        f"{student.meta.get('backend', 'torch')} embeddings.")
+
+    logging.info(f"Loading body from {body_dir} ({args.backend} backend)")
+    model = load_relevance_model(body_dir, args.backend)
+    cache = None if args.no_cache else open_embedding_cache(args.cache_dir, body_dir, args.backend)
+    pool = None
+    if args.workers > 1:
+        logging.info(f"Starting {args.workers} inference workers with {args.torch_threads} torch threads each.")
+        pool = InferencePool(body_dir, args.workers, args.torch_threads, max_tokens=args.max_tokens,
+                             loader=functools.partial(load_relevance_model, backend=args.backend))
+
+    def predict(texts):
+        return student.predict_frame(embed_with_cache(model, texts, cache=cache, max_tokens=args.max_tokens,
+                                                      pool=pool))
+
+    try:
+        n_rows = _score(args, predict)
+    finally:
+        if pool is not None:
+            pool.close()
+    if cache is not None:
+        logging.info(f"Embedding cache: {cache.stats()}")
+
+    print("\n--- Student Prediction Summary ---")
+    print(f"Student: {args.student_dir} (teachers: {', '.join(student.meta.get('teachers', []))})")
+    print(f"Input data: {args.input}")
+    print(f"Number of predictions: {n_rows}")
+    print(f"Output saved to: {args.output}")
+
+
+def _score(args, predict):
+    """Scores args.input (chunked and resumable with --chunk-rows) and returns the number of rows written."""
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    if args.chunk_rows > 0:
+        run_id = f"{model_fingerprint(args.student_dir)}-{args.backend}"
+        return score_in_chunks(predict, args.input, args.output, args.chunk_rows, run_id=run_id, columns=PRED_COLS,
+                               dtypes=PRED_DTYPES)
+
+    df = read_frame(args.input).dropna(subset=[TEXT_COLUMN])
+    logging.info(f"Scoring {len(df)} comments from {args.input}")
+    scored = predict(df[TEXT_COLUMN].astype(str).tolist())
+    for column in PRED_COLS:
+        df[column] = scored[column].to_numpy()
+    write_frame(df, args.output)
+    return len(df)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""bench_inference_pool.py
+
+Scaling benchmark for relevance-model inference on CPU: times the body
+encoder over every (workers, torch threads) combination and prints
+comments/sec, so the throughput sweet spot for a machine can be read off
+the table. ``workers=1`` runs in-process (no pool) as the baseline.
+
+Texts come from the cleaned comments (``full_text``), sampled to ``--n``.
+The embedding cache is not used, so every run encodes every text.
+
+Usage
+-----
+python -m scripts.model.bench_inference_pool [--n 5000] [--workers 1 2 4 8] [--threads 1 2 4]
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import time
+
+from scripts.frame_io import find_artifact, read_frame
+from scripts.model.inference_pool import InferencePool
+from scripts.model.relevance_inference import TOKEN_BUDGET, encode_bucketed, load_relevance_model
+
+MODEL_DIR = "models/relevance_setfit_model"
+DATA_PATH = find_artifact("data/derived", "cleaned_threaded_comments")
+
+
+def _parse_args() -> argparse.Namespace:
+    ap = argparse.ArgumentParser(description="Benchmark relevance inference across worker/thread counts.")
+    ap.add_argument("--n", type=int, default=5000, help="Number of comments to encode per configuration")
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="Worker process counts")
+    ap.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4], help="torch threads per worker")
+    ap.add_argument("--max-tokens", type=int, default=TOKEN_BUDGET, help="Padded-token budget per batch")
+    ap.add_argument("--seed", type=int, default=0)
+    return ap.parse_args()
+
+
+def _time_in_process(texts: list[str], threads: int, max_tokens: int) -> float:
+    import torch
+
+    torch.set_num_threads(threads)
+    model = load_relevance_model(MODEL_DIR)
+    start = time.perf_counter()
+    encode_bucketed(model, texts, max_tokens)
+    return time.perf_counter() - start
+
+
+def _time_pool(texts: list[str], workers: int, threads: int, max_tokens: int) -> float:
+    with InferencePool(MODEL_DIR, workers, threads, max_tokens=max_tokens) as pool:
+        pool.encode(texts[: pool.shard_size * workers]) # warm-up: model load happens in the initializer
+        start = time.perf_counter()
+        pool.encode(texts)
+        return time.perf_counter() - start
+
+
+def main() -> None:
+    args = _parse_args()
+    df = read_frame(DATA_PATH, columns=["full_text"]).dropna()
+    texts = df["full_text"].sample(min(args.n, len(df)), random_state=args.seed).astype(str).tolist()
+    print(f"{len(texts)} comments from {DATA_PATH}; {os.cpu_count()} CPUs")
+
+    logging.getLogger().setLevel(logging.WARNING)
+    print(f"{'workers':>8} {'threads':>8} {'cores':>6} {'seconds':>9} {'comments/s':>11}")
+    for workers in args.workers:
+        for threads in args.threads:
+            if workers == 1:
+                elapsed = _time_in_process(texts, threads, args.max_tokens)
+            else:
+                elapsed = _time_pool(texts, workers, threads, args.max_tokens)
+            print(f"{workers:>8} {threads:>8} {workers * threads:>6} {elapsed:>9.2f} {len(texts) / elapsed:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""cv_relevance_model.py
+
+Cross-validated, multi-seed evaluation of the SetFit relevance model.
+
+Every (seed, fold) pair of a stratified k-fold split of the annotation set is
+trained and scored with the same setup as train_relevance_model.py. The runs
+are independent, so they go to a pool of worker processes, each capped at
+``--threads`` torch threads. That keeps ``workers × threads`` within the core
+count instead of every run fighting over all cores. The annotation set is
+converted to a Hugging Face Dataset once and saved to disk (keyed by a hash of
+the CSV). Workers memory-map it and select their fold's rows instead of each
+re-reading the CSV and rebuilding the dataset. SetFit tokenizes the contrastive
+pairs it generates inside training, so there are no fold-independent token ids
+to share.
+
+Per-fold metrics from compute_metrics go to data/derived/relevance_cv_folds.csv.
+The summary reports, per metric, the mean and a 95% t-interval over all runs.
+Folds share training data, so the interval is an approximation that is
+somewhat too narrow.
+
+Usage
+-----
+python -m scripts.model.cv_relevance_model [--folds 5] [--seeds 42 43 44] [--workers 4] [--threads 2]
+                                           [--head-params '{"C": 1.0}']
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from sklearn.model_selection import StratifiedKFold
+
+from scripts.model.train_relevance_model import (
+    BASE_MODEL_ID,
+    BATCH_SIZE,
+    DATA_PATH,
+    LEARNING_RATE,
+    NUM_EPOCHS_BODY,
+    NUM_EPOCHS_HEAD,
+    compute_metrics,
+    load_annotations,
+)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+CV_FOLDS = 5
+SEEDS = [42, 43, 44]
+DATASET_CACHE_DIR = "data/derived/cv_cache"
+FOLDS_PATH = "data/derived/relevance_cv_folds.csv"
+CONFIDENCE = 0.95
+
+
+def make_tasks(labels, folds=CV_FOLDS, seeds=SEEDS):
+    """(seed, fold, train positions, test positions) for a stratified k-fold split per seed."""
+    labels = np.asarray(labels)
+    tasks = []
+    for seed in seeds:
+        splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed)
+        for fold, (train_idx, test_idx) in enumerate(splitter.split(np.zeros(len(labels)), labels)):
+            tasks.append((seed, fold, train_idx, test_idx))
+    return tasks
+
+
+def summarize_metrics(results, confidence=CONFIDENCE):
+    """Mean, std and t-interval bounds of every metric column over the runs in results."""
+    metrics = results.drop(columns=["seed", "fold", "seconds"], errors="ignore")
+    n = len(metrics)
+    mean, std = metrics.mean(), metrics.std(ddof=1)
+    half = stats.t.ppf((1 + confidence) / 2, n - 1) * std / np.sqrt(n) if n > 1 else std * np.nan
+    return pd.DataFrame({"mean": mean, "std": std, "ci_low": mean - half, "ci_high": mean + half, "runs": n})
+
+
+def cache_dataset(df, cache_dir=DATASET_CACHE_DIR):
+    """Saves the annotations as a Hugging Face Dataset (once per content hash) and returns its path."""
+    from datasets import Dataset
+
+    digest = hashlib.sha256(pd.util.hash_pandas_object(df, index=False).values.tobytes()).hexdigest()[:16]
+    path = os.path.join(cache_dir, f"annotations-{digest}")
+    if not os.path.isdir(path):
+        Dataset.from_pandas(df, preserve_index=False).save_to_disk(path)
+        logging.info(f"Cached annotation dataset at {path}")
+    return path
+
+
+def _init_worker(threads):
+    # Must be set before torch creates its thread pools
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false" # the tokenizer's own pool would oversubscribe the cores
+    try:
+        import torch
+
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def train_fold(dataset_path, seed, fold, train_idx, test_idx, head_params):
+    """Trains SetFit on the train rows of the cached dataset and returns compute_metrics on the test rows."""
+    from datasets import load_from_disk
+    from setfit import SetFitModel, SetFitTrainer
+
+    dataset = load_from_disk(dataset_path)
+    train_dataset, test_dataset = dataset.select(train_idx), dataset.select(test_idx)
+    model = SetFitModel.from_pretrained(BASE_MODEL_ID, head_params=head_params)
+    trainer = SetFitTrainer(model=model, batch_size=BATCH_SIZE, train_dataset=train_dataset, seed=seed)
+    trainer.train(num_epochs=NUM_EPOCHS_BODY, learning_rate=LEARNING_RATE, num_epochs_classification_head=NUM_EPOCHS_HEAD)
+    y_pred = trainer.model.predict(test_dataset["text"])
+    return compute_metrics(np.asarray(y_pred), test_dataset["label"])
+
+
+def _timed(train, *args):
+    start = time.perf_counter()
+    metrics = train(*args)
+    return metrics, time.perf_counter() - start
+
+
+def run_cv(tasks, dataset_path, workers, threads, head_params=None, train=train_fold):
+    """
+    Runs train(dataset_path, seed, fold, train_idx, test_idx, head_params) for
+    every task in a spawn-context process pool. ``train`` must be a module-level
+    function. Returns one row per run, sorted by seed and fold.
+    """
+    rows = []
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=_init_worker, initargs=(threads,))
+    with pool:
+        futures = {
+            pool.submit(_timed, train, dataset_path, seed, fold, train_idx, test_idx, head_params or {}): (seed, fold)
+            for seed, fold, train_idx, test_idx in tasks
+        }
+        for future in as_completed(futures):
+            seed, fold = futures[future]
+            metrics, seconds = future.result()
+            rows.append({"seed": seed, "fold": fold, **metrics, "seconds": seconds})
+            logging.info(f"Seed {seed} fold {fold}: {metrics} ({len(rows)}/{len(futures)} runs done)")
+    return pd.DataFrame(rows).sort_values(["seed", "fold"]).reset_index(drop=True)
+
+
+def _parse_args() -> argparse.Namespace:
+    ap = argparse.ArgumentParser(description="Parallel k-fold × multi-seed evaluation of the relevance model.")
+    ap.add_argument("--folds", type=int, default=CV_FOLDS)
+    ap.add_argument("--seeds", type=int, nargs="+", default=SEEDS)
+    ap.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                    help="Runs trained at once, one process each")
+    ap.add_argument("--threads", type=int, default=2, help="torch threads per worker process")
+    ap.add_argument("--head-params", type=json.loads, default={},
+                    help="JSON LogisticRegression parameters for the head, e.g. from --head-search")
+    return ap.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    df = load_annotations(DATA_PATH)
+    tasks = make_tasks(df["label"], args.folds, args.seeds)
+    logging.info(f"{len(tasks)} runs ({args.folds} folds × {len(args.seeds)} seeds) on {len(df)} annotations, "
+                 f"{args.workers} workers × {args.threads} threads.")
+    dataset_path = cache_dataset(df)
+
+    start = time.perf_counter()
+    results = run_cv(tasks, dataset_path, args.workers, args.threads, args.head_params)
+    elapsed = time.perf_counter() - start
+    os.makedirs(os.path.dirname(FOLDS_PATH), exist_ok=True)
+    results.to_csv(FOLDS_PATH, index=False)
+
+    print(f"\n--- Cross-Validation Summary ({len(results)} runs, {elapsed / 60:.1f} min) ---")
+    print(summarize_metrics(results).to_string(float_format="{:.4f}".format))
+    print(f"Per-run metrics saved to: {FOLDS_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""distill_sentiment_model.py
+
+Distills teacher stance and purchase-intention labels into a small CPU student.
+
+The student is multi-headed. It has one shared sentence-embedding body, by
+default the MiniLM body of models/relevance_setfit_model, and one softmax head
+per axis (stance, purchase intention). Each head is a multinomial logistic
+regression trained with cross-entropy against the teacher's soft labels.
+
+A teacher is a column prefix in the input frame, e.g. ``gpt4o`` for the
+columns written by llm_labeling.py. Per axis, a teacher provides either:
+  * per-class probabilities ``<prefix>_<axis>_prob_<name>``, e.g.
+    deberta_stance_prob_anti from a DeBERTa softmax. These are used as they are.
+  * hard labels ``<prefix>_pred_<axis>_label``. These become one-hot targets
+    with ``--smoothing`` label smoothing. Rows whose ``<prefix>_pred_<axis>_str``
+    is not a valid label (api_error, parse_error) are dropped.
+With several teachers, a row's target is the mean of their distributions.
+
+The body stays frozen. Texts are embedded through the same embedding cache as
+apply_relevance_model.py, so comments it has already scored cost nothing to
+embed again. Training only fits the two heads.
+
+Agreement with the teacher is measured on a held-out split: accuracy against
+the teacher's top label, Cohen's kappa and macro F1. Where the input also
+carries the human dev-set labels, student and teacher are both scored against
+them. The shipped heads are then refit on every labeled row.
+
+Output: <student dir>/stance_head.npz, pi_head.npz (NumpyHead format) and
+student.json (teachers, body fingerprint, settings and the agreement report).
+Score new comments with apply_sentiment_student.py.
+
+Usage
+-----
+python -m scripts.model.distill_sentiment_model [--input data/derived/comments_with_sentiment.csv]
+                                                [--teachers gpt4o] [--smoothing 0.1] [--l2 1e-4]
+                                                [--workers 4 --torch-threads 2] [--backend onnx]
+"""
+
+from __future__ import annotations
+
+import argparse
+import functools
+import json
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize
+from sklearn.metrics import accuracy_score, cohen_kappa_score, f1_score
+from sklearn.model_selection import train_test_split
+
+from scripts.frame_io import read_frame
+from scripts.model.embedding_cache import model_fingerprint
+from scripts.model.inference_pool import InferencePool
+from scripts.model.llm_labeling import OUTPUT_PATH as TEACHER_PATH, PI_MAP, STANCE_MAP
+from scripts.model.onnx_relevance import NumpyHead
+from scripts.model.relevance_inference import (
+    BACKENDS,
+    TOKEN_BUDGET,
+    embed_with_cache,
+    load_relevance_model,
+    open_embedding_cache,
+)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Configuration ---
+BODY_DIR = "models/relevance_setfit_model"
+STUDENT_DIR = "models/sentiment_student_model"
+EMBEDDING_CACHE_DIR = "data/derived/embedding_cache"
+TEXT_COLUMN = "full_text"
+TEACHERS = ["gpt4o"]
+AXES = {"stance": STANCE_MAP, "pi": PI_MAP}
+CLASSES = np.array([-1, 0, 1])
+GOLD_COLUMNS = {"stance": "stance_dei_label", "pi": "purchase_intention_label"} # human dev-set labels
+LABEL_SMOOTHING = 0.1
+L2 = 1e-4 # L2 penalty on the head weights, relative to the mean cross-entropy
+MAX_ITER = 500
+HOLDOUT_SIZE = 0.2
+RANDOM_STATE = 42
+STUDENT_PREFIX = "student"
+STUDENT_META = "student.json"
+
+
+def smoothed_one_hot(labels, smoothing=LABEL_SMOOTHING, classes=CLASSES):
+    """(n, k) targets: 1 - smoothing + smoothing / k on the label's class, smoothing / k elsewhere."""
+    idx = np.searchsorted(classes, np.asarray(labels))
+    targets = np.full((len(idx), len(classes)), smoothing / len(classes))
+    targets[np.arange(len(idx)), idx] += 1.0 - smoothing
+    return targets
+
+
+def teacher_targets(df, teacher, axis, smoothing=LABEL_SMOOTHING):
+    """
+    Soft targets (n, 3) from one teacher for one axis, and a mask of the rows
+    where the teacher gave a valid answer (see the module docstring).
+    """
+    names = AXES[axis]
+    prob_cols = [f"{teacher}_{axis}_prob_{names[c]}" for c in CLASSES]
+    if all(col in df.columns for col in prob_cols):
+        probs = df[prob_cols].to_numpy(dtype=np.float64)
+        valid = np.isfinite(probs).all(axis=1) & (probs.sum(axis=1) > 0)
+        targets = np.zeros_like(probs)
+        targets[valid] = probs[valid] / probs[valid].sum(axis=1, keepdims=True)
+        return targets, valid
+
+    label_col, str_col = f"{teacher}_pred_{axis}_label", f"{teacher}_pred_{axis}_str"
+    if label_col not in df.columns:
+        raise KeyError(f"Teacher {teacher!r} has neither {label_col} nor {prob_cols} columns")
+    labels = pd.to_numeric(df[label_col], errors="coerce")
+    valid = labels.isin(CLASSES).to_numpy()
+    if str_col in df.columns:
+        valid &= df[str_col].isin(names.values()).to_numpy()
+    targets = np.zeros((len(df), len(CLASSES)))
+    targets[valid] = smoothed_one_hot(labels[valid].astype(int), smoothing)
+    return targets, valid
+
+
+def ensemble_targets(df, teachers, axis, smoothing=LABEL_SMOOTHING):
+    """Mean of the teachers' soft targets; a row is kept only where every teacher is valid."""
+    targets, valid = np.zeros((len(df), len(CLASSES))), np.ones(len(df), dtype=bool)
+    for teacher in teachers:
+        t, v = teacher_targets(df, teacher, axis, smoothing)
+        targets += t
+        valid &= v
+    return targets / len(teachers), valid
+
+
+def fit_soft_head(X, targets, l2=L2, max_iter=MAX_ITER, classes=CLASSES):
+    """
+    Multinomial logistic regression minimizing the mean cross-entropy against
+    soft targets, plus 0.5 * l2 * ||W||² (the intercepts are not penalized).
+    Fitted with L-BFGS and returned as a NumpyHead.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    targets = np.asarray(targets, dtype=np.float64)
+    n, dim = X.shape
+    k = targets.shape[1]
+
+    def loss_and_grad(theta):
+        W, b = theta[:dim * k].reshape(dim, k), theta[dim * k:]
+        scores = X @ W + b
+        scores -= scores.max(axis=1, keepdims=True)
+        log_p = scores - np.log(np.exp(scores).sum(axis=1, keepdims=True))
+        loss = -(targets * log_p).sum() / n + 0.5 * l2 * (W ** 2).sum()
+        diff = (np.exp(log_p) - targets) / n
+        return loss, np.concatenate([(X.T @ diff + l2 * W).ravel(), diff.sum(axis=0)])
+
+    result = minimize(loss_and_grad, np.zeros(dim * k + k), jac=True, method="L-BFGS-B",
+                      options={"maxiter": max_iter})
+    if not result.success:
+        logging.warning(f"Head fit stopped before converging: {result.message}")
+    W, b = result.x[:dim * k].reshape(dim, k), result.x[dim * k:]
+    return NumpyHead(W.T, b, classes)
+
+
+def teacher_agreement(y_student, y_teacher):
+    """Agreement of student with teacher labels: accuracy, Cohen's kappa and macro F1 (teacher as reference)."""
+    return {
+        "agreement": float(accuracy_score(y_teacher, y_student)),
+        "kappa": float(cohen_kappa_score(y_teacher, y_student)),
+        "macro_f1": float(f1_score(y_teacher, y_student, labels=CLASSES, average="macro", zero_division=0)),
+    }
+
+
+class SentimentStudent:
+    """Stance and purchase-intention heads over one shared sentence-embedding body."""
+
+    def __init__(self, heads, meta=None):
+        self.heads = heads
+        self.meta = meta or {}
+
+    @classmethod
+    def load(cls, student_dir):
+        student_dir = Path(student_dir)
+        with open(student_dir / STUDENT_META, encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls({axis: NumpyHead.load(student_dir / f"{axis}_head.npz") for axis in AXES}, meta)
+
+    def save(self, student_dir):
+        student_dir = Path(student_dir)
+        student_dir.mkdir(parents=True, exist_ok=True)
+        for axis, head in self.heads.items():
+            head.save(student_dir / f"{axis}_head.npz")
+        with open(student_dir / STUDENT_META, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, indent=2)
+
+    def predict_frame(self, embeddings):
+        """Per axis, student_pred_<axis>_label (-1/0/1) and student_pred_<axis>_conf (its probability)."""
+        out = {}
+        for axis, head in self.heads.items():
+            proba = head.predict_proba(embeddings)
+            out[f"{STUDENT_PREFIX}_pred_{axis}_label"] = head.classes_[proba.argmax(axis=1)]
+            out[f"{STUDENT_PREFIX}_pred_{axis}_conf"] = proba.max(axis=1)
+        return pd.DataFrame(out)
+
+
+def train_student(X, df, teachers=TEACHERS, smoothing=LABEL_SMOOTHING, l2=L2,
+                  holdout_size=HOLDOUT_SIZE, random_state=RANDOM_STATE):
+    """
+    Fits both heads on the training split, reports agreement on the held-out
+    split, then refits on every labeled row. X holds the body embeddings of
+    df's rows. Returns (SentimentStudent, report DataFrame with one row per axis).
+    """
+    positions = np.arange(len(df))
+    train_pos, test_pos = train_test_split(positions, test_size=holdout_size, random_state=random_state)
+    in_test = np.isin(positions, test_pos)
+    heads, rows = {}, []
+    for axis in AXES:
+        targets, valid = ensemble_targets(df, teachers, axis, smoothing)
+        train, test = valid & ~in_test, valid & in_test
+        head = fit_soft_head(X[train], targets[train], l2)
+        y_student = head.predict(X[test])
+        y_teacher = CLASSES[targets[test].argmax(axis=1)]
+        row = {"axis": axis, "n_train": int(train.sum()), "n_holdout": int(test.sum()),
+               **teacher_agreement(y_student, y_teacher)}
+
+        gold_col = GOLD_COLUMNS[axis]
+        if gold_col in df.columns:
+            gold = pd.to_numeric(df[gold_col], errors="coerce").to_numpy()
+            has_gold = np.isfinite(gold[test])
+            if has_gold.any():
+                y_gold = gold[test][has_gold].astype(int)
+                row["n_gold"] = int(has_gold.sum())
+                row["student_gold_macro_f1"] = float(f1_score(y_gold, y_student[has_gold], average="macro",
+                                                              zero_division=0))
+                row["teacher_gold_macro_f1"] = float(f1_score(y_gold, y_teacher[has_gold], average="macro",
+                                                              zero_division=0))
+        rows.append(row)
+        heads[axis] = fit_soft_head(X[valid], targets[valid], l2)
+    return SentimentStudent(heads), pd.DataFrame(rows)
+
+
+def _parse_args() -> argparse.Namespace:
+    ap = argparse.ArgumentParser(description="Distill teacher stance/PI labels into a CPU student model.")
+    ap.add_argument("--input", default=TEACHER_PATH, help="Comments with teacher label or probability columns")
+    ap.add_argument("--teachers", nargs="+", default=TEACHERS, help="Teacher column prefixes, e.g. gpt4o deberta")
+    ap.add_argument("--text-column", default=TEXT_COLUMN)
+    ap.add_argument("--body-dir", default=BODY_DIR, help="Saved SetFit model whose body embeds the comments")
+    ap.add_argument("--output-dir", default=STUDENT_DIR)
+    ap.add_argument("--smoothing", type=float, default=LABEL_SMOOTHING, help="Label smoothing for hard teacher labels")
+    ap.add_argument("--l2", type=float, default=L2)
+    ap.add_argument("--holdout", type=float, default=HOLDOUT_SIZE, help="Fraction held out to measure agreement")
+    ap.add_argument("--cache-dir", default=EMBEDDING_CACHE_DIR)
+    ap.add_argument("--no-cache", action="store_true", help="Embed every text without the embedding cache")
+    ap.add_argument("--max-tokens", type=int, default=TOKEN_BUDGET)
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--torch-threads", type=int, default=1)
+    ap.add_argument("--backend", choices=BACKENDS, default="torch")
+    return ap.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    df = read_frame(args.input).dropna(subset=[args.text_column]).reset_index(drop=True)
+    logging.info(f"Loaded {len(df)} comments with teacher labels from {args.input}")
+
+    model = load_relevance_model(args.body_dir, args.backend)
+    cache = None if args.no_cache else open_embedding_cache(args.cache_dir, args.body_dir, args.backend)
+    pool = None
+    if args.workers > 1:
+        pool = InferencePool(args.body_dir, args.workers, args.torch_threads, max_tokens=args.max_tokens,
+                             loader=functools.partial(load_relevance_model, backend=args.backend))
+    try:
+        X = embed_with_cache(model, df[args.text_column].astype(str).tolist(), cache=cache,
+                             max_tokens=args.max_tokens, pool=pool)
+    finally:
+        if pool is not None:
+            pool.close()
+
+    student, report = train_student(X, df, args.teachers, args.smoothing, args.l2, args.holdout)
+    student.meta = {
+        "teachers": args.teachers,
+        "body_dir": args.body_dir,
+        "body_fingerprint": model_fingerprint(args.body_dir),
+        "backend": args.backend,
+        "smoothing": args.smoothing,
+        "l2": args.l2,
+        "n_comments": len(df),
+        "report": report.to_dict(orient="records"),
+    }
+    student.save(args.output_dir)
+
+    print(f"\n--- Distillation Report (held-out agreement with {', '.join(args.teachers)}) ---")
+    print(report.to_string(index=False, float_format="{:.4f}".format))
+    print(f"Student saved to: {os.path.abspath(args.output_dir)}")
+
+
+if __name__ == "__main__":
+    main()
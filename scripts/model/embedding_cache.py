@@ -0,0 +1,156 @@
+# scripts/model/embedding_cache.py
+"""Persistent, memory-mapped cache of sentence embeddings keyed by text hash.
+
+Each model gets its own namespace directory, named by ``model_fingerprint``
+(a hash of the sentence-transformer body files), so a retrained body never
+serves stale vectors while a retrained ``model_head.pkl`` keeps the cache.
+Inside a namespace, vectors are stored in append-only segments:
+
+    <root>/<fingerprint>/keys-00000.npy     (n,) S32 hex blake2b of the normalized text
+    <root>/<fingerprint>/vectors-00000.npy  (n, dim) float32, opened with mmap_mode="r"
+
+A segment's keys file is written last, so an interrupted write leaves an
+orphan vectors file that is ignored (and overwritten) on the next run.
+"""
+
+import hashlib
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+MAX_SEGMENTS = 32 # compact into one segment beyond this many
+FINGERPRINT_EXCLUDE = {"model_head.pkl", "README.md"} # not part of the embedding body
+FINGERPRINT_EXCLUDE_DIRS = {"onnx"} # exports derived from the body (export_relevance_model)
+
+
+def normalize_text(text):
+    """Whitespace-normalized text; the WordPiece tokenizer splits on whitespace, so embeddings are unchanged."""
+    return " ".join(str(text).split())
+
+
+def text_keys(texts):
+    """Returns an S32 array of hex blake2b digests of the normalized texts."""
+    return np.array(
+        [hashlib.blake2b(normalize_text(t).encode("utf-8"), digest_size=16).hexdigest() for t in texts],
+        dtype="S32",
+    )
+
+
+def model_fingerprint(model_dir):
+    """Short sha256 over the body files of a saved SetFit model (everything but the head, README and exports)."""
+    model_dir = Path(model_dir)
+    digest = hashlib.sha256()
+    files = (
+        p for p in model_dir.rglob("*")
+        if p.is_file() and p.name not in FINGERPRINT_EXCLUDE
+        and p.relative_to(model_dir).parts[0] not in FINGERPRINT_EXCLUDE_DIRS
+    )
+    for path in sorted(files):
+        digest.update(path.relative_to(model_dir).as_posix().encode("utf-8"))
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+class EmbeddingCache:
+    """Text-hash → embedding store for one model fingerprint (see module docstring)."""
+
+    def __init__(self, root, fingerprint):
+        self.dir = Path(root) / fingerprint
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _segment_ids(self):
+        return sorted(int(p.stem.split("-")[1]) for p in self.dir.glob("keys-*.npy"))
+
+    def _load(self):
+        self._keys, self._vectors = [], []
+        for seg in self._segment_ids():
+            self._keys.append(np.load(self.dir / f"keys-{seg:05d}.npy"))
+            self._vectors.append(np.load(self.dir / f"vectors-{seg:05d}.npy", mmap_mode="r"))
+        self._offsets = np.cumsum([0] + [len(k) for k in self._keys])
+        all_keys = np.concatenate(self._keys) if self._keys else np.array([], dtype="S32")
+        self._index = pd.Index(all_keys)
+
+    def __len__(self):
+        return int(self._offsets[-1])
+
+    @property
+    def dim(self):
+        return self._vectors[0].shape[1] if self._vectors else None
+
+    def lookup(self, keys):
+        """Returns the cache row of each key, -1 for misses, and updates the hit/miss counters."""
+        rows = self._index.get_indexer(keys) if len(self) else np.full(len(keys), -1, dtype=np.intp)
+        found = int((rows >= 0).sum())
+        self.hits += found
+        self.misses += len(keys) - found
+        return rows
+
+    def get(self, rows):
+        """Gathers the vectors at the given (non-negative) cache rows from the memory-mapped segments."""
+        rows = np.asarray(rows, dtype=np.int64)
+        out = np.empty((len(rows), self.dim), dtype=np.float32)
+        seg_of_row = np.searchsorted(self._offsets, rows, side="right") - 1
+        for seg in np.unique(seg_of_row):
+            mask = seg_of_row == seg
+            out[mask] = self._vectors[seg][rows[mask] - self._offsets[seg]]
+        return out
+
+    def add(self, keys, vectors):
+        """Appends new key/vector pairs as a new segment (keys already cached are skipped)."""
+        keys = np.asarray(keys, dtype="S32")
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(self):
+            new = self._index.get_indexer(keys) < 0
+            keys, vectors = keys[new], vectors[new]
+        keys, first = np.unique(keys, return_index=True)
+        vectors = vectors[first]
+        if len(keys) == 0:
+            return
+        seg = (self._segment_ids() or [-1])[-1] + 1
+        self._write_segment(seg, keys, vectors)
+        if len(self._segment_ids()) > MAX_SEGMENTS:
+            self.compact()
+        else:
+            self._load()
+
+    def _write_segment(self, seg, keys, vectors):
+        # Vectors first, keys last: a segment only exists once its keys file does
+        for name, arr in ((f"vectors-{seg:05d}.npy", vectors), (f"keys-{seg:05d}.npy", keys)):
+            tmp = self.dir / f"{name}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, arr)
+            os.replace(tmp, self.dir / name)
+
+    def compact(self):
+        """Merges all segments into segment 0."""
+        self._load()
+        segments = self._segment_ids()
+        if len(segments) <= 1:
+            return
+        keys = np.concatenate(self._keys)
+        vectors = np.concatenate([np.asarray(v) for v in self._vectors])
+        self._keys, self._vectors = [], [] # release the memory maps before replacing files
+        for seg in segments:
+            os.remove(self.dir / f"keys-{seg:05d}.npy")
+        for seg in segments:
+            os.remove(self.dir / f"vectors-{seg:05d}.npy")
+        self._write_segment(0, keys, vectors)
+        logging.info(f"Compacted {len(segments)} embedding cache segments ({len(keys)} vectors).")
+        self._load()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self),
+        }
@@ -0,0 +1,144 @@
+"""export_relevance_model.py
+
+Exports the saved SetFit relevance model for ONNX Runtime inference
+(see onnx_relevance.py for the layout under models/relevance_setfit_model/onnx):
+
+1. the transformer body to ``model.onnx`` (dynamic batch and sequence axes);
+   pooling and normalization are not part of the graph, they run in NumPy;
+2. with ``--quantize``, a dynamically int8-quantized copy ``model.int8.onnx``
+   (weights of the MatMul/Gemm nodes in int8, activations quantized at run time);
+3. the logistic head's coefficients to ``head.npz``.
+
+``--check`` then scores the held-out split of the annotation set
+(train_relevance_model.split_annotations) with the torch model and every
+exported backend and prints, per backend, the metrics from compute_metrics,
+label agreement with torch, the smallest cosine similarity between torch and
+backend embeddings, and latency (single-comment p50/p99 and batch throughput).
+An export is only worth switching to if agreement and F1 hold up.
+
+Usage
+-----
+python -m scripts.model.export_relevance_model [--quantize] [--check] [--opset 17]
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import time
+
+import numpy as np
+
+from scripts.model.onnx_relevance import NumpyHead, onnx_paths
+from scripts.model.relevance_inference import encode_texts, load_relevance_model, predict_head
+from scripts.model.train_relevance_model import compute_metrics, load_annotations, split_annotations
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+MODEL_DIR = "models/relevance_setfit_model"
+LATENCY_SAMPLES = 200 # single-comment calls timed per backend
+
+
+def _parse_args() -> argparse.Namespace:
+    ap = argparse.ArgumentParser(description="Export the relevance model to ONNX (optionally int8) and check parity.")
+    ap.add_argument("--model-dir", default=MODEL_DIR)
+    ap.add_argument("--opset", type=int, default=17)
+    ap.add_argument("--quantize", action="store_true", help="Also write a dynamically int8-quantized model")
+    ap.add_argument("--check", action="store_true", help="Compare metrics, agreement and latency against torch")
+    ap.add_argument("--skip-export", action="store_true", help="Only run --check on existing exports")
+    return ap.parse_args()
+
+
+def export_onnx(model, onnx_path, opset: int) -> None:
+    """Exports the transformer of a SetFitModel body (token embeddings out) to onnx_path."""
+    import torch
+
+    transformer = model.model_body[0]
+    hf_model = transformer.auto_model.eval()
+    dummy = transformer.tokenizer(["an example comment"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in dummy]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    onnx_path.parent.mkdir(parents=True, exist_ok=True)
+    with torch.no_grad():
+        torch.onnx.export(
+            hf_model,
+            tuple(dummy[name] for name in input_names),
+            str(onnx_path),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True,
+        )
+    logging.info(f"Wrote {onnx_path}")
+
+
+def quantize_int8(onnx_path, int8_path) -> None:
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(str(onnx_path), str(int8_path), weight_type=QuantType.QInt8)
+    logging.info(f"Wrote {int8_path}")
+
+
+def _latency(model, texts: list[str]) -> dict:
+    """Single-comment p50/p99 (ms) over LATENCY_SAMPLES calls and batch comments/sec over all texts."""
+    singles = []
+    for text in texts[:LATENCY_SAMPLES]:
+        start = time.perf_counter()
+        predict_head(model, encode_texts(model, [text]))
+        singles.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    predict_head(model, encode_texts(model, texts))
+    elapsed = time.perf_counter() - start
+    return {
+        "p50_ms": 1000 * float(np.percentile(singles, 50)),
+        "p99_ms": 1000 * float(np.percentile(singles, 99)),
+        "comments_per_sec": len(texts) / elapsed,
+    }
+
+
+def check_parity(model_dir: str, backends: list[str]) -> None:
+    _, eval_df = split_annotations(load_annotations())
+    texts, y_true = eval_df["text"].tolist(), eval_df["label"].tolist()
+    logging.info(f"Parity check on {len(texts)} held-out annotations.")
+
+    reference = load_relevance_model(model_dir)
+    ref_embeddings = encode_texts(reference, texts)
+    ref_pred = predict_head(reference, ref_embeddings)
+
+    print(f"{'backend':>10} {'accuracy':>9} {'f1':>7} {'agree':>7} {'min cos':>8} {'p50 ms':>8} {'p99 ms':>8} {'comments/s':>11}")
+    for backend in ["torch"] + backends:
+        model = reference if backend == "torch" else load_relevance_model(model_dir, backend)
+        embeddings = encode_texts(model, texts)
+        pred = predict_head(model, embeddings)
+        metrics = compute_metrics(pred, y_true)
+        agreement = float(np.mean(pred == ref_pred))
+        cosine = np.sum(embeddings * ref_embeddings, axis=1) / (
+            np.linalg.norm(embeddings, axis=1) * np.linalg.norm(ref_embeddings, axis=1)
+        )
+        latency = _latency(model, texts)
+        print(f"{backend:>10} {metrics['accuracy']:>9.4f} {metrics['f1']:>7.4f} {agreement:>7.1%} {cosine.min():>8.5f} "
+              f"{latency['p50_ms']:>8.2f} {latency['p99_ms']:>8.2f} {latency['comments_per_sec']:>11.1f}")
+
+
+def main() -> None:
+    args = _parse_args()
+    onnx_path, int8_path, head_path = onnx_paths(args.model_dir)
+
+    if not args.skip_export:
+        model = load_relevance_model(args.model_dir)
+        export_onnx(model, onnx_path, args.opset)
+        NumpyHead.from_sklearn(model.model_head).save(head_path)
+        logging.info(f"Wrote {head_path}")
+        if args.quantize:
+            quantize_int8(onnx_path, int8_path)
+
+    if args.check:
+        backends = ["onnx"] + (["onnx-int8"] if int8_path.exists() else [])
+        check_parity(args.model_dir, backends)
+
+
+if __name__ == "__main__":
+    main()
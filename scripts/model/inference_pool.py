@@ -0,0 +1,92 @@
+# scripts/model/inference_pool.py
+"""Multi-process CPU inference for the SetFit relevance model body.
+
+Each worker process loads the model once (pool initializer) and caps torch at
+``torch_threads`` intra-op threads, so ``workers × torch_threads`` can be
+matched to the machine instead of one process fighting over all cores. Texts
+are cut into shards that are submitted to the pool's task queue; idle workers
+pick up the next shard, and embeddings are reassembled in input order. The
+classification head stays in the parent process (see relevance_inference).
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from scripts.model.relevance_inference import TOKEN_BUDGET, encode_bucketed, encode_texts, load_relevance_model
+
+SHARD_SIZE = 512 # texts per task; small enough for idle workers to even out the tail
+
+_MODEL = None
+_MAX_TOKENS = None
+
+
+def _init_worker(model_dir, torch_threads, max_tokens, loader):
+    global _MODEL, _MAX_TOKENS
+    # Must be set before torch creates its thread pools
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(torch_threads)
+    try:
+        import torch
+
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+    _MODEL = loader(model_dir)
+    _MAX_TOKENS = max_tokens
+
+
+def _encode_shard(shard_id, texts):
+    if _MAX_TOKENS:
+        embeddings, _ = encode_bucketed(_MODEL, texts, _MAX_TOKENS)
+    else:
+        embeddings = encode_texts(_MODEL, texts)
+    return shard_id, embeddings
+
+
+class InferencePool:
+    """Process pool holding one resident copy of the model per worker.
+
+    Use as a context manager; ``encode(texts)`` returns float32 (n, dim)
+    embeddings in input order. ``loader`` (model_dir -> model) must be a
+    module-level function, or a functools.partial of one, so it can be sent to
+    spawned workers.
+    """
+
+    def __init__(self, model_dir, workers, torch_threads=1, shard_size=SHARD_SIZE,
+                 max_tokens=TOKEN_BUDGET, loader=load_relevance_model):
+        if workers < 1 or torch_threads < 1:
+            raise ValueError("workers and torch_threads must be >= 1")
+        self.workers = workers
+        self.torch_threads = torch_threads
+        self.shard_size = shard_size
+        # spawn, not fork: forking a parent that already initialized torch/OpenMP can deadlock
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_dir, torch_threads, max_tokens, loader),
+        )
+
+    def encode(self, texts):
+        texts = list(texts)
+        shards = [texts[i:i + self.shard_size] for i in range(0, len(texts), self.shard_size)]
+        futures = [self._executor.submit(_encode_shard, i, shard) for i, shard in enumerate(shards)]
+        results = [None] * len(shards)
+        for future in as_completed(futures):
+            shard_id, embeddings = future.result()
+            results[shard_id] = embeddings
+        if not results:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.concatenate(results).astype(np.float32, copy=False)
+
+    def close(self):
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
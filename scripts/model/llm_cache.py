@@ -0,0 +1,70 @@
+# scripts/model/llm_cache.py
+"""Persistent SQLite cache of chat-completion responses.
+
+A response is stored under ``cache_key(payload)``, the sha256 of the
+canonical JSON request body. That body holds the model name, the system
+prompt, the user content and the decoding parameters, so changing any of
+them (a new SYSTEM_MSG, say) is a miss, while re-running unchanged rows or
+exact duplicate comments is a hit. Only successful responses are stored.
+
+    CREATE TABLE responses (key TEXT PRIMARY KEY, model TEXT, response TEXT, created REAL)
+"""
+
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+
+class CacheMiss(LookupError):
+    """Raised in offline mode when a request is not in the cache."""
+
+
+def cache_key(payload):
+    """sha256 hex digest of the canonical JSON of a chat-completion request body."""
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Request-hash → response store in one SQLite file, with hit/miss counters."""
+
+    def __init__(self, path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = str(path)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, model TEXT, response TEXT, created REAL)"
+        )
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, payload):
+        """The cached response for payload, or None; updates the hit/miss counters."""
+        row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (cache_key(payload),)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, payload, response):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+            (cache_key(payload), payload.get("model"), json.dumps(response, ensure_ascii=False), time.time()),
+        )
+        self._conn.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self)}
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,736 @@
+"""llm_labeling.py
+
+Concurrent GPT-4o stance / purchase-intention labeling (the full-dataset loop
+of models/sentiment_gpt4o_model/text_analytics.ipynb as a module).
+
+Requests are issued from an asyncio event loop, at most ``--concurrency`` at a
+time. They pass through two token buckets, one for requests per minute and one
+for tokens per minute, with the prompt estimate plus max_tokens charged against
+the latter. Rate limits (429), server errors (5xx) and connection errors are
+retried with full-jitter exponential backoff, and a Retry-After header is
+honoured when present. Every finished comment is appended at once to a JSONL
+progress file next to the output, tagged with a key of the run configuration
+(model, prompts, decoding parameters and pack size). A rerun skips the ids already
+recorded there under the same key, except API errors, which are retried. So an
+interrupted run resumes where it stopped, while a changed prompt or model
+labels everything again. The output adds the notebook's gpt4o_pred_* columns to the input.
+
+Responses are cached in SQLite (llm_cache.py) under a hash of the full request
+body. Re-running unchanged rows, or an evaluation on the same dev set, is then
+served locally at no cost. Identical requests in flight at the same time (e.g.
+exact duplicate comments) are sent once. ``--offline`` never calls the API and
+stops at the first request that is not cached. ``--evaluate`` prints the
+notebook's metrics when the input has the annotated label columns.
+
+``--pack-size N`` classifies N comments per request, so the long system prompt
+is paid once per pack instead of once per comment. The packed prompt numbers
+the comments, and the answer must be a JSON array with exactly one valid
+{"index", "stance", "pi"} object per index. A pack whose answer fails that
+check is split in half and each half retried, down to single-comment requests
+with the regular prompt. ``--compare-single`` also labels the input one
+comment per request and reports agreement and API usage per comment.
+
+The endpoint is any OpenAI-compatible ``/chat/completions`` (``--base-url`` or
+OPENAI_BASE_URL). The key comes from OPENAI_API_KEY, which is also read from
+models/sentiment_gpt4o_model/.env.
+
+Usage
+-----
+python -m scripts.model.llm_labeling [--input ...] [--output ...] [--concurrency 16] [--rpm 500] [--tpm 30000]
+                                     [--no-cache | --offline] [--evaluate] [--pack-size 20 [--compare-single]]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import http.client
+import itertools
+import json
+import logging
+import os
+import random
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import accuracy_score, classification_report, cohen_kappa_score, confusion_matrix, f1_score
+
+from scripts.frame_io import artifact_path, find_artifact, read_frame, write_frame
+from scripts.model.llm_cache import CacheMiss, ResponseCache, cache_key
+from scripts.preprocess.clean_comments import FULL_TEXT_SEP
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Configuration ---
+DERIVED_DIR = "data/derived"
+INPUT_PATH = find_artifact(DERIVED_DIR, "comments_with_relevance")
+OUTPUT_PATH = artifact_path(DERIVED_DIR, "comments_with_sentiment", "csv")
+ENV_PATH = "models/sentiment_gpt4o_model/.env"
+LLM_CACHE_PATH = "data/derived/llm_cache.sqlite"
+API_BASE = "https://api.openai.com/v1"
+MODEL = "gpt-4o"
+TEMPERATURE = 0.0
+MAX_TOKENS = 256 # completion budget per request; also charged against the token bucket
+PACK_TOKENS_PER_ITEM = 24 # completion budget per comment in a packed request
+CONCURRENCY = 16
+REQUESTS_PER_MINUTE = 500
+TOKENS_PER_MINUTE = 30000
+MAX_RETRIES = 6
+BACKOFF_BASE = 1.0 # seconds; attempt n waits uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2**n))
+BACKOFF_CAP = 60.0
+BURST_SECONDS = 10 # token buckets hold this many seconds of their per-minute rate
+REQUEST_TIMEOUT = 60.0
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+LOG_EVERY = 200
+
+# ── label ↔︎ string maps ────────────────────────────────────────────
+# Maps integer labels (-1, 0, 1) to string representations used by the LLM
+STANCE_MAP = {-1: "anti", 0: "neutral", 1: "pro"}
+PI_MAP = {-1: "boycott", 0: "neutral", 1: "buy"}
+# Inverse maps to convert LLM string predictions back to integers
+INV_STANCE = {v: k for k, v in STANCE_MAP.items()}
+INV_PI = {v: k for k, v in PI_MAP.items()}
+
+# ── prompt templates (as used for the full dataset in the notebook) ─
+SYSTEM_MSG = (
+    "You are a research assistant that classifies social-media comments. "
+    "Input is formatted as `<REPLY>comment_to_classify</REPLY>` or "
+    "`<CONTEXT>parent_comment(s)_text</CONTEXT><REPLY>comment_to_classify</REPLY>`. "
+    "Your task is to classify the text within the `<REPLY>` tags. "
+    "Use the `<CONTEXT>` text, if provided, for situational awareness to better understand the reply's meaning.\n"
+    "Classify the reply on two independent axes using the exact string labels provided below:\n"
+    "• Stance toward DEI → \"anti\" / \"neutral\" / \"pro\"\n"
+    "• Purchase intention toward the brand → \"boycott\" / \"neutral\" / \"buy\"\n"
+    "Return ONLY a single, valid JSON object with keys \"stance\" and \"pi\". The values for these keys MUST be one of the exact string labels provided (e.g., \"pro\", \"neutral\", \"buy\").\n"
+    "Ensure the output is a valid JSON string, including double quotes around keys and string values.\n"
+    "If the comment is not EXPLICITLY demonstrating stance on DEI or purchase (buying/boycott) intention, classify it as neutral.\n\n"
+    "Here are some examples of how to respond:\n\n"
+    "Example 1:\n"
+    "Input Comment:\n"
+    "«<REPLY>Love Costco.</REPLY>»\n\n"
+    "Your answer (expected JSON output):\n"
+    "{\"stance\": \"neutral\", \"pi\": \"neutral\"}\n\n"
+    "Example 2:\n"
+    "Input Comment:\n"
+    "«<REPLY>Go woke go broke.</REPLY>»\n\n"
+    "Your answer (expected JSON output):\n"
+    "{\"stance\": \"anti\", \"pi\": \"boycott\"}\n\n"
+    "Example 3:\n"
+    "Input Comment:\n"
+    "«<CONTEXT>We're proud of our diverse workforce!</CONTEXT><REPLY>Thank you for standing up for DEI and what is right, I'll be renewing my membership.</REPLY>»\n\n"
+    "Your answer (expected JSON output):\n"
+    "{\"stance\": \"pro\", \"pi\": \"buy\"}\n\n"
+    "Example 4:\n"
+    "Input Comment:\n"
+    "«<CONTEXT>Our new line is great for everyone.</CONTEXT><REPLY>I support DEI, but I'm not sure if I'll be renewing my membership.</REPLY>»\n\n"
+    "Your answer (expected JSON output):\n"
+    "{\"stance\": \"pro\", \"pi\": \"neutral\"}\n\n"
+    "Example 5:\n"
+    "Input Comment:\n"
+    "«<REPLY>you dropped rid of dei? nope. done shopping here.</REPLY>»\n\n"
+    "Your answer (expected JSON output):\n"
+    "{\"stance\": \"pro\", \"pi\": \"boycott\"}\n\n"
+    "Example 6:\n"
+    "Input Comment:\n"
+    "«<CONTEXT> supporting dei is means you want racist hiring </CONTEXT> <REPLY> you need to be educated </REPLY>»\n\n"
+    "Your answer (expected JSON output):\n"
+    "{\"stance\": \"neutral\", \"pi\": \"neutral\"}\n\n"
+    "Example 7:\n"
+    "Input Comment:\n"
+    "«<REPLY>Let's boycott this woke pro dei company</REPLY>»\n\n"
+    "Your answer (expected JSON output):\n"
+    "{\"stance\": \"anti\", \"pi\": \"boycott\"}\n\n"
+    "Example 8:\n"
+    "Input Comment:\n"
+    "«<REPLY>Roll back DEI and then ask us to shop here....nope!</REPLY>»\n\n"
+    "Your answer (expected JSON output):\n"
+    "{\"stance\": \"pro\", \"pi\": \"boycott\"}\n\n"
+    "Example 9:\n"
+    "Input Comment:\n"
+    "«<REPLY>I can't believe they chose diversity over qualifications! When will they get rid of there terrible dei practices.</REPLY>»\n\n"
+    "Your answer (expected JSON output):\n"
+    "{\"stance\": \"anti\", \"pi\": \"neutral\"}\n\n"
+    "Example 10:\n"
+    "Input Comment:\n"
+    "«<CONTEXT>I will no longer shop here because of your policies</CONTEXT> <REPLY>Bye!</REPLY>»\n\n"
+    "Your answer (expected JSON output):\n"
+    "{\"stance\": \"neutral\", \"pi\": \"neutral\"}\n\n"
+    "Example 11:\n"
+    "Input Comment:\n"
+    "«<REPLY>I can't believe you would do this... DEI has to go!</REPLY>»\n\n"
+    "Your answer (expected JSON output):\n"
+    "{\"stance\": \"anti\", \"pi\": \"neutral\"}\n\n"
+    "Example 12:\n"
+    "Input Comment:\n"
+    "«<REPLY>I will not be renewing my membership. One less place to go!</REPLY>»\n\n"
+    "Your answer (expected JSON output):\n"
+    "{\"stance\": \"neutral\", \"pi\": \"boycott\"}\n\n"
+    "Example 13:\n"
+    "Input Comment:\n"
+    "«<REPLY>Your commitment to dei hiring has inspired me to become your customer.</REPLY>»\n\n"
+    "Your answer (expected JSON output):\n"
+    "{\"stance\": \"pro\", \"pi\": \"buy\"}\n\n"
+)
+
+# Template for formatting the user's input comment for the LLM
+USER_TMPL = "Comment:\n«{}»\n\nYour answer:"
+PRED_COLS = ["gpt4o_pred_stance_label", "gpt4o_pred_pi_label", "gpt4o_pred_stance_str", "gpt4o_pred_pi_str"]
+# Appended to SYSTEM_MSG for packed requests (several numbered comments per call)
+PACK_INSTRUCTIONS = (
+    "\n\nBATCH MODE: You will receive several comments at once, each prefixed by its index in square brackets, "
+    "e.g. `[0] «<REPLY>comment_to_classify</REPLY>»`. Classify every comment independently, exactly as described above. "
+    "Instead of a single object, return ONLY a valid JSON array with one object per comment, each with the keys "
+    "\"index\" (the integer index), \"stance\" and \"pi\", for example:\n"
+    "[{\"index\": 0, \"stance\": \"neutral\", \"pi\": \"neutral\"}, {\"index\": 1, \"stance\": \"anti\", \"pi\": \"boycott\"}]\n"
+    "Include every index exactly once."
+)
+PACKED_USER_TMPL = "Comments:\n{}\n\nYour answer:"
+
+
+def joined_text(full_text):
+    """The notebook's joined_text: full_text segments as <CONTEXT> parents and the <REPLY>."""
+    if pd.isna(full_text):
+        return ""
+    segs = str(full_text).split(FULL_TEXT_SEP)
+    if len(segs) == 1:
+        return f"<REPLY> {segs[0]} </REPLY>"
+    context = " </CONTEXT> <CONTEXT> ".join(segs[:-1])
+    return f"<CONTEXT> {context} </CONTEXT> <REPLY> {segs[-1]} </REPLY>"
+
+
+def build_messages(text, system_msg=SYSTEM_MSG):
+    return [{"role": "system", "content": system_msg}, {"role": "user", "content": USER_TMPL.format(text)}]
+
+
+def build_packed_messages(texts, system_msg=SYSTEM_MSG):
+    items = "\n".join(f"[{i}] «{text}»" for i, text in enumerate(texts))
+    return [{"role": "system", "content": system_msg + PACK_INSTRUCTIONS},
+            {"role": "user", "content": PACKED_USER_TMPL.format(items)}]
+
+
+def strip_fences(content):
+    """Removes a surrounding ```json ... ``` (or ``` ... ```) markdown fence."""
+    content = content.strip()
+    for fence in ("```json", "```"):
+        if content.startswith(fence):
+            content = content[len(fence):].strip()
+            if content.endswith("```"):
+                content = content[:-3].strip()
+            break
+    return content
+
+
+def parse_labels(content):
+    """(stance, pi) strings from the model's JSON answer; raises ValueError if it is not a JSON object."""
+    data = json.loads(strip_fences(content))
+    if not isinstance(data, dict):
+        raise ValueError(f"expected a JSON object, got {type(data).__name__}")
+    return data.get("stance", "error_key_missing"), data.get("pi", "error_key_missing")
+
+
+def parse_packed(content, n):
+    """
+    [(stance, pi)] in index order from a packed answer. Raises ValueError
+    unless it is a JSON array holding, for every index 0..n-1 exactly once,
+    an object with a valid stance and pi label.
+    """
+    data = json.loads(strip_fences(content))
+    if not isinstance(data, list):
+        raise ValueError(f"expected a JSON array, got {type(data).__name__}")
+    labels = {}
+    for item in data:
+        if not isinstance(item, dict):
+            raise ValueError(f"expected objects in the array, got {type(item).__name__}")
+        index = item.get("index")
+        if type(index) is not int or not 0 <= index < n or index in labels:
+            raise ValueError(f"missing, out-of-range or repeated index {index!r}")
+        if item.get("stance") not in INV_STANCE or item.get("pi") not in INV_PI:
+            raise ValueError(f"invalid labels for index {index}: {item.get('stance')!r}, {item.get('pi')!r}")
+        labels[index] = (item["stance"], item["pi"])
+    if len(labels) != n:
+        raise ValueError(f"answer covers {len(labels)} of {n} comments")
+    return [labels[i] for i in range(n)]
+
+
+def response_content(response):
+    """The assistant message of a chat completion; ValueError if the response has none (e.g. no choices)."""
+    try:
+        return response["choices"][0]["message"]["content"] or ""
+    except (KeyError, IndexError, TypeError):
+        raise ValueError(f"no message in response: {json.dumps(response)[:200]}") from None
+
+
+def estimate_tokens(payload):
+    """Rough token cost of a request for the token bucket: ~4 characters per prompt token plus max_tokens."""
+    prompt_chars = sum(len(m["content"]) for m in payload["messages"])
+    return prompt_chars // 4 + 4 * len(payload["messages"]) + payload.get("max_tokens", 0)
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP, rng=random):
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2**attempt))."""
+    return rng.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class TokenBucket:
+    """
+    Continuously refilled bucket of ``per_minute`` units per minute holding at
+    most ``capacity`` (default: BURST_SECONDS worth). ``acquire`` waits until
+    the requested amount is available; waiters are served in arrival order.
+    """
+
+    def __init__(self, per_minute, capacity=None, clock=time.monotonic):
+        self.rate = per_minute / 60
+        self.capacity = capacity or max(1.0, self.rate * BURST_SECONDS)
+        self._clock = clock
+        self._level = self.capacity
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount=1):
+        amount = min(amount, self.capacity) # a request larger than the bucket waits for a full one
+        async with self._lock:
+            while True:
+                now = self._clock()
+                self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._level >= amount:
+                    self._level -= amount
+                    return
+                await asyncio.sleep((amount - self._level) / self.rate)
+
+
+class APIError(Exception):
+    """Failed chat completion; status is None for connection errors, timeouts and unreadable responses."""
+
+    def __init__(self, status, message, retry_after=None):
+        super().__init__(f"{status or 'connection error'}: {message}")
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self):
+        return self.status is None or self.status in RETRYABLE_STATUS
+
+
+def _retry_after(headers):
+    """Seconds to wait from retry-after-ms / Retry-After headers, if given."""
+    for name, scale in (("retry-after-ms", 1000), ("Retry-After", 1)):
+        value = headers.get(name) if headers is not None else None
+        try:
+            return float(value) / scale if value is not None else None
+        except ValueError:
+            continue
+    return None
+
+
+class ChatClient:
+    """Blocking client for an OpenAI-compatible /chat/completions endpoint (run in worker threads)."""
+
+    def __init__(self, base_url=API_BASE, api_key=None, timeout=REQUEST_TIMEOUT):
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def complete(self, payload):
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        request = urllib.request.Request(self.url, data=json.dumps(payload).encode("utf-8"), headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise APIError(e.code, e.read().decode("utf-8", "replace")[:300], _retry_after(e.headers)) from None
+        except (urllib.error.URLError, TimeoutError, ConnectionError, http.client.HTTPException) as e:
+            raise APIError(None, str(e) or type(e).__name__) from None
+        except json.JSONDecodeError as e: # e.g. an HTML error page from a proxy
+            raise APIError(None, f"response is not JSON ({e})") from None
+
+
+class Labeler:
+    """
+    Labels (id, text) pairs with at most ``concurrency`` requests in flight,
+    under requests- and tokens-per-minute buckets, retrying transient failures.
+    With a ResponseCache, cached requests skip the API; with offline=True a
+    request missing from it raises CacheMiss.
+    """
+
+    def __init__(self, client, model=MODEL, concurrency=CONCURRENCY, rpm=REQUESTS_PER_MINUTE,
+                 tpm=TOKENS_PER_MINUTE, max_retries=MAX_RETRIES, system_msg=SYSTEM_MSG, backoff_base=BACKOFF_BASE,
+                 seed=None, cache=None, offline=False, pack_size=1):
+        if offline and cache is None:
+            raise ValueError("offline mode needs a response cache")
+        self.client = client
+        self.cache = cache
+        self.offline = offline
+        self.pack_size = pack_size
+        self._in_flight = {}
+        self.model = model
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.system_msg = system_msg
+        self.rpm, self.tpm = rpm, tpm
+        self.backoff_base = backoff_base
+        self._rng = random.Random(seed)
+        self.stats = {"requests": 0, "retries": 0, "deduplicated": 0, "pack_splits": 0, "ok": 0, "parse_error": 0,
+                      "api_error": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    def payload(self, text):
+        return {"model": self.model, "temperature": TEMPERATURE, "max_tokens": MAX_TOKENS,
+                "messages": build_messages(text, self.system_msg)}
+
+    @property
+    def run_key(self):
+        """
+        Hash of everything besides the comments that shapes a request (model,
+        prompts, decoding parameters and pack size); stored with each progress record.
+        """
+        packed = self.packed_payload([]) if self.pack_size > 1 else None
+        return cache_key({"single": self.payload(""), "pack_size": self.pack_size, "packed": packed})[:16]
+
+    def packed_payload(self, texts):
+        return {"model": self.model, "temperature": TEMPERATURE,
+                "max_tokens": PACK_TOKENS_PER_ITEM * len(texts) + 32,
+                "messages": build_packed_messages(texts, self.system_msg)}
+
+    async def _request(self, payload):
+        """Sends one request under the rate limits, retrying retryable errors with backoff."""
+        loop = asyncio.get_running_loop()
+        cost = estimate_tokens(payload)
+        for attempt in range(self.max_retries + 1):
+            await self._requests.acquire(1)
+            await self._tokens.acquire(cost)
+            self.stats["requests"] += 1
+            try:
+                return await loop.run_in_executor(self._executor, self.client.complete, payload)
+            except APIError as e:
+                if not e.retryable or attempt == self.max_retries:
+                    raise
+                delay = e.retry_after if e.retry_after is not None else backoff_delay(attempt, self.backoff_base, rng=self._rng)
+                self.stats["retries"] += 1
+                logging.warning(f"Request failed ({e}); retry {attempt + 1}/{self.max_retries} in {delay:.1f}s.")
+                await asyncio.sleep(delay)
+
+    async def _complete(self, payload):
+        """The response to payload: from the cache, from an identical request already in flight, or from the API."""
+        if self.cache is not None:
+            response = self.cache.get(payload)
+            if response is not None:
+                return response
+        if self.offline:
+            raise CacheMiss(f"Offline and not cached: {payload['messages'][-1]['content'][:80]!r}")
+        key = cache_key(payload)
+        if key in self._in_flight:
+            self.stats["deduplicated"] += 1
+            return await asyncio.shield(self._in_flight[key])
+
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda f: f.cancelled() or f.exception()) # no "never retrieved" warning
+        self._in_flight[key] = future
+        try:
+            response = await self._request(payload)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del self._in_flight[key]
+        future.set_result(response)
+        usage = response.get("usage") or {}
+        self.stats["prompt_tokens"] += usage.get("prompt_tokens", 0)
+        self.stats["completion_tokens"] += usage.get("completion_tokens", 0)
+        if self.cache is not None and response.get("choices"): # an empty answer is not worth replaying
+            self.cache.put(payload, response)
+        return response
+
+    async def label_one(self, key, text):
+        """Progress record for one comment: id, stance, pi, status (ok / parse_error / api_error) and raw answer."""
+        try:
+            response = await self._complete(self.payload(text))
+        except APIError as e:
+            return {"id": key, "stance": "api_error", "pi": "api_error", "status": "api_error", "raw": str(e)}
+        try:
+            content = response_content(response)
+        except ValueError as e:
+            return {"id": key, "stance": "parse_error", "pi": "parse_error", "status": "parse_error", "raw": str(e)}
+        try:
+            stance, pi = parse_labels(content)
+            status = "ok"
+        except ValueError:
+            stance = pi = status = "parse_error"
+        return {"id": key, "stance": stance, "pi": pi, "status": status, "raw": content.strip()}
+
+    async def label_pack(self, pack):
+        """
+        Records for a list of (id, text) pairs labeled in one request. If the
+        answer fails parse_packed, or the request is rejected (e.g. too long),
+        the pack is split in half and both halves are labeled the same way; a
+        single comment falls back to label_one.
+        """
+        if len(pack) == 1:
+            return [await self.label_one(*pack[0])]
+        try:
+            response = await self._complete(self.packed_payload([text for _, text in pack]))
+            labels = parse_packed(response_content(response), len(pack))
+        except APIError as e:
+            if e.retryable: # retries exhausted: splitting would only add load
+                return [{"id": k, "stance": "api_error", "pi": "api_error", "status": "api_error", "raw": str(e)}
+                        for k, _ in pack]
+            self._note_split(pack, e)
+            return await self._label_halves(pack)
+        except ValueError as e:
+            self._note_split(pack, e)
+            return await self._label_halves(pack)
+        return [{"id": key, "stance": stance, "pi": pi, "status": "ok", "raw": json.dumps([stance, pi]), "pack": len(pack)}
+                for (key, _), (stance, pi) in zip(pack, labels)]
+
+    def _note_split(self, pack, error):
+        self.stats["pack_splits"] += 1
+        logging.info(f"Splitting a pack of {len(pack)} comments: {error}")
+
+    async def _label_halves(self, pack):
+        mid = len(pack) // 2
+        first, second = await asyncio.gather(self.label_pack(pack[:mid]), self.label_pack(pack[mid:]))
+        return first + second
+
+    async def run(self, items, progress_path):
+        """Labels items (iterable of (id, text)), appending each record to progress_path as it finishes."""
+        self._requests = TokenBucket(self.rpm)
+        self._tokens = TokenBucket(self.tpm)
+        items = iter(items)
+        done, start = 0, time.perf_counter()
+        run_key = self.run_key
+        _terminate_last_line(progress_path)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as self._executor, \
+                open(progress_path, "a", encoding="utf-8") as out:
+
+            async def worker():
+                nonlocal done
+                # Shared iterator: each item goes to exactly one worker
+                while pack := list(itertools.islice(items, self.pack_size)):
+                    records = await self.label_pack(pack)
+                    for record in records:
+                        record["run"] = run_key
+                        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                        self.stats[record["status"]] += 1
+                    out.flush()
+                    previous, done = done, done + len(records)
+                    if done // LOG_EVERY > previous // LOG_EVERY:
+                        logging.info(f"{done} labeled, {done / (time.perf_counter() - start):.1f} comments/sec, {self.stats}")
+
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        return done
+
+
+def _terminate_last_line(path):
+    """Ends a line cut short by an interruption so appended records start on a line of their own."""
+    if os.path.exists(path) and os.path.getsize(path):
+        with open(path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+
+def read_progress(progress_path):
+    """id -> latest record from a progress file (a line cut short by an interruption is ignored)."""
+    records = {}
+    if os.path.exists(progress_path):
+        with open(progress_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                records[record["id"]] = record
+    return records
+
+
+def pending_items(keys, texts, records, run_key=None):
+    """
+    (id, text) pairs still to label: not in records, recorded as api_error or,
+    given a run_key, recorded under a different one (another model or prompt).
+    """
+    def done(record):
+        return record.get("status", "api_error") != "api_error" and (run_key is None or record.get("run") == run_key)
+
+    return [(k, t) for k, t in zip(keys, texts) if not done(records.get(k, {}))]
+
+
+def apply_labels(df, keys, records):
+    """df plus the notebook's gpt4o_pred_* columns (unknown or error strings map to 0, neutral)."""
+    out = df.copy()
+    stance = [records.get(k, {}).get("stance", "missing") for k in keys]
+    pi = [records.get(k, {}).get("pi", "missing") for k in keys]
+    out["gpt4o_pred_stance_label"] = np.array([INV_STANCE.get(x, 0) for x in stance])
+    out["gpt4o_pred_pi_label"] = np.array([INV_PI.get(x, 0) for x in pi])
+    out["gpt4o_pred_stance_str"] = stance
+    out["gpt4o_pred_pi_str"] = pi
+    return out
+
+
+def label_frame(df, progress_path, labeler, id_column="id", text_column="full_text"):
+    """Labels every row of df not already done in progress_path and returns df with the prediction columns."""
+    keys = df[id_column].astype(str).tolist()
+    texts = [joined_text(t) for t in df[text_column]]
+    records = read_progress(progress_path)
+    todo = pending_items(keys, texts, records, labeler.run_key)
+    stale = sum(1 for k, _ in todo if k in records and records[k].get("run") != labeler.run_key)
+    if stale:
+        logging.info(f"{stale} comments were labeled under another configuration and are labeled again.")
+    logging.info(f"{len(keys) - len(todo)} of {len(keys)} comments already labeled; {len(todo)} to go.")
+    if todo:
+        asyncio.run(labeler.run(todo, progress_path))
+        records = read_progress(progress_path)
+    return apply_labels(df, keys, records)
+
+
+def mode_agreement(labeled, reference):
+    """Per-axis agreement rate and Cohen's kappa between two labelings of the same rows."""
+    result = {}
+    for axis, col in (("stance", "gpt4o_pred_stance_label"), ("pi", "gpt4o_pred_pi_label")):
+        a, b = labeled[col].to_numpy(), reference[col].to_numpy()
+        result[f"{axis}_agreement"] = float(np.mean(a == b))
+        result[f"{axis}_kappa"] = float(cohen_kappa_score(a, b))
+    return result
+
+
+def usage_per_comment(stats, n):
+    """API requests and tokens per labeled comment from a Labeler's stats."""
+    return {key: stats[key] / n if n else 0.0 for key in ("requests", "prompt_tokens", "completion_tokens")}
+
+
+def evaluation_report(labeled):
+    """The notebook's dev-set metrics (macro F1, accuracy, confusion matrix, report) for both axes."""
+    lines = []
+    for axis, true_col, pred_col, names in (
+        ("Stance", "stance_dei_label", "gpt4o_pred_stance_label", STANCE_MAP),
+        ("PI", "purchase_intention_label", "gpt4o_pred_pi_label", PI_MAP),
+    ):
+        y_true = labeled[true_col].astype(int).to_numpy()
+        y_pred = labeled[pred_col].to_numpy()
+        labels = [-1, 0, 1]
+        lines += [
+            f"\n── {axis} Metrics ─────────────────────",
+            f"Macro F1-Score : {f1_score(y_true, y_pred, average='macro', zero_division=0):.4f}",
+            f"Accuracy       : {accuracy_score(y_true, y_pred):.4f}",
+            "Confusion Matrix (Rows: True, Cols: Predicted, Labels: -1, 0, 1):",
+            str(confusion_matrix(y_true, y_pred, labels=labels)),
+            classification_report(y_true, y_pred, labels=labels, target_names=[names[l] for l in labels],
+                                  zero_division=0),
+        ]
+    return "\n".join(lines)
+
+
+def load_api_key(env_path=ENV_PATH):
+    """OPENAI_API_KEY from the environment, else from KEY=VALUE lines in env_path."""
+    if os.getenv("OPENAI_API_KEY"):
+        return os.environ["OPENAI_API_KEY"]
+    if os.path.exists(env_path):
+        with open(env_path, encoding="utf-8") as f:
+            for line in f:
+                name, _, value = line.strip().partition("=")
+                if name.strip() == "OPENAI_API_KEY":
+                    return value.strip().strip("'\"")
+    return None
+
+
+def _parse_args() -> argparse.Namespace:
+    ap = argparse.ArgumentParser(description="Label comments for DEI stance and purchase intention with GPT-4o.")
+    ap.add_argument("--input", default=INPUT_PATH)
+    ap.add_argument("--output", default=OUTPUT_PATH)
+    ap.add_argument("--id-column", default="id")
+    ap.add_argument("--text-column", default="full_text")
+    ap.add_argument("--limit", type=int, default=0, help="Only label the first N rows (0 labels all)")
+    ap.add_argument("--base-url", default=os.getenv("OPENAI_BASE_URL", API_BASE),
+                    help="OpenAI-compatible API base URL")
+    ap.add_argument("--model", default=MODEL)
+    ap.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Requests in flight at once")
+    ap.add_argument("--rpm", type=float, default=REQUESTS_PER_MINUTE, help="Requests-per-minute limit")
+    ap.add_argument("--tpm", type=float, default=TOKENS_PER_MINUTE, help="Tokens-per-minute limit")
+    ap.add_argument("--max-retries", type=int, default=MAX_RETRIES)
+    ap.add_argument("--cache", default=LLM_CACHE_PATH, help="SQLite response cache")
+    ap.add_argument("--no-cache", action="store_true", help="Neither read nor write the response cache")
+    ap.add_argument("--offline", action="store_true", help="Serve from the cache only; stop at the first miss")
+    ap.add_argument("--evaluate", action="store_true",
+                    help="Print metrics against stance_dei_label / purchase_intention_label (annotated input)")
+    ap.add_argument("--pack-size", type=int, default=1, help="Comments classified per request (1 = one per request)")
+    ap.add_argument("--compare-single", action="store_true",
+                    help="With --pack-size > 1, also label one comment per request and report agreement and usage")
+    return ap.parse_args()
+
+
+def _label(df, args, client, cache, pack_size, progress_path):
+    """Labels df with a fresh Labeler; returns (labeled frame, labeler). Exits on an offline cache miss."""
+    labeler = Labeler(client, args.model, args.concurrency, args.rpm, args.tpm, args.max_retries,
+                      cache=cache, offline=args.offline, pack_size=pack_size)
+    try:
+        labeled = label_frame(df, progress_path, labeler, args.id_column, args.text_column)
+    except CacheMiss as e:
+        logging.error(f"{e}. Labeled comments so far are kept in {progress_path}.")
+        raise SystemExit(1)
+    return labeled, labeler
+
+
+def _comments_labeled(labeler):
+    return sum(labeler.stats[status] for status in ("ok", "parse_error", "api_error"))
+
+
+def _usage_line(mode, labeler, progress_path):
+    n = _comments_labeled(labeler)
+    if not n:
+        return f"API usage per comment, {mode}: not measured, every comment was already in {progress_path}"
+    return f"API usage per comment, {mode}: {usage_per_comment(labeler.stats, n)} over {n} comments labeled this run"
+
+
+def main() -> None:
+    args = _parse_args()
+    if args.offline and args.no_cache:
+        logging.error("--offline needs the response cache.")
+        raise SystemExit(1)
+    api_key = load_api_key()
+    if not api_key and args.base_url == API_BASE and not args.offline:
+        logging.error(f"OPENAI_API_KEY is not set (environment or {ENV_PATH}).")
+        raise SystemExit(1)
+
+    df = read_frame(args.input)
+    if args.limit:
+        df = df.head(args.limit)
+    logging.info(f"Loaded {len(df)} rows from {args.input}")
+
+    client = ChatClient(args.base_url, api_key)
+    cache = None if args.no_cache else ResponseCache(args.cache)
+    progress_path = f"{args.output}.progress.jsonl"
+    start = time.perf_counter()
+    labeled, labeler = _label(df, args, client, cache, args.pack_size, progress_path)
+    elapsed = time.perf_counter() - start
+    write_frame(labeled, args.output)
+    if args.evaluate:
+        print(evaluation_report(labeled))
+
+    if args.compare_single and args.pack_size > 1:
+        single_path = f"{args.output}.single.progress.jsonl"
+        single, single_labeler = _label(df, args, client, cache, 1, single_path)
+        print(f"\n--- Packed (size {args.pack_size}) vs single-comment requests ---")
+        print(f"Agreement: {mode_agreement(labeled, single)}")
+        print(_usage_line("packed", labeler, progress_path))
+        print(_usage_line("single", single_labeler, single_path))
+        if args.evaluate:
+            print("Single-comment metrics:")
+            print(evaluation_report(single))
+
+    print("\n--- Labeling Summary ---")
+    print(f"Rows labeled: {len(labeled)} in {elapsed:.1f}s (pack size {args.pack_size})")
+    print(f"Request stats: {labeler.stats}")
+    if cache is not None:
+        print(f"Response cache: {cache.stats()} ({args.cache})")
+    print(f"Progress file: {progress_path}")
+    print(f"Output saved to: {args.output}")
+    print("------------------------")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# scripts/model/onnx_relevance.py
+"""ONNX Runtime backend for the SetFit relevance model.
+
+``export_relevance_model.py`` writes, next to the saved SetFit files:
+
+    models/relevance_setfit_model/onnx/model.onnx       transformer body (fp32)
+    models/relevance_setfit_model/onnx/model.int8.onnx  dynamically int8-quantized body (optional)
+    models/relevance_setfit_model/onnx/head.npz         logistic head (coef_, intercept_, classes_)
+
+``load_onnx_model`` returns an object with the same surface the inference
+helpers use on a SetFitModel (``model_body.encode``/``tokenizer``/
+``max_seq_length``, ``model_head.predict``, ``normalize_embeddings``), so the
+embedding cache, length bucketing and worker pool work with either backend.
+Pooling and normalization follow the sentence-transformers modules of the
+saved model (mean pooling, then L2 normalization) and run in NumPy; the head
+needs neither torch nor scikit-learn at inference time.
+"""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+ONNX_SUBDIR = "onnx"
+ONNX_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+HEAD_FILE = "head.npz"
+
+
+def mean_pool(last_hidden_state, attention_mask):
+    """Mean of the token embeddings over the attended positions (sentence-transformers mean pooling)."""
+    mask = attention_mask[..., None].astype(last_hidden_state.dtype)
+    summed = (last_hidden_state * mask).sum(axis=1)
+    counts = np.clip(mask.sum(axis=1), 1e-9, None)
+    return summed / counts
+
+
+def l2_normalize(x):
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.clip(norms, 1e-12, None)
+
+
+class NumpyHead:
+    """Logistic-regression head evaluated in NumPy (same outputs as the scikit-learn estimator)."""
+
+    def __init__(self, coef, intercept, classes):
+        self.coef_ = np.asarray(coef, dtype=np.float64)
+        self.intercept_ = np.asarray(intercept, dtype=np.float64)
+        self.classes_ = np.asarray(classes)
+
+    @classmethod
+    def from_sklearn(cls, head):
+        return cls(head.coef_, head.intercept_, head.classes_)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["coef"], data["intercept"], data["classes"])
+
+    def save(self, path):
+        np.savez(path, coef=self.coef_, intercept=self.intercept_, classes=self.classes_)
+
+    def decision_function(self, X):
+        scores = np.asarray(X, dtype=np.float64) @ self.coef_.T + self.intercept_
+        return scores.ravel() if scores.shape[1] == 1 else scores
+
+    def predict_proba(self, X):
+        scores = self.decision_function(X)
+        if scores.ndim == 1:
+            positive = 1.0 / (1.0 + np.exp(-scores))
+            return np.column_stack([1.0 - positive, positive])
+        scores = scores - scores.max(axis=1, keepdims=True)
+        exp = np.exp(scores)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def predict(self, X):
+        scores = self.decision_function(X)
+        idx = (scores > 0).astype(int) if scores.ndim == 1 else scores.argmax(axis=1)
+        return self.classes_[idx]
+
+
+class _Tokenizer:
+    """Callable wrapper around a ``tokenizers.Tokenizer`` matching the transformers call used by token_lengths."""
+
+    def __init__(self, tokenizer_path, max_length):
+        from tokenizers import Tokenizer
+
+        self._tokenizer = Tokenizer.from_file(str(tokenizer_path))
+        self._tokenizer.no_padding()
+        self._tokenizer.enable_truncation(max_length=max_length)
+        self.pad_id = self._tokenizer.token_to_id("[PAD]") or 0
+
+    def encode_batch(self, texts):
+        return self._tokenizer.encode_batch(list(texts))
+
+    def __call__(self, texts, add_special_tokens=True, truncation=True, max_length=None):
+        return {"input_ids": [e.ids for e in self.encode_batch(texts)]}
+
+
+class OnnxBody:
+    """Sentence-embedding body running the exported transformer in ONNX Runtime."""
+
+    def __init__(self, model_dir, onnx_path):
+        import onnxruntime as ort
+
+        model_dir = Path(model_dir)
+        with open(model_dir / "sentence_bert_config.json", encoding="utf-8") as f:
+            self.max_seq_length = json.load(f)["max_seq_length"]
+        with open(model_dir / "modules.json", encoding="utf-8") as f:
+            self._normalize = any(m["type"].endswith("Normalize") for m in json.load(f))
+        self.tokenizer = _Tokenizer(model_dir / "tokenizer.json", self.max_seq_length)
+
+        options = ort.SessionOptions()
+        # Inside an InferencePool worker this follows --torch-threads
+        options.intra_op_num_threads = int(os.environ.get("OMP_NUM_THREADS", "0"))
+        self._session = ort.InferenceSession(str(onnx_path), options, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self._session.get_inputs()}
+        self._dim = self._session.get_outputs()[0].shape[-1]
+
+    def get_sentence_embedding_dimension(self):
+        return self._dim
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        width = max(len(e.ids) for e in encodings)
+        input_ids = np.full((len(encodings), width), self.tokenizer.pad_id, dtype=np.int64)
+        attention_mask = np.zeros((len(encodings), width), dtype=np.int64)
+        token_type_ids = np.zeros((len(encodings), width), dtype=np.int64)
+        for i, e in enumerate(encodings):
+            input_ids[i, :len(e.ids)] = e.ids
+            attention_mask[i, :len(e.ids)] = e.attention_mask
+            token_type_ids[i, :len(e.ids)] = e.type_ids
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask, "token_type_ids": token_type_ids}
+        last_hidden_state = self._session.run(None, {k: v for k, v in feeds.items() if k in self._input_names})[0]
+        embeddings = mean_pool(last_hidden_state, attention_mask)
+        return l2_normalize(embeddings) if self._normalize else embeddings
+
+    def encode(self, texts, batch_size=64, normalize_embeddings=False, convert_to_numpy=True, show_progress_bar=False):
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, self._dim), dtype=np.float32)
+        # Length-sorted within the call, like sentence-transformers
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        out = np.empty((len(texts), self._dim), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            idx = order[start:start + batch_size]
+            out[idx] = self._encode_batch([texts[i] for i in idx])
+        return l2_normalize(out) if normalize_embeddings else out
+
+
+class OnnxRelevanceModel:
+    """ONNX body + NumPy head with the attributes relevance_inference expects of a SetFitModel."""
+
+    normalize_embeddings = False # the body applies the model's own Normalize module
+
+    def __init__(self, model_body, model_head):
+        self.model_body = model_body
+        self.model_head = model_head
+
+    def predict(self, texts):
+        return self.model_head.predict(self.model_body.encode(texts))
+
+
+def onnx_paths(model_dir):
+    base = Path(model_dir) / ONNX_SUBDIR
+    return base / ONNX_FILE, base / INT8_FILE, base / HEAD_FILE
+
+
+def load_onnx_model(model_dir, quantized=False):
+    """Loads the exported ONNX (or int8) body and the NumPy head of the model saved in model_dir."""
+    fp32_path, int8_path, head_path = onnx_paths(model_dir)
+    onnx_path = int8_path if quantized else fp32_path
+    if not onnx_path.exists():
+        raise FileNotFoundError(
+            f"{onnx_path} not found; run python -m scripts.model.export_relevance_model"
+            + (" --quantize" if quantized else "")
+        )
+    return OnnxRelevanceModel(OnnxBody(model_dir, onnx_path), NumpyHead.load(head_path))
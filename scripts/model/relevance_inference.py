@@ -0,0 +1,173 @@
+# scripts/model/relevance_inference.py
+"""Inference helpers for the SetFit relevance model.
+
+SetFit's ``model.predict`` is the sentence-transformer body (``model_body``)
+followed by the logistic head (``model_head.pkl``). Splitting the two lets the
+embedding cache and the batching strategies below feed the head with vectors
+that did not all come from one ``encode`` call.
+"""
+
+import logging
+import time
+
+import numpy as np
+
+from scripts.model.embedding_cache import EmbeddingCache, model_fingerprint, text_keys
+from scripts.model.onnx_relevance import load_onnx_model
+
+ENCODE_BATCH_SIZE = 64
+TOKEN_BUDGET = 8192 # padded tokens per batch for length-bucketed encoding
+MAX_BATCH_SIZE = 256
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def load_relevance_model(model_dir, backend="torch"):
+    """
+    Loads the relevance model saved in model_dir. "torch" is the SetFitModel
+    (setfit is only imported here); "onnx" and "onnx-int8" load the exported
+    body and NumPy head (see onnx_relevance and export_relevance_model).
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}; expected one of {BACKENDS}")
+    if backend != "torch":
+        return load_onnx_model(model_dir, quantized=backend == "onnx-int8")
+    from setfit import SetFitModel
+
+    return SetFitModel.from_pretrained(model_dir)
+
+
+def encode_texts(model, texts, batch_size=ENCODE_BATCH_SIZE):
+    """Embeds texts with the model body exactly as SetFitModel.predict does; returns float32 (n, dim)."""
+    if len(texts) == 0:
+        dim = model.model_body.get_sentence_embedding_dimension()
+        return np.empty((0, dim), dtype=np.float32)
+    embeddings = model.model_body.encode(
+        list(texts),
+        batch_size=batch_size,
+        normalize_embeddings=model.normalize_embeddings,
+        convert_to_numpy=True,
+        show_progress_bar=False,
+    )
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def token_lengths(model, texts):
+    """Token count of each text after the body's truncation (special tokens included)."""
+    body = model.model_body
+    encoded = body.tokenizer(list(texts), add_special_tokens=True, truncation=True, max_length=body.max_seq_length)
+    return np.array([len(ids) for ids in encoded["input_ids"]], dtype=np.int64)
+
+
+def plan_batches(lengths, max_tokens=TOKEN_BUDGET, max_batch_size=MAX_BATCH_SIZE):
+    """
+    Groups positions into batches of similar token length.
+    Positions are sorted by length (longest first) and a batch grows while its
+    padded size, batch size × longest member, stays within max_tokens (a text
+    longer than the budget gets a batch of its own). Returns index arrays.
+    """
+    lengths = np.asarray(lengths)
+    order = np.argsort(-lengths, kind="stable")
+    batches, start = [], 0
+    while start < len(order):
+        longest = max(int(lengths[order[start]]), 1)
+        size = max(1, min(max_tokens // longest, max_batch_size))
+        batches.append(order[start:start + size])
+        start += size
+    return batches
+
+
+def padding_efficiency(lengths, batches):
+    """Real tokens / padded tokens over the given batches (1.0 means no padding)."""
+    lengths = np.asarray(lengths)
+    padded = sum(len(b) * int(lengths[b].max()) for b in batches if len(b))
+    return float(lengths.sum() / padded) if padded else 1.0
+
+
+def encode_bucketed(model, texts, max_tokens=TOKEN_BUDGET, max_batch_size=MAX_BATCH_SIZE):
+    """
+    Embeds texts in length-bucketed batches within a padded-token budget.
+    Returns (embeddings in input order, stats) where stats reports throughput
+    and padding efficiency against fixed ENCODE_BATCH_SIZE batches in input order.
+    """
+    start = time.perf_counter()
+    lengths = token_lengths(model, texts)
+    batches = plan_batches(lengths, max_tokens, max_batch_size)
+    dim = model.model_body.get_sentence_embedding_dimension()
+    embeddings = np.empty((len(texts), dim), dtype=np.float32)
+    for batch in batches:
+        embeddings[batch] = encode_texts(model, [texts[i] for i in batch], batch_size=len(batch))
+    elapsed = time.perf_counter() - start
+
+    fixed = [np.arange(i, min(i + ENCODE_BATCH_SIZE, len(texts))) for i in range(0, len(texts), ENCODE_BATCH_SIZE)]
+    stats = {
+        "comments": len(texts),
+        "batches": len(batches),
+        "seconds": elapsed,
+        "comments_per_sec": len(texts) / elapsed if elapsed else float("inf"),
+        "padding_efficiency": padding_efficiency(lengths, batches),
+        "fixed_batch_padding_efficiency": padding_efficiency(lengths, fixed),
+    }
+    return embeddings, stats
+
+
+def predict_head(model, embeddings):
+    """Applies the classification head to precomputed embeddings."""
+    return np.asarray(model.model_head.predict(embeddings))
+
+
+def open_embedding_cache(cache_dir, model_dir, backend="torch"):
+    """
+    Opens the embedding cache namespace for the model saved in model_dir.
+    ONNX backends get their own namespace: their vectors are close to, but not
+    bit-identical with, the torch body's (int8 ones noticeably less so).
+    """
+    fingerprint = model_fingerprint(model_dir)
+    return EmbeddingCache(cache_dir, fingerprint if backend == "torch" else f"{fingerprint}-{backend}")
+
+
+def embed_with_cache(model, texts, cache=None, batch_size=ENCODE_BATCH_SIZE, max_tokens=None, pool=None):
+    """
+    Embeds texts, encoding each distinct normalized text at most once.
+    With a cache, only texts missing from it go through the model body and
+    their vectors are added to it. With max_tokens, the texts to encode are
+    length-bucketed (encode_bucketed); with an InferencePool they are encoded
+    by its worker processes instead. Returns float32 (n, dim) in input order.
+    """
+    keys = text_keys(texts)
+    unique_keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    rows = cache.lookup(unique_keys) if cache is not None else np.full(len(unique_keys), -1)
+    missing = np.flatnonzero(rows < 0)
+
+    to_encode = [texts[first[i]] for i in missing]
+    if not to_encode:
+        dim = cache.dim if cache is not None and cache.dim else model.model_body.get_sentence_embedding_dimension()
+        new_vectors = np.empty((0, dim), dtype=np.float32)
+    elif pool is not None:
+        new_vectors = pool.encode(to_encode)
+    elif max_tokens:
+        new_vectors, stats = encode_bucketed(model, to_encode, max_tokens)
+        logging.info(
+            f"Encoded {stats['comments']} texts in {stats['batches']} batches: "
+            f"{stats['comments_per_sec']:.1f} comments/sec, padding efficiency "
+            f"{stats['padding_efficiency']:.1%} (fixed batches: {stats['fixed_batch_padding_efficiency']:.1%})."
+        )
+    else:
+        new_vectors = encode_texts(model, to_encode, batch_size)
+    unique_vectors = np.empty((len(unique_keys), new_vectors.shape[1]), dtype=np.float32)
+    unique_vectors[missing] = new_vectors
+    hit = np.flatnonzero(rows >= 0)
+    if len(hit):
+        unique_vectors[hit] = cache.get(rows[hit])
+    if cache is not None and len(missing):
+        cache.add(unique_keys[missing], new_vectors)
+
+    logging.info(
+        f"Embedded {len(texts)} texts: {len(unique_keys)} distinct, "
+        f"{len(hit)} from cache, {len(missing)} encoded."
+    )
+    return unique_vectors[inverse.ravel()]
+
+
+def predict_relevance(model, texts, cache=None, batch_size=ENCODE_BATCH_SIZE, max_tokens=None, pool=None):
+    """Relevance predictions for texts, with body embeddings served from the cache where possible."""
+    return predict_head(model, embed_with_cache(model, texts, cache, batch_size, max_tokens, pool))
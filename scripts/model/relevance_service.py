@@ -0,0 +1,244 @@
+"""relevance_service.py
+
+Long-lived local HTTP service that keeps the relevance model resident and
+scores comments on demand. Concurrent requests are coalesced into
+micro-batches: the batching thread takes the first waiting comment, then keeps
+collecting until ``--max-batch`` comments are queued or ``--max-wait-ms`` has
+passed since that first comment, and encodes them in one forward pass.
+
+Endpoints (JSON)
+----------------
+POST /score    {"texts": ["...", ...]} or {"text": "..."}
+               -> {"relevance": [0, 1, ...], "latency_ms": 3.1}
+GET  /metrics  -> p50/p99 latency (ms, per comment, queueing included) over the
+                  last LATENCY_WINDOW comments, queue depth, batch counts
+GET  /health   -> {"status": "ok", "backend": "torch"}
+
+The model is loaded from the local model directory with the Hugging Face hub
+in offline mode, so the service never touches the network.
+
+Usage
+-----
+python -m scripts.model.relevance_service [--port 8765] [--max-batch 64] [--max-wait-ms 5] [--backend onnx]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from scripts.model.relevance_inference import BACKENDS, encode_texts, load_relevance_model, predict_head
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+MODEL_DIR = "models/relevance_setfit_model"
+MAX_BATCH_SIZE = 64
+MAX_WAIT_MS = 5.0
+LATENCY_WINDOW = 10000 # comments kept for the latency percentiles
+MAX_TEXTS_PER_REQUEST = 1000
+
+
+class MicroBatcher:
+    """
+    Coalesces single-comment submissions into batches for predict_batch
+    (list of texts -> sequence of labels), which runs on one background thread.
+    ``submit(text)`` returns a Future with the label.
+    """
+
+    def __init__(self, predict_batch, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.comments = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text):
+        future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future
+
+    def _collect(self):
+        """Blocks for the first item, then gathers more until the batch is full or the deadline passes."""
+        try:
+            batch = [self._queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._collect()
+            if not batch:
+                continue
+            texts = [text for text, _, _ in batch]
+            try:
+                labels = list(self.predict_batch(texts))
+                if len(labels) != len(texts):
+                    raise ValueError(f"predict_batch returned {len(labels)} labels for {len(texts)} texts")
+            except Exception as e:
+                logging.exception("Scoring a batch failed.")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            done = time.perf_counter()
+            with self._lock:
+                self.batches += 1
+                self.comments += len(batch)
+                self._latencies.extend(done - submitted for _, _, submitted in batch)
+            for (_, future, _), label in zip(batch, labels):
+                future.set_result(label)
+
+    def stats(self):
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000
+            batches, comments = self.batches, self.comments
+        return {
+            "queue_depth": self._queue.qsize(),
+            "batches": batches,
+            "comments": comments,
+            "mean_batch_size": comments / batches if batches else 0.0,
+            "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else None,
+            "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else None,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+    def close(self):
+        self._stopped.set()
+        self._thread.join()
+
+
+def model_predictor(model):
+    """Batch predict function for a loaded relevance model (body + head, no embedding cache)."""
+
+    def predict_batch(texts):
+        return predict_head(model, encode_texts(model, texts, batch_size=len(texts))).tolist()
+
+    return predict_batch
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "ScoringServer"
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send(200, self.server.batcher.stats())
+        elif self.path == "/health":
+            self._send(200, {"status": "ok", "backend": self.server.backend})
+        else:
+            self._send(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/score":
+            self._send(404, {"error": f"unknown path {self.path}"})
+            return
+        start = time.perf_counter()
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            texts = payload["texts"] if "texts" in payload else [payload["text"]]
+            if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+                raise ValueError("texts must be a list of strings")
+            if len(texts) > MAX_TEXTS_PER_REQUEST:
+                raise ValueError(f"at most {MAX_TEXTS_PER_REQUEST} texts per request")
+        except (ValueError, KeyError, TypeError) as e:
+            self._send(400, {"error": f"bad request: {e}"})
+            return
+        futures = [self.server.batcher.submit(text) for text in texts]
+        try:
+            labels = [int(f.result()) for f in futures]
+        except Exception as e:
+            self._send(500, {"error": str(e)})
+            return
+        self._send(200, {"relevance": labels, "latency_ms": 1000 * (time.perf_counter() - start)})
+
+    def log_message(self, format, *args):
+        pass # one line per request would swamp the log
+
+
+class ScoringServer(ThreadingHTTPServer):
+    """Threaded HTTP server whose handlers share one MicroBatcher."""
+
+    daemon_threads = True
+    request_queue_size = 128 # listen backlog; the default of 5 resets bursts of concurrent clients
+
+    def __init__(self, address, batcher, backend="torch"):
+        super().__init__(address, _Handler)
+        self.batcher = batcher
+        self.backend = backend
+
+
+def _parse_args() -> argparse.Namespace:
+    ap = argparse.ArgumentParser(description="Serve relevance predictions over local HTTP with micro-batching.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--model-dir", default=MODEL_DIR)
+    ap.add_argument("--backend", choices=BACKENDS, default="torch")
+    ap.add_argument("--max-batch", type=int, default=MAX_BATCH_SIZE, help="Largest micro-batch")
+    ap.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS,
+                    help="How long the first queued comment may wait for others to join its batch")
+    ap.add_argument("--torch-threads", type=int, default=0, help="torch intra-op threads (0 keeps the default)")
+    return ap.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    # Local model directory only: never reach for the Hugging Face hub
+    os.environ["HF_HUB_OFFLINE"] = "1"
+    os.environ["TRANSFORMERS_OFFLINE"] = "1"
+    if args.torch_threads and args.backend == "torch":
+        import torch
+
+        torch.set_num_threads(args.torch_threads)
+
+    logging.info(f"Loading model from {args.model_dir} ({args.backend} backend)")
+    model = load_relevance_model(args.model_dir, args.backend)
+    predict_batch = model_predictor(model)
+    predict_batch(["warm-up"])
+
+    batcher = MicroBatcher(predict_batch, args.max_batch, args.max_wait_ms)
+    server = ScoringServer((args.host, args.port), batcher, args.backend)
+    logging.info(f"Serving on http://{args.host}:{server.server_port} "
+                 f"(max batch {args.max_batch}, max wait {args.max_wait_ms} ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
+        logging.info(f"Final metrics: {batcher.stats()}")
+
+
+if __name__ == "__main__":
+    main()
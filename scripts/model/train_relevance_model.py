@@ -1,17 +1,21 @@
 # scripts/modeling/train_relevance_model.py
+import argparse
+import hashlib
 import pandas as pd
-from datasets import Dataset
-from setfit import SetFitModel, SetFitTrainer, TrainingArguments
-from sklearn.model_selection import train_test_split
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import GridSearchCV, StratifiedKFold, train_test_split
 from sklearn.metrics import classification_report, precision_recall_fscore_support, accuracy_score
 import logging
 import os
 
+from scripts.model.embedding_cache import EmbeddingCache, model_fingerprint
+from scripts.model.relevance_inference import embed_with_cache
+
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # --- Configuration ---
-DATA_PATH = "data/annotate/complete/combined_annotations.csv"
+DATA_PATH = "data/annotate/complete/combined_relevance_annotations.csv"
 MODEL_SAVE_PATH = "models/relevance_setfit_model"
 TEXT_COLUMN = "full_text"
 LABEL_COLUMN = "relevance_label"
@@ -22,49 +26,12 @@ NUM_EPOCHS_BODY = 1 # SetFit typically requires very few epochs for the body
 NUM_EPOCHS_HEAD = 16 # More epochs usually needed for the classification head
 BATCH_SIZE = 16
 LEARNING_RATE = 2e-5
-
-# --- Load Data ---
-logging.info(f"Loading data from {DATA_PATH}")
-try:
-    df = pd.read_csv(DATA_PATH, usecols=[TEXT_COLUMN, LABEL_COLUMN])
-    logging.info(f"Loaded {len(df)} rows.")
-except FileNotFoundError:
-    logging.error(f"Error: Data file not found at {DATA_PATH}")
-    exit()
-except Exception as e:
-    logging.error(f"Error loading data: {e}")
-    exit()
-
-# --- Preprocess Data ---
-logging.info("Preprocessing data...")
-# Handle potential NaN values
-df.dropna(subset=[TEXT_COLUMN, LABEL_COLUMN], inplace=True)
-# Ensure label is integer
-df[LABEL_COLUMN] = df[LABEL_COLUMN].astype(int)
-# Ensure text is string
-df[TEXT_COLUMN] = df[TEXT_COLUMN].astype(str)
-# Rename label column for SetFit compatibility
-df.rename(columns={LABEL_COLUMN: "label", TEXT_COLUMN: "text"}, inplace=True)
-logging.info(f"Data preprocessed. {len(df)} rows remaining after handling NaNs.")
-logging.info(f"Label distribution:\n{df['label'].value_counts(normalize=True)}")
-
-if len(df) == 0:
-    logging.error("No data remaining after preprocessing. Exiting.")
-    exit()
-
-# --- Split Data ---
-logging.info(f"Splitting data (test_size={TEST_SIZE}, random_state={RANDOM_STATE})")
-train_df, eval_df = train_test_split(
-    df,
-    test_size=TEST_SIZE,
-    random_state=RANDOM_STATE,
-    stratify=df['label'] # Stratify to maintain label distribution
-)
-logging.info(f"Train set size: {len(train_df)}, Evaluation set size: {len(eval_df)}")
-
-# Convert to Hugging Face Dataset
-train_dataset = Dataset.from_pandas(train_df, preserve_index=False)
-eval_dataset = Dataset.from_pandas(eval_df, preserve_index=False)
+# Head-only search (--head-search): LogisticRegression grid, cross-validated on cached body embeddings
+HEAD_GRID = {"C": [0.01, 0.1, 1.0, 10.0, 100.0], "class_weight": [None, "balanced"]}
+HEAD_BASE_PARAMS = {"max_iter": 1000} # fixed for every grid point and passed on to the fine-tune
+CV_FOLDS = 5
+EMBEDDING_CACHE_DIR = "data/derived/embedding_cache"
+HEAD_SEARCH_PATH = "data/derived/relevance_head_search.csv"
 
 # --- Define Metrics ---
 def compute_metrics(y_pred, y_true):
@@ -78,60 +45,191 @@ def compute_metrics(y_pred, y_true):
         'recall': recall
     }
 
-# --- Model Training ---
-logging.info(f"Initializing SetFit model with base: {BASE_MODEL_ID}")
-model = SetFitModel.from_pretrained(BASE_MODEL_ID)
-
-logging.info("Initializing SetFitTrainer...")
-trainer = SetFitTrainer(
-    model=model,
-    batch_size=BATCH_SIZE,
-    train_dataset=train_dataset,
-    eval_dataset=eval_dataset,
-    metric=compute_metrics, # Use custom metrics function
-)
-
-logging.info("Starting training...")
-trainer.train(
-    num_epochs=NUM_EPOCHS_BODY, # Body epochs go here
-    learning_rate=LEARNING_RATE,
-    num_epochs_classification_head=NUM_EPOCHS_HEAD
-)
-logging.info("Training finished.")
-
-# --- Evaluation ---
-logging.info("Evaluating model on the evaluation set...")
-# Use the trainer's evaluation method which applies the trained head
-evaluation_results = trainer.evaluate() # evaluate() uses the eval_dataset defined in trainer
-logging.info(f"Evaluation results (Trainer): {evaluation_results}")
-
-# For a more detailed report
-logging.info("Generating detailed classification report...")
-y_true = eval_dataset["label"]
-# Ensure the model used for prediction has the trained classification head
-final_model = trainer.model
-y_pred = final_model.predict(eval_dataset["text"])
-
-try:
-    report = classification_report(y_true, y_pred, target_names=[f"Class {i}" for i in sorted(df['label'].unique())])
-    logging.info(f"Classification Report:\n{report}")
-except Exception as e:
-    logging.error(f"Could not generate classification report: {e}")
-
-
-# --- Save Model ---
-logging.info(f"Saving model to {MODEL_SAVE_PATH}")
-# Ensure the directory exists
-os.makedirs(MODEL_SAVE_PATH, exist_ok=True)
-# Save the final model from the trainer
-final_model.save_pretrained(MODEL_SAVE_PATH)
-logging.info("Model saved successfully.")
-
-print(f"\n--- Training Summary ---")
-print(f"Model trained: {BASE_MODEL_ID}")
-print(f"Training data size: {len(train_df)}")
-print(f"Evaluation data size: {len(eval_df)}")
-print(f"Evaluation Accuracy (from Trainer): {evaluation_results.get('accuracy', 'N/A'):.4f}")
-print(f"Evaluation F1 (weighted, from Trainer): {evaluation_results.get('f1', 'N/A'):.4f}")
-print(f"Model saved to: {MODEL_SAVE_PATH}")
-print("------------------------")
\ No newline at end of file
+def load_annotations(path=DATA_PATH):
+    """Loads the annotation CSV as a frame with 'text' (str) and 'label' (int) columns."""
+    df = pd.read_csv(path, usecols=[TEXT_COLUMN, LABEL_COLUMN])
+    # Handle potential NaN values
+    df.dropna(subset=[TEXT_COLUMN, LABEL_COLUMN], inplace=True)
+    # Ensure label is integer
+    df[LABEL_COLUMN] = df[LABEL_COLUMN].astype(int)
+    # Ensure text is string
+    df[TEXT_COLUMN] = df[TEXT_COLUMN].astype(str)
+    # Rename label column for SetFit compatibility
+    return df.rename(columns={LABEL_COLUMN: "label", TEXT_COLUMN: "text"})
+
+def split_annotations(df, test_size=TEST_SIZE, random_state=RANDOM_STATE):
+    """The stratified train/evaluation split used for the saved model."""
+    return train_test_split(
+        df,
+        test_size=test_size,
+        random_state=random_state,
+        stratify=df['label'] # Stratify to maintain label distribution
+    )
+
+def body_fingerprint(body):
+    """Embedding-cache namespace for a body: model_fingerprint for a local directory, else a hash of the hub id."""
+    if os.path.isdir(body):
+        return model_fingerprint(body)
+    return "hub-" + hashlib.sha256(body.encode("utf-8")).hexdigest()[:16]
+
+def embed_annotations(texts, body=BASE_MODEL_ID, cache_dir=EMBEDDING_CACHE_DIR):
+    """Body embeddings of texts, computed once per text and body and then served from the embedding cache."""
+    from setfit import SetFitModel
+
+    model = SetFitModel.from_pretrained(body)
+    cache = EmbeddingCache(cache_dir, body_fingerprint(body)) if cache_dir else None
+    embeddings = embed_with_cache(model, list(texts), cache)
+    if cache is not None:
+        logging.info(f"Embedding cache: {cache.stats()}")
+    return embeddings
+
+def search_head(X, y, grid=HEAD_GRID, folds=CV_FOLDS, random_state=RANDOM_STATE, n_jobs=-1):
+    """
+    Cross-validates LogisticRegression heads over grid on fixed embeddings X.
+    Returns (results frame sorted by mean weighted F1, best parameters).
+    """
+    search = GridSearchCV(
+        LogisticRegression(**HEAD_BASE_PARAMS),
+        grid,
+        scoring="f1_weighted",
+        cv=StratifiedKFold(n_splits=folds, shuffle=True, random_state=random_state),
+        n_jobs=n_jobs,
+    )
+    search.fit(X, y)
+    results = pd.DataFrame(search.cv_results_)
+    results = results[["params", "mean_test_score", "std_test_score", "mean_fit_time", "rank_test_score"]]
+    return results.sort_values("rank_test_score", kind="stable").reset_index(drop=True), search.best_params_
+
+def run_head_search(train_df, eval_df, body, cache_dir, folds):
+    """Grid-searches the head on cached embeddings of train_df, reports it on eval_df and returns the best parameters."""
+    logging.info(f"Embedding {len(train_df) + len(eval_df)} annotations with {body}...")
+    X = embed_annotations(pd.concat([train_df["text"], eval_df["text"]]), body, cache_dir)
+    X_train, X_eval = X[:len(train_df)], X[len(train_df):]
+
+    logging.info(f"Searching head grid {HEAD_GRID} with {folds}-fold CV...")
+    results, best_params = search_head(X_train, train_df["label"].to_numpy(), folds=folds)
+    os.makedirs(os.path.dirname(HEAD_SEARCH_PATH), exist_ok=True)
+    results.to_csv(HEAD_SEARCH_PATH, index=False)
+    logging.info(f"Head search results (saved to {HEAD_SEARCH_PATH}):\n{results.to_string()}")
+
+    head_params = {**HEAD_BASE_PARAMS, **best_params}
+    head = LogisticRegression(**head_params).fit(X_train, train_df["label"])
+    eval_metrics = compute_metrics(head.predict(X_eval), eval_df["label"])
+    logging.info(f"Best head {best_params} on the evaluation set (body not fine-tuned): {eval_metrics}")
+    return head_params
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Train the SetFit relevance model.")
+    parser.add_argument("--head-search", action="store_true",
+                        help="Grid-search the classification head on cached body embeddings first, "
+                             "then fine-tune with the best head parameters")
+    parser.add_argument("--search-only", action="store_true", help="With --head-search, stop before fine-tuning")
+    parser.add_argument("--body", default=BASE_MODEL_ID,
+                        help="Body that embeds the annotations for the head search (hub id or local model directory)")
+    parser.add_argument("--folds", type=int, default=CV_FOLDS, help="Cross-validation folds for the head search")
+    parser.add_argument("--no-cache", action="store_true", help="Embed without the embedding cache")
+    return parser.parse_args()
+
+def main():
+    args = _parse_args()
+
+    # --- Load Data ---
+    logging.info(f"Loading data from {DATA_PATH}")
+    logging.info("Preprocessing data...")
+    try:
+        df = load_annotations(DATA_PATH)
+        logging.info(f"Loaded {len(df)} rows.")
+    except FileNotFoundError:
+        logging.error(f"Error: Data file not found at {DATA_PATH}")
+        exit()
+    except Exception as e:
+        logging.error(f"Error loading data: {e}")
+        exit()
+    logging.info(f"Data preprocessed. {len(df)} rows remaining after handling NaNs.")
+    logging.info(f"Label distribution:\n{df['label'].value_counts(normalize=True)}")
+
+    if len(df) == 0:
+        logging.error("No data remaining after preprocessing. Exiting.")
+        exit()
+
+    # --- Split Data ---
+    logging.info(f"Splitting data (test_size={TEST_SIZE}, random_state={RANDOM_STATE})")
+    train_df, eval_df = split_annotations(df)
+    logging.info(f"Train set size: {len(train_df)}, Evaluation set size: {len(eval_df)}")
+
+    # --- Head Search (optional) ---
+    head_params = {}
+    if args.head_search:
+        head_params = run_head_search(train_df, eval_df, args.body, None if args.no_cache else EMBEDDING_CACHE_DIR,
+                                      args.folds)
+        if args.search_only:
+            return
+
+    from datasets import Dataset
+    from setfit import SetFitModel, SetFitTrainer
+
+    # Convert to Hugging Face Dataset
+    train_dataset = Dataset.from_pandas(train_df, preserve_index=False)
+    eval_dataset = Dataset.from_pandas(eval_df, preserve_index=False)
+
+    # --- Model Training ---
+    logging.info(f"Initializing SetFit model with base: {BASE_MODEL_ID} (head parameters: {head_params or 'defaults'})")
+    model = SetFitModel.from_pretrained(BASE_MODEL_ID, head_params=head_params)
+
+    logging.info("Initializing SetFitTrainer...")
+    trainer = SetFitTrainer(
+        model=model,
+        batch_size=BATCH_SIZE,
+        train_dataset=train_dataset,
+        eval_dataset=eval_dataset,
+        metric=compute_metrics, # Use custom metrics function
+    )
+
+    logging.info("Starting training...")
+    trainer.train(
+        num_epochs=NUM_EPOCHS_BODY, # Body epochs go here
+        learning_rate=LEARNING_RATE,
+        num_epochs_classification_head=NUM_EPOCHS_HEAD
+    )
+    logging.info("Training finished.")
+
+    # --- Evaluation ---
+    logging.info("Evaluating model on the evaluation set...")
+    # Use the trainer's evaluation method which applies the trained head
+    evaluation_results = trainer.evaluate() # evaluate() uses the eval_dataset defined in trainer
+    logging.info(f"Evaluation results (Trainer): {evaluation_results}")
+
+    # For a more detailed report
+    logging.info("Generating detailed classification report...")
+    y_true = eval_dataset["label"]
+    # Ensure the model used for prediction has the trained classification head
+    final_model = trainer.model
+    y_pred = final_model.predict(eval_dataset["text"])
+
+    try:
+        report = classification_report(y_true, y_pred, target_names=[f"Class {i}" for i in sorted(df['label'].unique())])
+        logging.info(f"Classification Report:\n{report}")
+    except Exception as e:
+        logging.error(f"Could not generate classification report: {e}")
+
+
+    # --- Save Model ---
+    logging.info(f"Saving model to {MODEL_SAVE_PATH}")
+    # Ensure the directory exists
+    os.makedirs(MODEL_SAVE_PATH, exist_ok=True)
+    # Save the final model from the trainer
+    final_model.save_pretrained(MODEL_SAVE_PATH)
+    logging.info("Model saved successfully.")
+
+    print(f"\n--- Training Summary ---")
+    print(f"Model trained: {BASE_MODEL_ID}")
+    print(f"Training data size: {len(train_df)}")
+    print(f"Evaluation data size: {len(eval_df)}")
+    print(f"Evaluation Accuracy (from Trainer): {evaluation_results.get('accuracy', 'N/A'):.4f}")
+    print(f"Evaluation F1 (weighted, from Trainer): {evaluation_results.get('f1', 'N/A'):.4f}")
+    print(f"Model saved to: {MODEL_SAVE_PATH}")
+    print("------------------------")
+
+
+if __name__ == "__main__":
+    main()
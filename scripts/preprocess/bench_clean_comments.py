@@ -0,0 +1,68 @@
+"""bench_clean_comments.py
+
+Benchmark the readability filter of clean_comments.py: ``readable_mask`` on a
+Series against the per-row ``is_readable_comment`` apply it replaces, on a
+synthetic column of cleaned comments (mostly readable text plus placeholder-,
+emoji-alias- and punctuation-only rows). Both must give the same mask.
+
+Usage
+-----
+python -m scripts.preprocess.bench_clean_comments [--rows 200000] [--repeat 3]
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from scripts.preprocess.clean_comments import is_readable_comment, readable_mask
+
+SAMPLE_TEXTS = [
+    "go woke go broke", "love dei, renewing my membership <url>", "<mention> thank you target!",
+    ":red_heart: :red_heart:", "<url>", "!!! ???", "ok", ":thumbs_up: great news", "none", "",
+]
+
+
+def make_texts(n_rows: int, seed: int = 0) -> pd.Series:
+    """Cleaned-comment Series drawn from SAMPLE_TEXTS, with a suffix so rows are not all identical."""
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(SAMPLE_TEXTS), n_rows)
+    suffixes = rng.integers(0, 3, n_rows)
+    return pd.Series([SAMPLE_TEXTS[p] + " x" * s for p, s in zip(picks, suffixes)], dtype=object)
+
+
+def _best_time(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _parse_args() -> argparse.Namespace:
+    ap = argparse.ArgumentParser(description="Benchmark readable_mask against the per-row apply.")
+    ap.add_argument("--rows", type=int, default=200_000, help="Number of synthetic comments")
+    ap.add_argument("--repeat", type=int, default=3, help="Timed runs per variant (best is reported)")
+    ap.add_argument("--seed", type=int, default=0)
+    return ap.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    texts = make_texts(args.rows, args.seed)
+    if not readable_mask(texts).equals(texts.apply(is_readable_comment).astype(bool)):
+        raise SystemExit("readable_mask disagrees with is_readable_comment")
+
+    scalar = _best_time(lambda: texts.apply(is_readable_comment), args.repeat)
+    vector = _best_time(lambda: readable_mask(texts), args.repeat)
+    print(f"{len(texts)} comments, best of {args.repeat}")
+    print(f"{'apply(is_readable_comment)':>28} {scalar:>8.3f}s")
+    print(f"{'readable_mask':>28} {vector:>8.3f}s ({scalar / vector:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""bench_graph_features.py
+
+Benchmark ``calculate_graph_features`` across worker counts on a synthetic
+corpus whose thread sizes follow a heavy-tailed (Pareto) distribution, i.e.
+a few viral posts carry most of the comments, as in the Target data.
+
+With ``--incremental FRACTION`` it instead times a cold run against a warm
+run of the incremental cache after new replies land on that fraction of posts.
+
+Usage
+-----
+python -m scripts.preprocess.bench_graph_features [--posts 2000] [--comments 500000]
+    [--engine networkx] [--workers 1 2 4 8] [--incremental 0.02]
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from scripts.preprocess.graph_features import ENGINES, LOGGER, calculate_graph_features
+
+
+def make_synthetic_corpus(n_posts: int, n_comments: int, seed: int = 0) -> pd.DataFrame:
+    """Return a comment frame with Pareto-distributed thread sizes.
+
+    Roughly a third of comments are top-level; replies attach to a random
+    earlier comment of the same post, so trees are shallow but bushy.
+    """
+    rng = np.random.default_rng(seed)
+    weights = rng.pareto(1.2, n_posts) + 1
+    sizes = np.maximum(1, np.round(weights / weights.sum() * n_comments)).astype(int)
+
+    post_idx = np.repeat(np.arange(n_posts), sizes)
+    offsets = np.concatenate([np.arange(s) for s in sizes])
+    starts = np.repeat(np.cumsum(sizes) - sizes, sizes)
+
+    ids = np.array([f"c{i}" for i in range(len(post_idx))], dtype=object)
+    parent_pos = starts + (rng.random(len(post_idx)) * offsets).astype(int)
+    is_root = (offsets == 0) | (rng.random(len(post_idx)) < 0.33)
+    parent_id = np.where(is_root, "", ids[parent_pos])
+
+    post_date = pd.Timestamp("2025-01-01") + pd.to_timedelta(post_idx, unit="h")
+    comment_date = post_date + pd.to_timedelta(offsets * 60 + rng.integers(0, 60, len(post_idx)), unit="s")
+    return pd.DataFrame(
+        {
+            "company_name": "Target",
+            "post_date": post_date,
+            "id": ids,
+            "parent_id": parent_id,
+            "comment_date": comment_date,
+        }
+    )
+
+
+def _parse_args() -> argparse.Namespace:
+    ap = argparse.ArgumentParser(description="Benchmark graph feature computation across worker counts.")
+    ap.add_argument("--posts", type=int, default=2000, help="Number of synthetic posts")
+    ap.add_argument("--comments", type=int, default=500_000, help="Approximate number of synthetic comments")
+    ap.add_argument("--engine", choices=ENGINES, default="networkx", help="Feature engine to benchmark")
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="Worker counts to time")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument(
+        "--incremental",
+        type=float,
+        default=None,
+        metavar="FRACTION",
+        help="Benchmark the incremental cache with this fraction of posts receiving new replies",
+    )
+    return ap.parse_args()
+
+
+def _bench_incremental(df: pd.DataFrame, engine: str, fraction: float, seed: int) -> None:
+    rng = np.random.default_rng(seed)
+    posts = df["post_date"].unique()
+    touched = rng.choice(posts, max(1, int(len(posts) * fraction)), replace=False)
+    replies = df[df["post_date"].isin(touched)].groupby("post_date").head(1).copy()
+    replies["parent_id"] = replies["id"]
+    replies["id"] = [f"new{i}" for i in range(len(replies))]
+    updated = pd.concat([df, replies], ignore_index=True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = Path(tmp) / "graph_cache.parquet"
+        start = time.perf_counter()
+        calculate_graph_features(df, engine=engine, cache_path=cache)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        calculate_graph_features(updated, engine=engine, cache_path=cache)
+        warm = time.perf_counter() - start
+    print(f"{len(touched)} of {len(posts)} posts touched")
+    print(f"cold run {cold:.2f}s, incremental run {warm:.2f}s ({cold / warm:.1f}x faster)")
+
+
+def main() -> None:
+    args = _parse_args()
+    df = make_synthetic_corpus(args.posts, args.comments, args.seed)
+    sizes = df.groupby("post_date").size()
+    print(
+        f"Corpus: {len(df)} comments in {len(sizes)} posts "
+        f"(largest {sizes.max()}, median {int(sizes.median())}); engine={args.engine}"
+    )
+
+    # per-post INFO logging would dominate the timings
+    LOGGER.setLevel(logging.WARNING)
+    if args.incremental is not None:
+        _bench_incremental(df, args.engine, args.incremental, args.seed)
+        return
+
+    baseline = None
+    print(f"{'workers':>8} {'seconds':>9} {'speedup':>8}")
+    for n in args.workers:
+        start = time.perf_counter()
+        calculate_graph_features(df, engine=args.engine, workers=n)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(f"{n:>8} {elapsed:>9.2f} {baseline / elapsed:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
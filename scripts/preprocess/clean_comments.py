@@ -1,12 +1,49 @@
+import numpy as np
 import pandas as pd
-from pathlib import Path
 import typer
 import re
 import emoji
 import string
 import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+
+from scripts.frame_io import (
+    DEFAULT_FORMAT,
+    ChunkedFrameWriter,
+    artifact_path,
+    frame_columns,
+    iter_frames,
+    read_frame,
+    write_frame,
+)
 
 # --- Text Cleaning Logic ---
+_URL_RE = re.compile(r"https?://\S+")
+_MENTION_RE = re.compile(r"@\w+")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Keep letters, numbers, standard punc, whitespace, colons, < >
+_ALLOWED_CHARS = frozenset(string.ascii_lowercase + string.digits + string.punctuation + string.whitespace + ":<>")
+
+class _DeletionTable(dict):
+    """str.translate table that deletes every character outside _ALLOWED_CHARS.
+
+    Allowed characters map to themselves; any other code point is added as a
+    deletion entry the first time it is seen.
+    """
+    def __missing__(self, codepoint):
+        self[codepoint] = None
+        return None
+
+_DELETE_DISALLOWED = _DeletionTable({ord(c): ord(c) for c in _ALLOWED_CHARS})
+
+CLEAN_CHUNK_SIZE = 5_000  # texts per task when cleaning in a process pool
+STREAM_CHUNK_ROWS = 50_000  # default rows per chunk for stream_clean
+
+# Text columns read as strings from CSV (by main and stream_clean alike) so an
+# all-empty chunk is not inferred as float and numeric-looking ids stay strings
+TEXT_DTYPES = {"id": str, "parent_id": str, "comment_text": str, "root_id": str, "source_post_id": str}
+
 def _clean_text(txt: str) -> str:
     """Applies cleaning steps to comment text."""
     if not isinstance(txt, str):
@@ -23,22 +60,42 @@ def _clean_text(txt: str) -> str:
     txt = txt.lower()
 
     # 3. Replace URLs/Mentions
-    txt = re.sub(r"https?://\S+", "<url>", txt)
-    txt = re.sub(r"@\w+", "<mention>", txt)
+    txt = _URL_RE.sub("<url>", txt)
+    txt = _MENTION_RE.sub("<mention>", txt)
 
-    # 4. Demojize (handles emojis)
-    txt = emoji.demojize(txt, delimiters=(" :", ": "))
+    # 4. Demojize (handles emojis); no emoji is pure ASCII, so skip the lookup there
+    if not txt.isascii():
+        txt = emoji.demojize(txt, delimiters=(" :", ": "))
 
-    # 5. Character Filtering (Keep letters, numbers, standard punc, whitespace, colons, < >)
-    # Define allowed characters explicitly
-    allowed_chars = string.ascii_lowercase + string.digits + string.punctuation + string.whitespace + ":<>"
-    # Remove characters not in the allowed set
-    txt = ''.join(c for c in txt if c in allowed_chars)
+    # 5. Character Filtering: delete characters not in the allowed set
+    txt = txt.translate(_DELETE_DISALLOWED)
     
     # 6. Normalize whitespace (after potential character removals)
-    txt = re.sub(r"\s+", " ", txt)
+    txt = _WHITESPACE_RE.sub(" ", txt)
     return txt.strip()
 
+def _clean_chunk(texts: list) -> list[str]:
+    return [_clean_text(t) for t in texts]
+
+def clean_texts(texts, workers: int = 1, chunk_size: int = CLEAN_CHUNK_SIZE):
+    """Cleans a Series or list of texts with _clean_text.
+
+    With workers > 1 the texts are split into chunk_size chunks that are cleaned
+    in a process pool. Returns a Series with the same index for a Series input,
+    otherwise a list.
+    """
+    values = list(texts)
+    if workers > 1 and len(values) > chunk_size:
+        chunks = [values[i:i + chunk_size] for i in range(0, len(values), chunk_size)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            cleaned = [t for chunk in pool.map(_clean_chunk, chunks) for t in chunk]
+    else:
+        cleaned = _clean_chunk(values)
+
+    if isinstance(texts, pd.Series):
+        return pd.Series(cleaned, index=texts.index, name=texts.name, dtype=object)
+    return cleaned
+
 # --- Ancestor-based full_text Construction ---
 def build_full_text(row, parent_map: dict, text_map: dict) -> str:
     """Prepend up to two cleaned-ancestor texts to the current comment."""
@@ -53,7 +110,54 @@ def build_full_text(row, parent_map: dict, text_map: dict) -> str:
     grandparent_text = text_map[pid2]
     return f"{grandparent_text} → {parent_text} → {cleaned}"
 
+FULL_TEXT_SEP = " → "
+
+def _parent_positions(ids, parent_ids) -> np.ndarray:
+    """Row position of each row's parent (-1 if none); a duplicated id resolves to its last row."""
+    positions = pd.Series(np.arange(len(ids)), index=np.asarray(ids, dtype=object))
+    positions = positions[~positions.index.duplicated(keep="last")]
+    parent = pd.Series(np.asarray(parent_ids, dtype=object))
+    parent_pos = parent.map(positions).where(parent.notna() & parent.ne(""))
+    return parent_pos.fillna(-1).to_numpy(dtype=np.int64)
+
+def _ancestor_texts(cleaned: np.ndarray, parent_pos: np.ndarray, rows: np.ndarray, depth: int) -> np.ndarray:
+    """full_text for the rows at positions `rows`, gathering up to `depth` ancestors.
+
+    Each step gathers the next ancestor's cleaned text for the rows that still
+    have one, so the loop ends at the deepest thread however large `depth` is.
+    """
+    full = cleaned[rows]
+    ancestor = parent_pos[rows]
+    active = np.flatnonzero(ancestor >= 0)
+    for _ in range(depth):
+        if active.size == 0:
+            break
+        anc = ancestor[active]
+        full[active] = cleaned[anc] + FULL_TEXT_SEP + full[active]
+        ancestor[active] = parent_pos[anc]
+        active = active[ancestor[active] >= 0]
+    return full
+
+def build_full_texts(df: pd.DataFrame, depth: int = 2) -> pd.Series:
+    """Vectorized build_full_text for a whole frame, with up to `depth` ancestors.
+
+    Parent links are resolved to row positions once and ancestor texts are
+    gathered from an array. As with the dict maps, a duplicated id resolves to
+    its last row.
+    """
+    cleaned = df["cleaned_text"].to_numpy(dtype=object)
+    if "parent_id" not in df.columns or depth < 1:
+        return pd.Series(cleaned.copy(), index=df.index, dtype=object)
+
+    parent_pos = _parent_positions(df["id"], df["parent_id"])
+    full = _ancestor_texts(cleaned, parent_pos, np.arange(len(df)), depth)
+    return pd.Series(full, index=df.index, dtype=object)
+
 # --- Readability Filtering Logic (SIMPLIFIED + Refined Symbol Check v3) ---
+_PLACEHOLDER_RE = re.compile(r"<url>|<mention>")
+_EMOJI_ALIAS_RE = re.compile(r":([a-zA-Z0-9_]+):")
+_PUNCT_WS_RE = re.compile(r"[" + re.escape(string.punctuation + string.whitespace) + r"]*")
+
 def is_readable_comment(text: str) -> bool:
     """Checks if a cleaned comment has basic validity and meaningful content beyond placeholders/emojis."""
     # 1. Basic validity checks
@@ -65,7 +169,7 @@ def is_readable_comment(text: str) -> bool:
     if len(low) <= 2: return False
 
     # 2. Check for placeholder-only comments
-    cleaned_no_placeholders = re.sub(r"<url>|<mention>", "", text).strip()
+    cleaned_no_placeholders = _PLACEHOLDER_RE.sub("", text).strip()
     if not cleaned_no_placeholders:
         return False
     if low == "<url>" or low == "<mention>": 
@@ -75,7 +179,7 @@ def is_readable_comment(text: str) -> bool:
     # Start with text after removing placeholders
     temp_text = cleaned_no_placeholders
     # Remove demojized emoji patterns like :word:
-    text_no_emojis = re.sub(r":([a-zA-Z0-9_]+):", "", temp_text).strip()
+    text_no_emojis = _EMOJI_ALIAS_RE.sub("", temp_text).strip()
 
     # If nothing is left after removing placeholders and emoji patterns, filter
     if not text_no_emojis:
@@ -84,8 +188,7 @@ def is_readable_comment(text: str) -> bool:
 
     # Optional: Check again for only punctuation/whitespace remaining *after* emoji removal
     # This catches cases like ":)" or "!!! " which might have been left
-    # Use re.escape to handle punctuation safely in the character set
-    if re.fullmatch(r"[" + re.escape(string.punctuation + string.whitespace) + r"]*", text_no_emojis):
+    if _PUNCT_WS_RE.fullmatch(text_no_emojis):
          # print(f"Filtering: Only punctuation/whitespace left after emoji removal in '{text}' -> '{text_no_emojis}'")
           return False
 
@@ -94,24 +197,88 @@ def is_readable_comment(text: str) -> bool:
     # Passed all filters
     return True
 
-def main(src: str, out_dir: str):
-    """Phase 3: Text Preprocessing, Thread Creation & Filtering"""
-    # Load data
-    df = pd.read_csv(src)
+_HAS_CONTENT_RE = re.compile(r"[^" + re.escape(string.punctuation + string.whitespace) + r"]")
 
-    # Step 3a: Clean the comment_text field
-    df["cleaned_text"] = df["comment_text"].apply(_clean_text)
+def _is_readable_fast(text) -> bool:
+    """is_readable_comment with the substitutions skipped when they cannot match."""
+    if not isinstance(text, str):
+        if pd.isna(text): return False
+        text = str(text)
+    text = text.strip()
+    low = text.lower()
+    if len(low) <= 2 or low in ("none", "nan", "<url>", "<mention>"): return False
+    if "<" in text:
+        text = _PLACEHOLDER_RE.sub("", text).strip()
+    if ":" in text:
+        text = _EMOJI_ALIAS_RE.sub("", text).strip()
+    # Readable iff something other than punctuation/whitespace is left
+    return _HAS_CONTENT_RE.search(text) is not None
+
+def readable_mask(texts: pd.Series) -> pd.Series:
+    """Series version of is_readable_comment: a boolean mask with the same index."""
+    return pd.Series([_is_readable_fast(t) for t in texts.tolist()], index=texts.index, dtype=bool)
 
-    # Build lookup maps
-    parent_map = df.set_index("id")["parent_id"].to_dict() # Restored
-    text_map = df.set_index("id")["cleaned_text"].to_dict() # Restored
+def stream_clean(src: str, out_path, chunk_rows: int = STREAM_CHUNK_ROWS, workers: int = 1, context_depth: int = 2) -> int:
+    """Chunked clean → thread → filter, writing the same rows and columns as main.
+
+    Pass 1 reads only id, parent_id and comment_text, cleans the text and keeps
+    a compact ancestor store: the cleaned text of every row plus the row
+    position of its parent. Pass 2 re-reads the input chunk by chunk, serves
+    full_text from the store, filters and appends to out_path. Only the store
+    spans the corpus; frames are never larger than chunk_rows.
+    Returns the number of rows filtered out.
+    """
+    available = frame_columns(src)
+    pass1_columns = [c for c in ("id", "parent_id", "comment_text") if c in available]
+    cleaned, ids, parent_ids = [], [], []
+    for chunk in iter_frames(src, chunk_rows, columns=pass1_columns, dtype=TEXT_DTYPES):
+        cleaned.extend(clean_texts(chunk["comment_text"], workers=workers))
+        ids.extend(chunk["id"].tolist())
+        if "parent_id" in chunk.columns:
+            parent_ids.extend(chunk["parent_id"].tolist())
+    cleaned = np.array(cleaned, dtype=object)
+    if parent_ids and context_depth >= 1:
+        parent_pos = _parent_positions(ids, parent_ids)
+    else:
+        parent_pos = np.full(len(cleaned), -1, dtype=np.int64)
+    del ids, parent_ids
+
+    offset = 0
+    with ChunkedFrameWriter(out_path) as writer:
+        for chunk in iter_frames(src, chunk_rows, dtype=TEXT_DTYPES):
+            rows = np.arange(offset, offset + len(chunk))
+            offset += len(chunk)
+            chunk["cleaned_text"] = cleaned[rows]
+            chunk["full_text"] = _ancestor_texts(cleaned, parent_pos, rows, context_depth)
+            writer.write(chunk[readable_mask(chunk["cleaned_text"])])
+    return len(cleaned) - writer.rows_written
+
+def main(src: str, out_dir: str, fmt: str = DEFAULT_FORMAT, workers: int = 1, context_depth: int = 2, chunk_rows: int = 0):
+    """Phase 3: Text Preprocessing, Thread Creation & Filtering
+
+    Writes cleaned_threaded_comments.parquet (or .csv with --fmt csv) to out_dir.
+    --workers N cleans the text in N processes; --context-depth K prepends up to
+    K ancestor comments to full_text; --chunk-rows N streams the input in chunks
+    of N rows instead of loading it whole.
+    """
+    out_path = artifact_path(out_dir, "cleaned_threaded_comments", fmt)
+    if chunk_rows > 0:
+        removed = stream_clean(src, out_path, chunk_rows, workers, context_depth)
+        print(f"Filtered out {removed} non-readable comments.")
+        return
+
+    # Load data (Parquet or CSV, by suffix), with the same text dtypes as stream_clean
+    df = read_frame(src, dtype=TEXT_DTYPES)
+
+    # Step 3a: Clean the comment_text field
+    df["cleaned_text"] = clean_texts(df["comment_text"], workers=workers)
 
     # Step 3b: Build full_text with ancestor context
-    df["full_text"] = df.apply(lambda row: build_full_text(row, parent_map, text_map), axis=1) # Restored
+    df["full_text"] = build_full_texts(df, depth=context_depth)
     
     # Step 3c: Filter out non-readable comments using the REVISED function
     initial_rows = len(df)
-    df["is_readable"] = df["cleaned_text"].apply(is_readable_comment) 
+    df["is_readable"] = readable_mask(df["cleaned_text"])
     df_filtered = df[df["is_readable"]].copy()
     filtered_rows = len(df_filtered)
     print(f"Filtered out {initial_rows - filtered_rows} non-readable comments.")
@@ -120,8 +287,7 @@ def main(src: str, out_dir: str):
     df_filtered.drop(columns=["is_readable"], inplace=True)
 
     # Write filtered cleaned threaded comments
-    out_path = Path(out_dir) / "cleaned_threaded_comments.csv"
-    df_filtered.to_csv(out_path, index=False)
+    write_frame(df_filtered, out_path)
 
 
 if __name__ == "__main__":
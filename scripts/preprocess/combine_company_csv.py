@@ -1,9 +1,15 @@
 import os
+import argparse
+import hashlib
+import inspect
 import pandas as pd
 import glob
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from scripts.frame_io import DEFAULT_FORMAT, FORMATS, artifact_path, write_frame
+
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -21,6 +27,28 @@ DEI_CUTOFF_DATES = {
     'Target': datetime(2025, 1, 24),
 }
 
+# Explicit dtypes for the per-file CSVs written by process_comments_json.py
+# (dates stay strings here and are parsed below; reaction_count is read as text,
+# since scrapes can hold values such as "1.2K", and coerced in process_company_file)
+RAW_DTYPES = {
+    'company_name': str,
+    'post_date': str,
+    'id': str,
+    'parent_id': str,
+    'comment_text': str,
+    'comment_date': str,
+    'comment_type': str,
+    'reaction_count': str,
+}
+REQUIRED_COLS = ['post_date', 'comment_date', 'id'] # company_name added later
+
+# --- Load cache (data/derived/combine_cache/) ---
+# frames/<hash>.parquet holds each raw file's processed frame, manifest.csv the
+# mtime/size signature it was built from plus the processing fingerprint (config
+# and code, see processing_fingerprint), id_index.parquet the owning file of every id.
+CACHE_MANIFEST_COLS = ['source', 'mtime_ns', 'size', 'rows', 'cache_file', 'config']
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+
 # --- Deprecated: Time folders are no longer the source of truth for before/after ---
 # TIME_FOLDERS = ['before_DEI', 'after_DEI']
 
@@ -68,23 +96,86 @@ def assign_before_dei_for_group(group, company_cutoff_dates_map):
             
     return before_dei_series
 
-if __name__ == "__main__":
-    logging.info("Combine Company Comment CSVs based on new Comment/Post Date logic for before_DEI")
-    logging.info("-" * 30)
+def assign_before_dei(df, company_cutoff_dates_map):
+    """
+    Whole-frame equivalent of applying assign_before_dei_for_group to every
+    (company_name, post_date_parsed) group.
+    - Comments on the earliest comment_date of their post are compared via post_date.
+    - All other comments are compared via their own comment_date.
+    Expects 'company_name', 'post_date_parsed' and 'comment_date_parsed' columns.
+    Returns an Int64 Series aligned with df (1 before, 0 on/after, pd.NA if undetermined).
+    """
+    post_date = df['post_date_parsed']
+    comment_date = df['comment_date_parsed']
+    cutoff = pd.to_datetime(df['company_name'].astype(object).map(company_cutoff_dates_map))
 
-    # --- Define Base Paths Relative to Script Location ---
-    script_dir = os.path.dirname(__file__)
-    base_data_dir = os.path.abspath(os.path.join(script_dir, '..', '..', 'data'))
-    raw_data_dir = os.path.join(base_data_dir, 'raw')
-    derived_data_dir = os.path.join(base_data_dir, 'derived')
+    # Earliest comment date per post; rows with a NaT post_date fall out of the groupby
+    first_cd = df.groupby(['company_name', 'post_date_parsed'], sort=False, observed=True)['comment_date_parsed'].transform('min')
+    compare_date = post_date.where(comment_date.eq(first_cd), comment_date)
 
-    # Ensure derived data directory exists
-    os.makedirs(derived_data_dir, exist_ok=True)
+    valid = post_date.notna() & comment_date.notna() & cutoff.notna()
+    before_dei = pd.Series(pd.NA, index=df.index, dtype=pd.Int64Dtype())
+    before_dei[valid] = (compare_date[valid] < cutoff[valid]).astype(int)
+    return before_dei
+
+def coerce_reaction_counts(values):
+    """Integer reaction counts as Int64; anything else ("1.2K", "", 2.5) becomes NA."""
+    counts = pd.to_numeric(values, errors='coerce')
+    return counts.where(counts % 1 == 0).astype('Int64')
+
+def process_company_file(file_path, company_name):
+    """
+    Reads one raw company CSV and adds company_name, has_DEI and before_DEI.
+    Returns the processed DataFrame, or None if the file is unusable (logged).
+    """
+    file_name = os.path.basename(file_path)
+    try:
+        df = pd.read_csv(file_path, dtype=RAW_DTYPES)
+        if 'reaction_count' in df.columns:
+            df['reaction_count'] = coerce_reaction_counts(df['reaction_count'])
+
+        missing_cols_in_file = [col for col in REQUIRED_COLS if col not in df.columns]
+        if missing_cols_in_file:
+            logging.warning(f"      File {file_name} is missing required columns: {missing_cols_in_file}. Skipping this file.")
+            return None
+
+        # Assign company name and has_DEI flag (needed for grouping and cutoff lookup)
+        df['company_name'] = company_name
+        df['has_DEI'] = 1 if company_name in HAS_DEI_COMPANIES else 0
+
+        # Parse dates
+        df['post_date_parsed'] = pd.to_datetime(df['post_date'], errors='coerce')
+        df['comment_date_parsed'] = pd.to_datetime(df['comment_date'], errors='coerce')
+
+        # Log date parsing issues
+        num_failed_post_dates = df['post_date_parsed'].isna().sum()
+        if num_failed_post_dates > 0:
+            logging.warning(f"        Could not parse 'post_date' for {num_failed_post_dates} rows in {file_name}.")
+        num_failed_comment_dates = df['comment_date_parsed'].isna().sum()
+        if num_failed_comment_dates > 0:
+            logging.warning(f"        Could not parse 'comment_date' for {num_failed_comment_dates} rows in {file_name}.")
+
+        # Assign before_DEI for all (company_name, post_date) groups at once
+        # (rows without a parsable post_date stay NA)
+        df['before_DEI'] = assign_before_dei(df, DEI_CUTOFF_DATES)
+
+        # Drop temporary parsed date columns
+        df.drop(columns=['post_date_parsed', 'comment_date_parsed'], inplace=True)
+        return df
 
-    all_dfs = []
+    except Exception as e:
+        logging.error(f"      Error processing file {file_name}: {e}. Skipping.")
+        return None
 
-    # --- Iterate through Target Companies ---
-    for company_name in TARGET_COMPANIES:
+def discover_company_files(raw_data_dir, companies=TARGET_COMPANIES):
+    """
+    Finds the raw CSVs of each company (recursively).
+    Returns (source, company_name, path) tuples in a deterministic order:
+    company order first, then sorted relative path. source is the path relative
+    to raw_data_dir and is the key used by the cache and the id index.
+    """
+    files = []
+    for company_name in companies:
         logging.info(f"Processing company: {company_name}")
         company_path = os.path.join(raw_data_dir, company_name)
 
@@ -92,118 +183,216 @@ if __name__ == "__main__":
             logging.warning(f"  Company directory not found: {company_path}. Skipping.")
             continue
 
-        # Determine the value for has_DEI column (remains the same for all rows from this company)
-        has_DEI_value = 1 if company_name in HAS_DEI_COMPANIES else 0
-
-        # Get the company-specific cutoff date (used by assign_before_dei_for_group indirectly via DEI_CUTOFF_DATES map)
-        # This check ensures the company folder being processed is in our map.
+        # This check ensures the company folder being processed is in our cutoff map.
         if company_name not in DEI_CUTOFF_DATES:
             logging.error(f"  Cutoff date not defined for company: {company_name} in DEI_CUTOFF_DATES. Skipping this company folder.")
             continue
-        # cutoff_date variable itself isn't directly used in loop below, but DEI_CUTOFF_DATES map is.
         logging.info(f"  Using cutoff date: {DEI_CUTOFF_DATES[company_name].strftime('%Y-%m-%d')}")
 
         csv_pattern = os.path.join(company_path, '**', '*.csv') # Search recursively
-        csv_files = glob.glob(csv_pattern, recursive=True)
+        csv_files = sorted(glob.glob(csv_pattern, recursive=True))
 
         if not csv_files:
             logging.warning(f"    No CSV files found recursively in '{company_path}'.")
             continue
 
         logging.info(f"    Found {len(csv_files)} CSV files across all subdirectories.")
-
         for f in csv_files:
-            logging.debug(f"      Processing file: {f}")
-            try:
-                df = pd.read_csv(f)
-
-                required_cols = ['post_date', 'comment_date'] # company_name added later
-                missing_cols_in_file = [col for col in required_cols if col not in df.columns]
-                if missing_cols_in_file:
-                    logging.warning(f"      File {os.path.basename(f)} is missing required columns: {missing_cols_in_file}. Skipping this file.")
-                    continue
-
-                # Assign company name and has_DEI flag (needed for grouping and cutoff lookup)
-                df['company_name'] = company_name
-                df['has_DEI'] = has_DEI_value
-
-                # Parse dates
-                df['post_date_parsed'] = pd.to_datetime(df['post_date'], errors='coerce')
-                df['comment_date_parsed'] = pd.to_datetime(df['comment_date'], errors='coerce')
-
-                # Log date parsing issues
-                num_failed_post_dates = df['post_date_parsed'].isna().sum()
-                if num_failed_post_dates > 0:
-                    logging.warning(f"        Could not parse 'post_date' for {num_failed_post_dates} rows in {os.path.basename(f)}.")
-                num_failed_comment_dates = df['comment_date_parsed'].isna().sum()
-                if num_failed_comment_dates > 0:
-                    logging.warning(f"        Could not parse 'comment_date' for {num_failed_comment_dates} rows in {os.path.basename(f)}.")
-
-                # Initialize before_DEI column with Int64Dtype
-                df['before_DEI'] = pd.Series(pd.NA, index=df.index, dtype=pd.Int64Dtype())
-
-                # Filter rows that can be processed (must have company_name and post_date_parsed)
-                # company_name is guaranteed by assignment above. post_date_parsed is critical for grouping.
-                processing_candidate_mask = df['post_date_parsed'].notna() # company_name already set
-                df_to_process = df[processing_candidate_mask]
-
-                if not df_to_process.empty:
-                    # Iterate through groups manually to assign results
-                    for group_key, group_df in df_to_process.groupby(
-                        ['company_name', 'post_date_parsed'] 
-                    ):
-                        group_before_dei_values = assign_before_dei_for_group(group_df, DEI_CUTOFF_DATES)
-                        df.loc[group_df.index, 'before_DEI'] = group_before_dei_values
-                
-                # Final cast to Int64Dtype just in case, though assignments should maintain it.
-                if not df['before_DEI'].empty:
-                    df['before_DEI'] = df['before_DEI'].astype(pd.Int64Dtype())
-
-                # Drop temporary parsed date columns
-                df.drop(columns=['post_date_parsed', 'comment_date_parsed'], inplace=True)
-
-                all_dfs.append(df)
-                logging.debug(f"      Successfully processed and added data from: {os.path.basename(f)}")
-
-            except Exception as e:
-                logging.error(f"      Error processing file {os.path.basename(f)}: {e}. Skipping.")
+            source = os.path.relpath(f, raw_data_dir).replace(os.sep, '/')
+            files.append((source, company_name, f))
+    return files
 
-    # --- Combine and Deduplicate ---
-    if not all_dfs:
+def _file_signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+def _cache_file_name(source):
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()[:16] + '.parquet'
+
+def processing_fingerprint():
+    """
+    Short hash of everything besides the raw file that shapes a cached frame:
+    the DEI company list and cutoff dates, the read dtypes and the source of
+    the processing functions. A cache entry built under another fingerprint is
+    rebuilt.
+    """
+    config = {
+        'has_dei': sorted(HAS_DEI_COMPANIES),
+        'cutoffs': {company: cutoff.isoformat() for company, cutoff in sorted(DEI_CUTOFF_DATES.items())},
+        'dtypes': {col: str(dtype) for col, dtype in RAW_DTYPES.items()},
+        'required': REQUIRED_COLS,
+    }
+    digest = hashlib.sha256(repr(config).encode('utf-8'))
+    for func in (process_company_file, assign_before_dei, coerce_reaction_counts):
+        digest.update(inspect.getsource(func).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+def _read_cache_manifest(cache_dir):
+    manifest_path = os.path.join(cache_dir, 'manifest.csv')
+    if not os.path.exists(manifest_path):
+        return pd.DataFrame(columns=CACHE_MANIFEST_COLS).set_index('source')
+    manifest = pd.read_csv(manifest_path, dtype={'source': str, 'cache_file': str, 'config': str})
+    return manifest.reindex(columns=CACHE_MANIFEST_COLS).set_index('source') # manifests without config are rebuilt
+
+def load_company_frames(files, cache_dir=None, workers=DEFAULT_WORKERS):
+    """
+    Loads the processed frame of every (source, company_name, path) in files.
+    Files whose mtime, size and processing fingerprint match the cache manifest
+    are read from their cached Parquet frame; the rest are read in parallel
+    threads and re-cached.
+    Returns (frames, new_sources, stale): frames maps source -> DataFrame in the
+    order of files (unusable files are left out), new_sources lists the sources
+    that had to be (re)read, and stale is True if a previously cached file was
+    modified, removed or processed under another fingerprint (so the
+    persistent id index must be rebuilt).
+    """
+    manifest = _read_cache_manifest(cache_dir) if cache_dir else None
+    config = processing_fingerprint()
+    frames = {}
+    to_read = []
+    stale = False
+    for source, company_name, path in files:
+        mtime_ns, size = _file_signature(path)
+        if manifest is not None and source in manifest.index:
+            entry = manifest.loc[source]
+            cache_path = os.path.join(cache_dir, 'frames', entry['cache_file'])
+            unchanged = (int(entry['mtime_ns']), int(entry['size'])) == (mtime_ns, size) and entry['config'] == config
+            if unchanged and os.path.exists(cache_path):
+                frames[source] = pd.read_parquet(cache_path)
+                continue
+            stale = True # modified, or processed differently, since it was cached
+        frames[source] = None # placeholder keeps the file order
+        to_read.append((source, company_name, path, mtime_ns, size))
+
+    logging.info(f"Reading {len(to_read)} new or changed files ({len(files) - len(to_read)} cached) with {workers} threads...")
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        results = list(pool.map(lambda t: process_company_file(t[2], t[1]), to_read))
+
+    new_sources = []
+    records = []
+    for (source, _, _, mtime_ns, size), df in zip(to_read, results):
+        if df is None:
+            del frames[source]
+            continue
+        frames[source] = df
+        new_sources.append(source)
+        records.append((source, mtime_ns, size, len(df), _cache_file_name(source), config))
+
+    if cache_dir:
+        frames_dir = os.path.join(cache_dir, 'frames')
+        os.makedirs(frames_dir, exist_ok=True)
+        for source, _, _, _, cache_file, _ in records:
+            frames[source].to_parquet(os.path.join(frames_dir, cache_file), index=False)
+
+        kept = manifest[manifest.index.isin([s for s in frames if s not in new_sources])].reset_index()
+        removed = manifest[~manifest.index.isin(frames)]
+        if len(removed):
+            stale = True
+            for cache_file in removed['cache_file']:
+                cache_path = os.path.join(frames_dir, cache_file)
+                if os.path.exists(cache_path):
+                    os.remove(cache_path)
+        updated = pd.concat([kept, pd.DataFrame(records, columns=CACHE_MANIFEST_COLS)], ignore_index=True)
+        updated.to_csv(os.path.join(cache_dir, 'manifest.csv'), index=False)
+
+    return frames, new_sources, stale
+
+def update_id_index(index, frames, new_sources, rebuild=False):
+    """
+    Returns the id index (columns id, source): the file that owns each id, i.e.
+    the earliest file in frames order containing it. Only the ids of
+    new_sources are merged into an existing index; with rebuild=True (or no
+    index) it is built from the ids of all frames.
+    """
+    rank = {source: i for i, source in enumerate(frames)}
+    sources = list(frames) if rebuild or index is None else new_sources
+    pieces = [] if rebuild or index is None else [index]
+    pieces += [pd.DataFrame({'id': frames[s]['id'], 'source': s}) for s in sources]
+    if not pieces:
+        return pd.DataFrame(columns=['id', 'source'])
+
+    candidates = pd.concat(pieces, ignore_index=True)
+    candidates['rank'] = candidates['source'].map(rank)
+    candidates = candidates[candidates['rank'].notna()]
+    candidates = candidates.sort_values('rank', kind='stable').drop_duplicates(subset=['id'], keep='first')
+    return candidates[['id', 'source']].reset_index(drop=True)
+
+def combine_frames(frames, index):
+    """
+    Concatenates frames in order, keeping each id only in the file that owns
+    it per the id index (first occurrence within that file), which matches
+    drop_duplicates(subset=['id'], keep='first') over the full concatenation.
+    """
+    owner = pd.Series(index['source'].to_numpy(), index=index['id'].to_numpy())
+    kept = []
+    for source, df in frames.items():
+        mask = df['id'].map(owner).eq(source) & ~df['id'].duplicated()
+        kept.append(df[mask])
+    return pd.concat(kept, ignore_index=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Combine per-file company CSVs into data/derived/combined_comments.")
+    parser.add_argument("--format", choices=FORMATS, default=DEFAULT_FORMAT,
+                        help="Output format: typed Parquet (native) or CSV export")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Threads used to read new or changed CSVs")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Load cache directory (default: data/derived/combine_cache)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Ignore the load cache and re-read every CSV")
+    args = parser.parse_args()
+
+    logging.info("Combine Company Comment CSVs based on new Comment/Post Date logic for before_DEI")
+    logging.info("-" * 30)
+
+    # --- Define Base Paths Relative to Script Location ---
+    script_dir = os.path.dirname(__file__)
+    base_data_dir = os.path.abspath(os.path.join(script_dir, '..', '..', 'data'))
+    raw_data_dir = os.path.join(base_data_dir, 'raw')
+    derived_data_dir = os.path.join(base_data_dir, 'derived')
+
+    # Ensure derived data directory exists
+    os.makedirs(derived_data_dir, exist_ok=True)
+    cache_dir = None if args.no_cache else (args.cache_dir or os.path.join(derived_data_dir, 'combine_cache'))
+
+    # --- Load (cached) frames of all Target Companies ---
+    files = discover_company_files(raw_data_dir)
+    frames, new_sources, stale = load_company_frames(files, cache_dir, args.workers)
+
+    if not frames:
         logging.error("No dataframes were successfully read. Exiting.")
         exit()
 
+    # --- Combine and Deduplicate ---
+    index_path = os.path.join(cache_dir, 'id_index.parquet') if cache_dir else None
+    index = pd.read_parquet(index_path) if index_path and os.path.exists(index_path) else None
+    if index is not None and stale:
+        logging.info("Cached files were modified or removed; rebuilding the id index.")
+    index = update_id_index(index, frames, new_sources, rebuild=stale)
+    if index_path:
+        index.to_parquet(index_path, index=False)
+
     logging.info("\nConcatenating all dataframes...")
-    combined_df = pd.concat(all_dfs, ignore_index=True)
-    initial_count = len(combined_df)
+    initial_count = sum(len(df) for df in frames.values())
     logging.info(f"Total rows combined: {initial_count}")
 
-    logging.info("Checking for and removing duplicate rows based on 'id' column...")
-    if 'id' in combined_df.columns:
-        duplicates_mask = combined_df.duplicated(subset=['id'], keep=False)
-        if duplicates_mask.any():
-            logging.warning(f"Found {duplicates_mask.sum()} rows with duplicate IDs.")
-            combined_df.drop_duplicates(subset=['id'], keep='first', inplace=True)
-            final_count = len(combined_df)
-            duplicates_removed = initial_count - final_count
-            logging.warning(f"Removed {duplicates_removed} duplicate rows based on ID, keeping the first occurrence.")
-        else:
-            logging.info("No duplicate IDs found.")
-            final_count = initial_count
+    logging.info("Removing duplicate rows based on 'id' column (keeping the first occurrence)...")
+    combined_df = combine_frames(frames, index)
+    final_count = len(combined_df)
+    if final_count < initial_count:
+        logging.warning(f"Removed {initial_count - final_count} duplicate rows based on ID, keeping the first occurrence.")
     else:
-        logging.warning("'id' column not found in combined data. Skipping deduplication based on ID.")
-        final_count = initial_count
+        logging.info("No duplicate IDs found.")
 
     logging.info(f"Final row count: {final_count}")
 
     # --- Save Combined DataFrame --- 
-    output_file_name = "combined_comments.csv"
-    output_file_path = os.path.join(derived_data_dir, output_file_name)
+    output_file_path = artifact_path(derived_data_dir, "combined_comments", args.format)
     logging.info(f"Saving final combined data to: {output_file_path}...")
     try:
-        combined_df.to_csv(output_file_path, index=False, encoding='utf-8')
+        write_frame(combined_df, output_file_path)
         logging.info("Successfully saved combined file.")
     except Exception as e:
         logging.error(f"Error saving combined file: {e}")
 
-    logging.info("\nScript finished.") 
\ No newline at end of file
+    logging.info("\nScript finished.")
@@ -18,21 +18,31 @@ The script adds for every comment:
 
 Usage
 -----
-python graph_features.py in.csv out.csv
+python -m scripts.preprocess.graph_features in.parquet out.parquet
+    [--engine vectorized|networkx] [--workers N] [--cache features.parquet]
+
+Parquet is the native format; pass .csv paths to read or export CSV.
 """
 
 from __future__ import annotations
 
 import argparse
+import heapq
 import logging
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-import networkx as nx
+import numpy as np
 import pandas as pd
 
+from scripts.frame_io import read_frame, write_frame
+
 # Define expected output columns structure
 FEATURE_COLS = ['id', 'root_id', 'depth', 'sibling_count', 'time_since_root']
 
+# Feature engines accepted by calculate_graph_features (networkx kept for cross-checks)
+ENGINES = ("vectorized", "networkx")
+
 LOGGER = logging.getLogger(__name__)
 logging.basicConfig(
     level=logging.INFO,
@@ -46,7 +56,12 @@ logging.basicConfig(
 # --------------------------------------------------------------------------- #
 
 
-def calculate_graph_features(df: pd.DataFrame) -> pd.DataFrame:
+def calculate_graph_features(
+    df: pd.DataFrame,
+    engine: str = "vectorized",
+    workers: int = 1,
+    cache_path: Path | str | None = None,
+) -> pd.DataFrame:
     """Return DataFrame with id and four graph‑based features.
 
     The computation is performed per *source post* (one brand post on
@@ -60,6 +75,19 @@ def calculate_graph_features(df: pd.DataFrame) -> pd.DataFrame:
         Must contain at least::
 
             id, parent_id, comment_date, company_name, post_date
+    engine : {"vectorized", "networkx"}
+        ``"vectorized"`` (default) resolves every thread at once with
+        integer-encoded parent arrays. ``"networkx"`` builds one
+        ``nx.DiGraph`` per post and is kept for cross-checking.
+    workers : int
+        Number of worker processes. With ``workers > 1`` whole posts are
+        sharded across a process pool, balanced by comment count, and the
+        results are returned in input row order.
+    cache_path : path, optional
+        Parquet sidecar holding a fingerprint and the feature rows of every
+        post seen on the previous run. When given, only posts whose
+        fingerprint changed (or that are new) are recomputed; the store is
+        rewritten to match the current input afterwards.
 
     Returns
     -------
@@ -68,6 +96,11 @@ def calculate_graph_features(df: pd.DataFrame) -> pd.DataFrame:
         sibling_count, and time_since_root.
     """
 
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}; expected one of {ENGINES}")
+    if workers < 1:
+        raise ValueError(f"workers must be >= 1, got {workers}")
+
     required = {"id", "parent_id", "comment_date", "company_name", "post_date"}
     missing = required.difference(df.columns)
     if missing:
@@ -84,6 +117,36 @@ def calculate_graph_features(df: pd.DataFrame) -> pd.DataFrame:
         df["company_name"].astype(str) + "__" + df["post_date"].dt.strftime("%Y-%m-%d %H:%M:%S")
     )
 
+    if cache_path is not None:
+        feature_df = _features_incremental(df, engine, workers, Path(cache_path))
+    else:
+        feature_df = _compute_features(df, engine, workers)
+
+    # Handle case where no features were generated at all
+    if feature_df is None:
+        LOGGER.warning("No graph features were generated across any posts.")
+        # Return an empty DataFrame with the expected columns
+        return pd.DataFrame(columns=FEATURE_COLS)
+
+    # Ensure correct column order and types before returning
+    feature_df = feature_df[FEATURE_COLS] # Select and order columns
+
+    feature_df['depth'] = feature_df['depth'].astype('Int64')
+    feature_df['sibling_count'] = feature_df['sibling_count'].astype('Int64')
+    # Do not fillna time_since_root with 0 globally, only for depth==0 where date is not NaT
+    # Already handled during feature calculation.
+
+    # Check for any remaining NaNs in essential feature columns (shouldn't happen)
+    if feature_df[[f for f in FEATURE_COLS if f != 'time_since_root']].isnull().any().any():
+        LOGGER.warning("NaN values found in feature columns after processing. Check logic.")
+
+    return feature_df
+
+
+def _features_networkx(df: pd.DataFrame) -> pd.DataFrame | None:
+    """Reference implementation: one ``nx.DiGraph`` per source post."""
+    import networkx as nx
+
     feature_frames: list[pd.DataFrame] = []
 
     # iterate over each post
@@ -176,30 +239,212 @@ def calculate_graph_features(df: pd.DataFrame) -> pd.DataFrame:
                  }
 
         if features: # Only append if features were generated for this group
-             feature_frames.append(pd.DataFrame.from_dict(features, orient='index'))
+             frame = pd.DataFrame.from_dict(features, orient='index')
+             frame["source_post_id"] = post_id
+             feature_frames.append(frame)
 
-    # Handle case where no features were generated at all
     if not feature_frames:
-        LOGGER.warning("No graph features were generated across any posts.")
-        # Return an empty DataFrame with the expected columns
-        return pd.DataFrame(columns=FEATURE_COLS)
+        return None
 
     # Concatenate features from all groups
     feature_df = pd.concat(feature_frames)
-    feature_df = feature_df.reset_index().rename(columns={"index": "id"})
+    return feature_df.reset_index().rename(columns={"index": "id"})
 
-    # Ensure correct column order and types before returning
-    feature_df = feature_df[FEATURE_COLS] # Select and order columns
 
-    feature_df['depth'] = feature_df['depth'].astype('Int64')
-    feature_df['sibling_count'] = feature_df['sibling_count'].astype('Int64')
-    # Do not fillna time_since_root with 0 globally, only for depth==0 where date is not NaT
-    # Already handled during feature calculation.
+def _features_vectorized(df: pd.DataFrame) -> pd.DataFrame | None:
+    """Array-backed implementation covering every source post in one pass.
 
-    # Check for any remaining NaNs in essential feature columns (shouldn't happen)
-    if feature_df[[f for f in FEATURE_COLS if f != 'time_since_root']].isnull().any().any():
-        LOGGER.warning("NaN values found in feature columns after processing. Check logic.")
+    Each comment becomes a row position; ``parent`` holds the position of
+    its in-post parent (``-1`` for roots). Root and depth are resolved by
+    pointer jumping, so the number of passes grows with ``log2`` of the
+    deepest thread rather than with the number of comments. Comments that
+    never reach a root (self-parents, reply cycles) are treated as isolated
+    roots, exactly as the networkx path does.
+    """
+    # groupby() drops rows whose post key is NaN; mirror that here
+    df = df[df["source_post_id"].notna()].reset_index(drop=True)
+    n = len(df)
+    if n == 0:
+        return None
+
+    if df.duplicated(subset=["source_post_id", "id"]).any():
+        raise ValueError("Comment ids must be unique within each source post.")
+
+    post_codes, post_uniques = pd.factorize(df["source_post_id"], sort=False)
+    LOGGER.info("Resolving %d comments across %d posts", n, len(post_uniques))
+
+    # integer-encode ids and parent ids against one shared vocabulary
+    ids = df["id"]
+    pids = df["parent_id"]
+    id_codes, vocab = pd.factorize(pd.concat([ids, pids], ignore_index=True), use_na_sentinel=True)
+    id_key = post_codes.astype(np.int64) * (len(vocab) + 1) + id_codes[:n]
+    pid_key = post_codes.astype(np.int64) * (len(vocab) + 1) + id_codes[n:]
+
+    parent = pd.Index(id_key).get_indexer(pid_key)
+    pid_valid = (pids.notna() & (pids != "")).to_numpy() & (id_codes[n:] >= 0)
+    parent[~pid_valid] = -1
+    parent = parent.astype(np.int64)
+
+    is_root = parent == -1
+    positions = np.arange(n, dtype=np.int64)
+
+    # pointer jumping: anc -> 2^k-th ancestor (clamped at the root), dist -> hops taken
+    anc = np.where(is_root, positions, parent)
+    dist = (~is_root).astype(np.int64)
+    for _ in range(max(n, 1).bit_length() + 1):
+        nxt = anc[anc]
+        if np.array_equal(nxt, anc):
+            break
+        dist = dist + dist[anc]
+        anc = nxt
+    reached = is_root[anc]
+
+    n_roots = np.bincount(post_codes, weights=is_root, minlength=len(post_uniques)).astype(np.int64)
+    n_missed = np.bincount(post_codes, weights=~reached, minlength=len(post_uniques)).astype(np.int64)
+    if n_missed.any():
+        for code in np.flatnonzero(n_missed):
+            LOGGER.warning(
+                f"Post {post_uniques[code]}: {n_missed[code]} nodes were not reached from identified roots. Treating as isolated roots."
+            )
+
+    # siblings: children of the same parent, or other roots of the same post
+    child_count = np.bincount(parent[~is_root], minlength=n)
+    sibling_count = np.where(
+        is_root,
+        n_roots[post_codes] - 1,
+        child_count[np.where(is_root, 0, parent)] - 1,
+    )
+    sibling_count = np.where(reached, sibling_count, n_roots[post_codes] - 1 + n_missed[post_codes] - 1)
+
+    root_pos = np.where(reached, anc, positions)
+    depth = np.where(reached, dist, 0)
+
+    comment_date = df["comment_date"]
+    root_date = pd.Series(comment_date.to_numpy()[root_pos], index=df.index)
+    tsr = (comment_date - root_date).clip(lower=pd.Timedelta(seconds=0)).dt.floor("s")
+
+    return pd.DataFrame(
+        {
+            "id": ids.to_numpy(),
+            "root_id": ids.to_numpy()[root_pos],
+            "depth": depth,
+            "sibling_count": sibling_count,
+            "time_since_root": tsr.to_numpy(),
+            "source_post_id": df["source_post_id"].to_numpy(),
+        }
+    )
+
+
+_ENGINE_FUNCS = {"vectorized": _features_vectorized, "networkx": _features_networkx}
+
+
+def _balance_shards(sizes: pd.Series, n_shards: int) -> list[list]:
+    """Assign posts to ``n_shards`` bins, largest first, always into the lightest bin.
+
+    Greedy longest-processing-time scheduling keeps a single viral post from
+    sharing a bin with a long tail of others, so no worker becomes a straggler.
+    """
+    heap = [(0, i) for i in range(n_shards)]
+    shards: list[list] = [[] for _ in range(n_shards)]
+    # stable sort so ties keep first-appearance order and sharding is reproducible
+    for post_id, size in sizes.sort_values(ascending=False, kind="stable").items():
+        load, i = heapq.heappop(heap)
+        shards[i].append(post_id)
+        heapq.heappush(heap, (load + int(size), i))
+    return [s for s in shards if s]
+
+
+def _shard_features(args: tuple[pd.DataFrame, str]) -> pd.DataFrame | None:
+    shard_df, engine = args
+    return _ENGINE_FUNCS[engine](shard_df)
+
+
+def _features_parallel(df: pd.DataFrame, engine: str, workers: int) -> pd.DataFrame | None:
+    """Fan posts out over a process pool and merge the shards in input row order."""
+    df = df[df["source_post_id"].notna()]
+    if df.empty:
+        return None
+    if df.duplicated(subset=["source_post_id", "id"]).any():
+        raise ValueError("Comment ids must be unique within each source post.")
+
+    sizes = df.groupby("source_post_id", sort=False).size()
+    shards = _balance_shards(sizes, min(workers, len(sizes)))
+    LOGGER.info(
+        "Sharding %d posts across %d workers (largest shard: %d comments)",
+        len(sizes), len(shards), max(int(sizes[s].sum()) for s in shards),
+    )
+
+    tasks = [(df[df["source_post_id"].isin(s)], engine) for s in shards]
+    with ProcessPoolExecutor(max_workers=len(tasks)) as pool:
+        frames = [f for f in pool.map(_shard_features, tasks) if f is not None]
+    if not frames:
+        return None
 
+    # deterministic merge: order rows by their position in the input frame
+    return _order_like_input(pd.concat(frames, ignore_index=True), df)
+
+
+def _compute_features(df: pd.DataFrame, engine: str, workers: int) -> pd.DataFrame | None:
+    if workers > 1:
+        return _features_parallel(df, engine, workers)
+    return _ENGINE_FUNCS[engine](df)
+
+
+def _order_like_input(feature_df: pd.DataFrame, df: pd.DataFrame) -> pd.DataFrame:
+    """Sort feature rows by the position of their (post, id) pair in ``df``."""
+    order = df[["source_post_id", "id"]].reset_index(drop=True).reset_index(names="_row")
+    merged = feature_df.merge(order, on=["source_post_id", "id"], how="left")
+    return merged.sort_values("_row", kind="stable").drop(columns="_row").reset_index(drop=True)
+
+
+def _post_fingerprints(df: pd.DataFrame) -> pd.Series:
+    """Return an order-independent fingerprint per ``source_post_id``.
+
+    Each row is hashed over the columns the features depend on (id,
+    parent_id, comment_date); row hashes are summed modulo 2**64 within a
+    post and combined with the post's comment count.
+    """
+    row_hash = pd.util.hash_pandas_object(df[["id", "parent_id", "comment_date"]], index=False).to_numpy()
+    codes, posts = pd.factorize(df["source_post_id"], sort=False)
+    totals = np.zeros(len(posts), dtype=np.uint64)
+    np.add.at(totals, codes, row_hash)
+    counts = np.bincount(codes, minlength=len(posts))
+    return pd.Series([f"{c}-{t:016x}" for c, t in zip(counts, totals)], index=posts, name="fingerprint")
+
+
+def _features_incremental(
+    df: pd.DataFrame, engine: str, workers: int, cache_path: Path
+) -> pd.DataFrame | None:
+    """Recompute only posts whose fingerprint differs from the sidecar store."""
+    df = df[df["source_post_id"].notna()]
+    fingerprints = _post_fingerprints(df)
+
+    cached = None
+    if cache_path.exists():
+        cached = pd.read_parquet(cache_path)
+        previous = cached.groupby("source_post_id", sort=False)["fingerprint"].first()
+        unchanged = fingerprints.index[fingerprints.eq(previous.reindex(fingerprints.index))]
+        cached = cached[cached["source_post_id"].isin(unchanged)].drop(columns="fingerprint")
+    else:
+        unchanged = fingerprints.index[:0]
+
+    stale = df[~df["source_post_id"].isin(unchanged)]
+    LOGGER.info(
+        "Incremental mode: %d of %d posts changed (%d comments to recompute)",
+        len(fingerprints) - len(unchanged), len(fingerprints), len(stale),
+    )
+    fresh = _compute_features(stale, engine, workers) if not stale.empty else None
+
+    frames = [f for f in (cached, fresh) if f is not None and not f.empty]
+    if not frames:
+        return None
+    feature_df = _order_like_input(pd.concat(frames, ignore_index=True), df)
+    feature_df["depth"] = feature_df["depth"].astype("Int64")
+    feature_df["sibling_count"] = feature_df["sibling_count"].astype("Int64")
+
+    store = feature_df.assign(fingerprint=feature_df["source_post_id"].map(fingerprints))
+    store.to_parquet(cache_path, index=False)
+    LOGGER.info("Feature cache updated at %s", cache_path)
     return feature_df
 
 
@@ -210,28 +455,34 @@ def calculate_graph_features(df: pd.DataFrame) -> pd.DataFrame:
 
 def _parse_args() -> argparse.Namespace:
     ap = argparse.ArgumentParser(description="Add conversational graph features to comments.")
-    ap.add_argument("input", help="CSV or Parquet file with raw Facebook comments")
-    ap.add_argument("output", help="Destination CSV or Parquet file for merged data")
+    ap.add_argument("input", help="Parquet or CSV file with raw Facebook comments")
+    ap.add_argument("output", help="Destination Parquet (native) or CSV (export) file for merged data")
+    ap.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="vectorized",
+        help="Feature engine; 'networkx' is the per-post reference implementation",
+    )
+    ap.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Worker processes; posts are sharded across them by comment count",
+    )
+    ap.add_argument(
+        "--cache",
+        default=None,
+        help="Parquet sidecar of per-post fingerprints and features; enables incremental mode",
+    )
     return ap.parse_args()
 
 
 def _read_any(path: Path | str) -> pd.DataFrame:
-    path = Path(path)
-    if path.suffix == ".csv":
-        return pd.read_csv(path)
-    if path.suffix in {".parquet", ".pq"}:
-        return pd.read_parquet(path)
-    raise ValueError("Only .csv or .parquet files are supported.")
+    return read_frame(path)
 
 
 def _write_any(df: pd.DataFrame, path: Path | str) -> None:
-    path = Path(path)
-    if path.suffix == ".csv":
-        df.to_csv(path, index=False)
-    elif path.suffix in {".parquet", ".pq"}:
-        df.to_parquet(path, index=False)
-    else:
-        raise ValueError("Only .csv or .parquet outputs are supported.")
+    write_frame(df, path)
 
 
 def main() -> None:
@@ -244,7 +495,9 @@ def main() -> None:
 
     LOGGER.info("Calculating graph features…")
     # Get only the feature DataFrame
-    feature_df = calculate_graph_features(df_input)
+    feature_df = calculate_graph_features(
+        df_input, engine=args.engine, workers=args.workers, cache_path=args.cache
+    )
 
     LOGGER.info("Merging features back into original data...")
     # Ensure feature_df doesn't contain columns already in df_input except 'id'
@@ -5,8 +5,11 @@ import seaborn as sns
 import os
 from datetime import datetime # Added for DEI_CUTOFF_DATES
 
+from scripts.frame_io import find_artifact, read_frame
+
 # --- Configuration ---
-DATA_FILE = "data/derived/comments_with_sentiment.csv"
+# Run from the repository root: python -m scripts.visualize.EDA_analysis
+DATA_FILE = find_artifact("data/derived", "comments_with_sentiment") # Parquet if present, else CSV
 TABLES_DIR = "results/tables"
 FIGURES_DIR = "results/figures" # As per README structure
 
@@ -120,11 +123,16 @@ def eda_main():
     # --- Load and Prepare Data ---
     print(f"Loading data from {DATA_FILE}...")
     try:
-        df = pd.read_csv(DATA_FILE)
+        df = read_frame(DATA_FILE)
     except FileNotFoundError:
         print(f"Error: Data file not found at {DATA_FILE}. Please ensure the path is correct.")
         return
     
+    # Parquet stores company_name/comment_type as categoricals; plain objects keep
+    # groupby from emitting empty category combinations in the tables below
+    for col in df.select_dtypes('category').columns:
+        df[col] = df[col].astype(object)
+
     print("Data loaded. Basic info:")
     df.info()
     print(f"\nShape: {df.shape}")
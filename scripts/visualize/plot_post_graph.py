@@ -5,12 +5,12 @@ comment thread from each target company (Delta, Costco, Target, Google).
 
 Usage
 -----
-python plot_post_graph.py <input_csv_path> <output_dir>
+python -m scripts.visualize.plot_post_graph <input_path> <output_dir>
 
 Example
 -------
-python scripts/visualize/plot_post_graph.py \
-    data/derived/graphed_comments.csv \
+python -m scripts.visualize.plot_post_graph \
+    data/derived/graphed_comments.parquet \
     results/figures
 """
 
@@ -22,6 +22,8 @@ import matplotlib.pyplot as plt
 import networkx as nx
 import pandas as pd
 
+from scripts.frame_io import read_frame
+
 # Define target companies
 TARGET_COMPANIES = ['Delta', 'Costco', 'Target', 'Google']
 
@@ -51,7 +53,8 @@ def select_representative_posts(df: pd.DataFrame) -> dict[str, str]:
          raise ValueError("Cannot select posts: Missing 'depth' column.")
 
     LOGGER.info("Calculating stats per post to select examples...")
-    post_stats = df.groupby(['company_name', 'source_post_id']).agg(
+    # observed=True: company_name is categorical when read from Parquet
+    post_stats = df.groupby(['company_name', 'source_post_id'], observed=True).agg(
         comment_count=('id', 'size'),
         max_depth=('depth', 'max')
     ).reset_index()
@@ -184,7 +187,7 @@ def main() -> None:
     parser.add_argument(
         "input_csv_path",
         type=Path,
-        help="Path to the CSV file containing comments and graph features (e.g., data/derived/graphed_comments.csv)",
+        help="Parquet or CSV file containing comments and graph features (e.g., data/derived/graphed_comments.parquet)",
     )
     parser.add_argument(
         "output_dir",
@@ -198,9 +201,9 @@ def main() -> None:
         LOGGER.error("Input file not found: %s", args.input_csv_path)
         return
     try:
-        df = pd.read_csv(args.input_csv_path)
+        df = read_frame(args.input_csv_path)
     except Exception as e:
-        LOGGER.error("Failed to read CSV: %s", e)
+        LOGGER.error("Failed to read input: %s", e)
         return
 
     # Select representative posts
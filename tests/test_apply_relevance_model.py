@@ -0,0 +1,137 @@
+import pandas as pd
+import pytest
+
+from scripts.frame_io import read_frame, write_frame
+from scripts.model.apply_relevance_model import NEW_LABEL_COLUMN, TEXT_COLUMN, score_in_chunks, scoring_run_id
+from scripts.model.embedding_cache import model_fingerprint
+
+
+@pytest.fixture
+def comments_path(tmp_path):
+    df = pd.DataFrame({
+        'id': [f'c{i}' for i in range(23)],
+        'company_name': ['Target'] * 23,
+        TEXT_COLUMN: [f'comment {i}' if i % 7 else None for i in range(23)],
+    })
+    path = tmp_path / 'cleaned_threaded_comments.parquet'
+    write_frame(df, path)
+    return path
+
+
+def _predict(texts):
+    return [int(t.split()[-1]) % 2 for t in texts]
+
+
+def test_score_in_chunks_matches_single_pass(comments_path, tmp_path):
+    out_path = tmp_path / 'comments_with_relevance.parquet'
+    assert score_in_chunks(_predict, comments_path, out_path, chunk_rows=5) == 19
+
+    expected = read_frame(comments_path).dropna(subset=[TEXT_COLUMN]).reset_index(drop=True)
+    expected[NEW_LABEL_COLUMN] = _predict(expected[TEXT_COLUMN].tolist())
+    pd.testing.assert_frame_equal(read_frame(out_path), expected, check_dtype=False)
+    assert not (tmp_path / 'comments_with_relevance.parquet.parts').exists()
+
+
+def test_score_in_chunks_resumes_after_failure(comments_path, tmp_path):
+    """A crash mid-run keeps finished chunks; the restart only scores the rest."""
+    out_path = tmp_path / 'comments_with_relevance.parquet'
+    calls = []
+
+    def flaky(texts):
+        calls.append(texts[0])
+        if len(calls) == 3:
+            raise RuntimeError("worker died")
+        return _predict(texts)
+
+    with pytest.raises(RuntimeError):
+        score_in_chunks(flaky, comments_path, out_path, chunk_rows=5, run_id='model-a')
+    progress = pd.read_csv(tmp_path / 'comments_with_relevance.parquet.parts' / 'progress.csv')
+    assert progress['chunk'].tolist() == [0, 1]
+
+    calls.clear()
+    score_in_chunks(_predict_recording(calls), comments_path, out_path, chunk_rows=5, run_id='model-a')
+    assert calls == ['comment 10', 'comment 15', 'comment 20']
+    assert len(read_frame(out_path)) == 19
+
+
+def test_score_in_chunks_restarts_when_model_changes(comments_path, tmp_path):
+    out_path = tmp_path / 'comments_with_relevance.parquet'
+
+    def failing(texts):
+        raise RuntimeError("stop")
+
+    with pytest.raises(RuntimeError):
+        score_in_chunks(failing, comments_path, out_path, chunk_rows=5, run_id='model-a')
+    calls = []
+    score_in_chunks(_predict_recording(calls), comments_path, out_path, chunk_rows=5, run_id='model-b')
+    assert len(calls) == 5
+
+
+def test_retrained_head_discards_existing_parts(comments_path, tmp_path):
+    """Same body, new model_head.pkl: the cache fingerprint stays, the chunked run starts over."""
+    model_dir = tmp_path / 'model'
+    model_dir.mkdir()
+    (model_dir / 'config.json').write_text('{"hidden_size": 384}')
+    (model_dir / 'model_head.pkl').write_bytes(b'head v1')
+    old_run_id, old_body = scoring_run_id(model_dir), model_fingerprint(model_dir)
+
+    out_path = tmp_path / 'comments_with_relevance.parquet'
+
+    def failing(texts):
+        if texts[0] == 'comment 10':
+            raise RuntimeError("interrupted")
+        return _predict(texts)
+
+    with pytest.raises(RuntimeError):
+        score_in_chunks(failing, comments_path, out_path, chunk_rows=5, run_id=old_run_id)
+
+    (model_dir / 'model_head.pkl').write_bytes(b'head v2')
+    assert model_fingerprint(model_dir) == old_body
+    assert scoring_run_id(model_dir) != old_run_id
+    assert scoring_run_id(model_dir, 'onnx') != scoring_run_id(model_dir)
+    calls = []
+    score_in_chunks(_predict_recording(calls), comments_path, out_path, chunk_rows=5,
+                    run_id=scoring_run_id(model_dir))
+    assert len(calls) == 5
+
+
+def _predict_recording(calls):
+    def predict(texts):
+        calls.append(texts[0])
+        return _predict(texts)
+    return predict
+
+
+def test_score_in_chunks_adds_several_columns(comments_path, tmp_path):
+    out_path = tmp_path / 'comments_with_student_sentiment.parquet'
+
+    def predict(texts):
+        labels = _predict(texts)
+        return pd.DataFrame({'label': labels, 'conf': [0.5 + l / 4 for l in labels]})
+
+    assert score_in_chunks(predict, comments_path, out_path, chunk_rows=5, columns=['label', 'conf']) == 19
+    scored = read_frame(out_path)
+    assert NEW_LABEL_COLUMN not in scored.columns
+    assert scored['label'].tolist() == _predict(scored[TEXT_COLUMN].tolist())
+    assert set(scored['conf']) == {0.5, 0.75}
+
+
+@pytest.mark.parametrize('suffix', ['.parquet', '.csv'])
+def test_score_in_chunks_keeps_integer_labels_after_an_empty_first_chunk(tmp_path, suffix):
+    """A first chunk without any text must not turn the prediction column into strings."""
+    import pyarrow.parquet as pq
+
+    src = tmp_path / 'cleaned_threaded_comments.parquet'
+    write_frame(pd.DataFrame({
+        'id': [f'c{i}' for i in range(12)],
+        TEXT_COLUMN: [None] * 5 + [f'comment {i}' for i in range(5, 12)],
+    }), src)
+    out_path = tmp_path / f'comments_with_relevance{suffix}'
+    assert score_in_chunks(_predict, src, out_path, chunk_rows=5) == 7
+
+    scored = read_frame(out_path)
+    assert pd.api.types.is_integer_dtype(scored[NEW_LABEL_COLUMN])
+    assert scored[NEW_LABEL_COLUMN].tolist() == _predict(scored[TEXT_COLUMN].tolist())
+    if suffix == '.parquet':
+        assert str(pq.read_schema(out_path).field(NEW_LABEL_COLUMN).type) == 'int64'
+
@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts.preprocess.combine_company_csv import (
+    DEI_CUTOFF_DATES,
+    RAW_DTYPES,
+    assign_before_dei,
+    assign_before_dei_for_group,
+    combine_frames,
+    discover_company_files,
+    load_company_frames,
+    process_company_file,
+    update_id_index,
+)
+
+
+def _loop_before_dei(df: pd.DataFrame) -> pd.Series:
+    """The original per-group assignment loop from combine_company_csv.__main__."""
+    out = pd.Series(pd.NA, index=df.index, dtype=pd.Int64Dtype())
+    df_to_process = df[df['post_date_parsed'].notna()]
+    for _, group_df in df_to_process.groupby(['company_name', 'post_date_parsed']):
+        out.loc[group_df.index] = assign_before_dei_for_group(group_df, DEI_CUTOFF_DATES)
+    return out.astype(pd.Int64Dtype())
+
+
+def test_assign_before_dei_rules():
+    """Earliest comment date uses post_date; later dates use their own comment_date."""
+    df = pd.DataFrame({
+        'company_name': ['Target'] * 4 + ['Walmart'],
+        'post_date_parsed': pd.to_datetime(['2025-01-20 09:00'] * 4 + ['2025-01-20 09:00']),
+        'comment_date_parsed': pd.to_datetime(['2025-01-24', '2025-01-24', '2025-01-23', pd.NaT, '2025-01-21']),
+    })
+    result = assign_before_dei(df, DEI_CUTOFF_DATES)
+    # 01-23 is the first comment date -> post_date (before cutoff) -> 1
+    # 01-24 is a later date on the cutoff day -> 0; NaT and unmapped company -> NA
+    assert result.tolist()[:3] == [0, 0, 1]
+    assert result.isna().tolist() == [False, False, False, True, True]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_assign_before_dei_matches_group_loop(seed):
+    """The whole-frame computation reproduces the per-group loop exactly."""
+    rng = np.random.default_rng(seed)
+    n = 400
+    companies = rng.choice(list(DEI_CUTOFF_DATES) + ['Walmart'], n)
+    post_dates = pd.Timestamp('2025-01-10') + pd.to_timedelta(rng.integers(0, 30, n), unit='D')
+    comment_dates = post_dates + pd.to_timedelta(rng.integers(0, 10, n), unit='D')
+    df = pd.DataFrame({
+        'company_name': companies,
+        'post_date_parsed': post_dates.where(rng.random(n) > 0.05),
+        'comment_date_parsed': comment_dates.where(rng.random(n) > 0.1),
+    })
+    pd.testing.assert_series_equal(assign_before_dei(df, DEI_CUTOFF_DATES), _loop_before_dei(df))
+
+
+def _write_raw(path, rows):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame(rows, columns=list(RAW_DTYPES)).to_csv(path, index=False)
+
+
+def _row(comment_id, comment_date, post_date='2025-01-20 09:00:00', reactions=0):
+    return ['Target', post_date, comment_id, None, f'text {comment_id}', comment_date, 'initial', reactions]
+
+
+def _reference_combine(raw_dir):
+    """Sequential uncached load followed by a full drop_duplicates."""
+    files = discover_company_files(raw_dir)
+    frames = [process_company_file(path, company) for _, company, path in files]
+    combined = pd.concat([f for f in frames if f is not None], ignore_index=True)
+    return combined.drop_duplicates(subset=['id'], keep='first').reset_index(drop=True)
+
+
+def _cached_combine(raw_dir, cache_dir):
+    """One run of the cached loader and persistent id index, as in __main__."""
+    files = discover_company_files(raw_dir)
+    frames, new_sources, stale = load_company_frames(files, cache_dir, workers=2)
+    index_path = cache_dir / 'id_index.parquet'
+    index = pd.read_parquet(index_path) if index_path.exists() else None
+    index = update_id_index(index, frames, new_sources, rebuild=stale)
+    index.to_parquet(index_path, index=False)
+    return combine_frames(frames, index), new_sources, stale
+
+
+def _normalized(df):
+    # Parquet round trips turn NaN in object columns into None
+    return df.astype(object).where(df.notna(), None)
+
+
+def test_cached_loader_matches_full_reload(tmp_path):
+    """Cold, warm and incremental runs give the same combined frame as a full reload."""
+    raw, cache = tmp_path / 'raw', tmp_path / 'cache'
+    _write_raw(raw / 'Target' / 'before_DEI' / 'a.csv', [_row('1', '2025-01-21'), _row('2', '2025-01-25')])
+    _write_raw(raw / 'Target' / 'before_DEI' / 'b.csv', [_row('2', '2025-01-26', reactions=5), _row('3', '2025-01-27')])
+
+    combined, new_sources, _ = _cached_combine(raw, cache)
+    assert len(new_sources) == 2
+    pd.testing.assert_frame_equal(_normalized(combined), _normalized(_reference_combine(raw)))
+
+    combined, new_sources, stale = _cached_combine(raw, cache)
+    assert new_sources == [] and not stale
+    pd.testing.assert_frame_equal(_normalized(combined), _normalized(_reference_combine(raw)))
+
+    # A new scrape sorting before the cached files takes ownership of shared ids
+    _write_raw(raw / 'Target' / 'after_DEI' / 'c.csv', [_row('3', '2025-01-28', reactions=9), _row('4', '2025-01-29')])
+    combined, new_sources, stale = _cached_combine(raw, cache)
+    assert new_sources == ['Target/after_DEI/c.csv'] and not stale
+    pd.testing.assert_frame_equal(_normalized(combined), _normalized(_reference_combine(raw)))
+    assert combined.loc[combined['id'] == '3', 'reaction_count'].item() == 9
+
+
+def test_cached_loader_rebuilds_after_modification(tmp_path):
+    """Modified or removed files invalidate their cache entry and the id index."""
+    raw, cache = tmp_path / 'raw', tmp_path / 'cache'
+    a = raw / 'Target' / 'before_DEI' / 'a.csv'
+    b = raw / 'Target' / 'before_DEI' / 'b.csv'
+    _write_raw(a, [_row('1', '2025-01-21'), _row('2', '2025-01-25')])
+    _write_raw(b, [_row('2', '2025-01-26'), _row('3', '2025-01-27')])
+    _cached_combine(raw, cache)
+
+    _write_raw(a, [_row('1', '2025-01-21'), _row('1', '2025-01-22'), _row('5', '2025-01-23')])
+    combined, new_sources, stale = _cached_combine(raw, cache)
+    assert new_sources == ['Target/before_DEI/a.csv'] and stale
+    pd.testing.assert_frame_equal(_normalized(combined), _normalized(_reference_combine(raw)))
+
+    b.unlink()
+    combined, new_sources, stale = _cached_combine(raw, cache)
+    assert new_sources == [] and stale
+    pd.testing.assert_frame_equal(_normalized(combined), _normalized(_reference_combine(raw)))
+    assert len(list((cache / 'frames').iterdir())) == 1
+
+
+def test_cached_loader_rebuilds_after_config_change(tmp_path, monkeypatch):
+    """A changed cutoff date invalidates cached frames even though no raw file changed."""
+    import scripts.preprocess.combine_company_csv as combine
+
+    raw, cache = tmp_path / 'raw', tmp_path / 'cache'
+    _write_raw(raw / 'Target' / 'before_DEI' / 'a.csv', [_row('1', '2025-01-21'), _row('2', '2025-01-25')])
+    combined, _, _ = _cached_combine(raw, cache)
+    assert combined['before_DEI'].tolist() == [1, 0]
+
+    monkeypatch.setitem(combine.DEI_CUTOFF_DATES, 'Target', pd.Timestamp('2025-01-30').to_pydatetime())
+    combined, new_sources, stale = _cached_combine(raw, cache)
+    assert new_sources == ['Target/before_DEI/a.csv'] and stale
+    assert combined['before_DEI'].tolist() == [1, 1]
+    pd.testing.assert_frame_equal(_normalized(combined), _normalized(_reference_combine(raw)))
+
+    combined, new_sources, stale = _cached_combine(raw, cache)
+    assert new_sources == [] and not stale
+
+
+def test_non_integer_reaction_counts_do_not_skip_the_file(tmp_path):
+    path = tmp_path / 'Target' / 'before_DEI' / 'a.csv'
+    _write_raw(path, [_row('1', '2025-01-21', reactions='1.2K'), _row('2', '2025-01-22', reactions=7),
+                      _row('3', '2025-01-22', reactions=2.5), _row('4', '2025-01-22', reactions=None)])
+    df = process_company_file(path, 'Target')
+    assert df is not None and df['reaction_count'].dtype == 'Int64'
+    assert df['reaction_count'].tolist()[1] == 7
+    assert df['reaction_count'].isna().tolist() == [True, False, True, True]
@@ -0,0 +1,55 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LogisticRegression
+
+from scripts.model.cv_relevance_model import make_tasks, run_cv, summarize_metrics
+from scripts.model.train_relevance_model import compute_metrics
+
+
+def fit_logreg_fold(dataset_path, seed, fold, train_idx, test_idx, head_params):
+    """Stand-in for train_fold: a logistic regression on the arrays saved at dataset_path."""
+    assert os.environ["OMP_NUM_THREADS"] == "1"
+    with np.load(dataset_path) as data:
+        X, y = data["X"], data["y"]
+    head = LogisticRegression(random_state=seed, **head_params).fit(X[train_idx], y[train_idx])
+    return {**compute_metrics(head.predict(X[test_idx]), y[test_idx]), "pid": os.getpid()}
+
+
+def test_make_tasks_covers_every_row_once_per_seed():
+    labels = np.array([0] * 70 + [1] * 30)
+    tasks = make_tasks(labels, folds=5, seeds=[1, 2])
+    assert [(seed, fold) for seed, fold, _, _ in tasks] == [(s, f) for s in (1, 2) for f in range(5)]
+    for seed in (1, 2):
+        test_rows = np.concatenate([test for s, _, _, test in tasks if s == seed])
+        assert sorted(test_rows) == list(range(100))
+    for _, _, train, test in tasks:
+        assert not set(train) & set(test) and labels[test].sum() == 6
+    assert not np.array_equal(tasks[0][3], tasks[5][3])
+
+
+def test_summarize_metrics_t_interval():
+    results = pd.DataFrame({"seed": [1, 1, 2, 2], "fold": [0, 1, 0, 1],
+                            "f1": [0.8, 0.9, 0.85, 0.75], "seconds": [1.0, 2.0, 1.0, 2.0]})
+    summary = summarize_metrics(results)
+    assert list(summary.index) == ["f1"]
+    row = summary.loc["f1"]
+    half = 3.182446305284263 * np.std([0.8, 0.9, 0.85, 0.75], ddof=1) / 2
+    assert row["mean"] == pytest.approx(0.825)
+    assert row["ci_low"] == pytest.approx(0.825 - half) and row["ci_high"] == pytest.approx(0.825 + half)
+
+
+def test_run_cv_in_worker_processes(tmp_path):
+    rng = np.random.default_rng(0)
+    y = rng.integers(0, 2, size=120)
+    X = rng.normal(size=(120, 4)) + y[:, None]
+    dataset_path = tmp_path / "data.npz"
+    np.savez(dataset_path, X=X, y=y)
+
+    tasks = make_tasks(y, folds=3, seeds=[7, 8])
+    results = run_cv(tasks, str(dataset_path), workers=2, threads=1, head_params={"C": 0.5}, train=fit_logreg_fold)
+    assert list(results[["seed", "fold"]].itertuples(index=False, name=None)) == [(s, f) for s in (7, 8) for f in range(3)]
+    assert results["pid"].nunique() <= 2 and os.getpid() not in set(results["pid"])
+    assert (results["accuracy"] > 0.6).all() and (results["seconds"] > 0).all()
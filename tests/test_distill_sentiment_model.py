@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts.model.distill_sentiment_model import (
+    CLASSES,
+    SentimentStudent,
+    ensemble_targets,
+    fit_soft_head,
+    smoothed_one_hot,
+    teacher_agreement,
+    teacher_targets,
+    train_student,
+)
+
+
+def test_smoothed_one_hot_keeps_the_label_on_top():
+    targets = smoothed_one_hot([-1, 1, 0], smoothing=0.3)
+    np.testing.assert_allclose(targets.sum(axis=1), 1.0)
+    assert CLASSES[targets.argmax(axis=1)].tolist() == [-1, 1, 0]
+    np.testing.assert_allclose(targets[0], [0.8, 0.1, 0.1])
+
+
+def test_teacher_targets_drops_failed_answers():
+    df = pd.DataFrame({
+        'gpt4o_pred_stance_label': [1, 0, -1],
+        'gpt4o_pred_stance_str': ['pro', 'api_error', 'anti'],
+    })
+    targets, valid = teacher_targets(df, 'gpt4o', 'stance', smoothing=0.0)
+    assert valid.tolist() == [True, False, True]
+    np.testing.assert_allclose(targets[[0, 2]], [[0, 0, 1], [1, 0, 0]])
+
+
+def test_teacher_targets_prefers_probability_columns():
+    df = pd.DataFrame({
+        'deberta_pred_pi_label': [0, 0],
+        'deberta_pi_prob_boycott': [0.6, np.nan],
+        'deberta_pi_prob_neutral': [0.3, 0.5],
+        'deberta_pi_prob_buy': [0.1, 0.5],
+    })
+    targets, valid = teacher_targets(df, 'deberta', 'pi')
+    assert valid.tolist() == [True, False]
+    np.testing.assert_allclose(targets[0], [0.6, 0.3, 0.1])
+
+
+def test_ensemble_targets_average_teachers():
+    df = pd.DataFrame({'a_pred_stance_label': [1, 1], 'b_pred_stance_label': [-1, 7]})
+    targets, valid = ensemble_targets(df, ['a', 'b'], 'stance', smoothing=0.0)
+    assert valid.tolist() == [True, False]
+    np.testing.assert_allclose(targets[0], [0.5, 0, 0.5])
+
+
+def test_fit_soft_head_matches_soft_targets():
+    """With an uninformative input the fitted distribution is the mean soft target."""
+    X = np.zeros((50, 4))
+    targets = np.tile([0.2, 0.5, 0.3], (50, 1))
+    head = fit_soft_head(X, targets, l2=0.0)
+    np.testing.assert_allclose(head.predict_proba(X[:1])[0], [0.2, 0.5, 0.3], atol=1e-4)
+
+
+def _blobs(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    y = rng.choice(CLASSES, size=n)
+    centers = {-1: [3.0, 0.0, 0.0], 0: [0.0, 3.0, 0.0], 1: [0.0, 0.0, 3.0]}
+    X = np.array([centers[c] for c in y]) + rng.normal(size=(n, 3))
+    return X, y
+
+
+def test_fit_soft_head_separates_classes():
+    X, y = _blobs()
+    head = fit_soft_head(X, smoothed_one_hot(y))
+    assert np.mean(head.predict(X) == y) > 0.95
+
+
+def test_teacher_agreement_perfect():
+    metrics = teacher_agreement(np.array([-1, 0, 1, 1]), np.array([-1, 0, 1, 1]))
+    assert metrics == pytest.approx({'agreement': 1.0, 'kappa': 1.0, 'macro_f1': 1.0})
+
+
+def test_train_student_reports_and_roundtrips(tmp_path):
+    X, y = _blobs()
+    df = pd.DataFrame({
+        'gpt4o_pred_stance_label': y,
+        'gpt4o_pred_pi_label': -y,
+        'stance_dei_label': y,
+    })
+    student, report = train_student(X, df, ['gpt4o'])
+    assert report['axis'].tolist() == ['stance', 'pi']
+    assert (report['agreement'] > 0.9).all()
+    assert report.loc[0, 'n_gold'] == report.loc[0, 'n_holdout'] == 60
+    assert report.loc[0, 'teacher_gold_macro_f1'] == 1.0
+    assert np.isnan(report.loc[1, 'n_gold'])
+
+    student.meta = {'teachers': ['gpt4o']}
+    student.save(tmp_path)
+    reloaded = SentimentStudent.load(tmp_path)
+    frame = reloaded.predict_frame(X)
+    pd.testing.assert_frame_equal(frame, student.predict_frame(X))
+    assert list(frame.columns) == ['student_pred_stance_label', 'student_pred_stance_conf',
+                                   'student_pred_pi_label', 'student_pred_pi_conf']
+    assert np.mean(frame['student_pred_pi_label'] == -y) > 0.95
@@ -0,0 +1,90 @@
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+
+from scripts.model import embedding_cache
+from scripts.model.embedding_cache import EmbeddingCache, model_fingerprint, text_keys
+from scripts.model.relevance_inference import embed_with_cache, predict_head, predict_relevance
+
+DIM = 8
+
+
+class CountingBody:
+    """Deterministic stand-in for the sentence-transformer body that records what it encodes."""
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, batch_size, normalize_embeddings, convert_to_numpy, show_progress_bar):
+        self.encoded.extend(texts)
+        return np.array([np.random.default_rng(sum(map(ord, t))).normal(size=DIM) for t in texts])
+
+    def get_sentence_embedding_dimension(self):
+        return DIM
+
+
+class TinyModel:
+    normalize_embeddings = False
+
+    def __init__(self):
+        self.model_body = CountingBody()
+        rng = np.random.default_rng(0)
+        self.model_head = LogisticRegression().fit(rng.normal(size=(20, DIM)), [0, 1] * 10)
+
+
+def test_text_keys_normalize_whitespace():
+    keys = text_keys(["boycott  target", " boycott target\n", "boycott targets"])
+    assert keys[0] == keys[1] != keys[2]
+    assert keys.dtype == np.dtype("S32")
+
+
+def test_cache_round_trip_and_compaction(tmp_path, monkeypatch):
+    """Vectors survive reopening (memory-mapped) and many segments compact into one."""
+    monkeypatch.setattr(embedding_cache, "MAX_SEGMENTS", 3)
+    rng = np.random.default_rng(1)
+    cache = EmbeddingCache(tmp_path, "fp")
+    added = {}
+    for batch in range(5):
+        keys = text_keys([f"text {batch} {i}" for i in range(4)])
+        vectors = rng.normal(size=(4, DIM)).astype(np.float32)
+        cache.add(keys, vectors)
+        added.update(zip(keys, vectors))
+    assert len(list((tmp_path / "fp").glob("keys-*.npy"))) <= 3
+
+    reopened = EmbeddingCache(tmp_path, "fp")
+    keys = np.array(list(added) + [text_keys(["unseen"])[0]], dtype="S32")
+    rows = reopened.lookup(keys)
+    assert rows[-1] == -1 and (rows[:-1] >= 0).all()
+    np.testing.assert_array_equal(reopened.get(rows[:-1]), np.array(list(added.values())))
+    assert reopened.stats()["hits"] == len(added) and reopened.stats()["misses"] == 1
+
+
+def test_model_fingerprint_ignores_head(tmp_path):
+    (tmp_path / "config.json").write_text("{}")
+    (tmp_path / "model_head.pkl").write_bytes(b"head v1")
+    before = model_fingerprint(tmp_path)
+    (tmp_path / "model_head.pkl").write_bytes(b"head v2")
+    assert model_fingerprint(tmp_path) == before
+    (tmp_path / "onnx").mkdir()
+    (tmp_path / "onnx" / "model.onnx").write_bytes(b"exported body")
+    assert model_fingerprint(tmp_path) == before
+    (tmp_path / "config.json").write_text('{"hidden": 1}')
+    assert model_fingerprint(tmp_path) != before
+
+
+def test_embed_with_cache_only_encodes_misses(tmp_path):
+    """Duplicates are encoded once and a second run is served entirely from the cache."""
+    model = TinyModel()
+    texts = ["boycott target", "boycott  target", "great prices", "🎯", "great prices"]
+    uncached = embed_with_cache(model, texts)
+    assert sorted(model.model_body.encoded) == ["boycott target", "great prices", "🎯"]
+
+    cache = EmbeddingCache(tmp_path, "fp")
+    first = embed_with_cache(model, texts, cache)
+    model.model_body.encoded.clear()
+    second = embed_with_cache(model, texts + ["new comment"], EmbeddingCache(tmp_path, "fp"))
+    assert model.model_body.encoded == ["new comment"]
+    np.testing.assert_allclose(first, uncached)
+    np.testing.assert_allclose(second[:-1], first)
+
+    expected = predict_head(model, uncached)
+    np.testing.assert_array_equal(predict_relevance(model, texts, EmbeddingCache(tmp_path, "fp")), expected)
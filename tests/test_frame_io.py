@@ -0,0 +1,79 @@
+import pandas as pd
+import pytest
+
+from scripts.frame_io import (
+    ChunkedFrameWriter,
+    artifact_path,
+    find_artifact,
+    frame_columns,
+    iter_frames,
+    read_frame,
+    write_frame,
+)
+
+
+@pytest.fixture
+def derived_df() -> pd.DataFrame:
+    return pd.DataFrame({
+        'company_name': ['Target', 'Costco', 'Target'],
+        'post_date': ['2025-01-24 08:17:00', '2025-01-23 09:00:00', '2025-01-24 08:17:00'],
+        'comment_date': ['2025-01-25', '', '2025-01-26'],
+        'id': ['c1', 'c2', 'c3'],
+        'comment_type': ['initial', 'initial', 'reply'],
+        'time_since_root': ['0 days 00:00:00', '0 days 00:00:00', '1 days 00:00:00'],
+        'before_DEI': pd.array([0, 1, pd.NA], dtype='Int64'),
+    })
+
+
+def test_parquet_round_trip_is_typed(derived_df, tmp_path):
+    """Parquet keeps categoricals, datetimes, timedeltas and nullable ints."""
+    path = artifact_path(tmp_path, "combined_comments")
+    assert path.suffix == ".parquet"
+    write_frame(derived_df, path)
+    df = read_frame(path)
+
+    assert isinstance(df['company_name'].dtype, pd.CategoricalDtype)
+    assert isinstance(df['comment_type'].dtype, pd.CategoricalDtype)
+    assert pd.api.types.is_datetime64_any_dtype(df['post_date'])
+    assert pd.isna(df.loc[1, 'comment_date'])
+    assert df.loc[2, 'time_since_root'] == pd.Timedelta(days=1)
+    assert df['before_DEI'].dtype == 'Int64'
+
+
+def test_csv_export_reads_back_with_same_schema(derived_df, tmp_path):
+    """A CSV export and a Parquet artifact load into identical frames."""
+    csv_path = artifact_path(tmp_path, "graphed_comments", "csv")
+    parquet_path = artifact_path(tmp_path, "graphed_comments", "parquet")
+    write_frame(derived_df, csv_path)
+    write_frame(derived_df, parquet_path)
+    pd.testing.assert_frame_equal(read_frame(csv_path), read_frame(parquet_path), check_categorical=False)
+
+
+def test_find_artifact_prefers_parquet(derived_df, tmp_path):
+    write_frame(derived_df, artifact_path(tmp_path, "stage", "csv"))
+    assert find_artifact(tmp_path, "stage").suffix == ".csv"
+    write_frame(derived_df, artifact_path(tmp_path, "stage", "parquet"))
+    assert find_artifact(tmp_path, "stage").suffix == ".parquet"
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "csv"])
+def test_frame_columns_reads_only_the_header(derived_df, tmp_path, fmt):
+    path = artifact_path(tmp_path, "stage", fmt)
+    write_frame(derived_df, path)
+    assert frame_columns(path) == list(derived_df.columns)
+
+
+@pytest.mark.parametrize("suffix", [".parquet", ".csv"])
+def test_chunked_writer_round_trip(derived_df, tmp_path, suffix):
+    """Chunks written one by one read back like a single write_frame."""
+    path = tmp_path / f"out{suffix}"
+    derived_df['parent_id'] = [None, None, 'c1']  # first chunk has an all-null column
+    with ChunkedFrameWriter(path) as writer:
+        writer.write(derived_df.iloc[:2])
+        writer.write(derived_df.iloc[2:])
+    assert writer.rows_written == 3
+
+    expected_path = tmp_path / f"expected{suffix}"
+    write_frame(derived_df, expected_path)
+    pd.testing.assert_frame_equal(read_frame(path), read_frame(expected_path))
+    assert [len(chunk) for chunk in iter_frames(path, 2)] == [2, 1]
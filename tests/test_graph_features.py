@@ -6,7 +6,8 @@ from datetime import datetime, timedelta
 # Remove sys.path manipulation
 
 # Revert to original import style
-from scripts.preprocess.graph_features import calculate_graph_features
+from scripts.preprocess import graph_features
+from scripts.preprocess.graph_features import _balance_shards, calculate_graph_features
 
 @pytest.fixture
 def sample_comments_df() -> pd.DataFrame:
@@ -141,6 +142,102 @@ def test_input_with_nat_dates(sample_comments_df):
     assert df_result.loc[df_result['id'] == 'b2', 'time_since_root'].iloc[0] == timedelta(minutes=10)
 
 
+
+@pytest.mark.parametrize("engine", ["vectorized", "networkx"])
+def test_engines_match_fixture(sample_comments_df, engine):
+    """Both engines reproduce the expected per-comment features."""
+    df_result = calculate_graph_features(sample_comments_df.copy(), engine=engine).set_index('id')
+    assert df_result.loc['a4', 'root_id'] == 'a1'
+    assert df_result.loc['a4', 'depth'] == 2
+    assert df_result.loc['a1', 'sibling_count'] == 2
+    assert df_result.loc['b3', 'sibling_count'] == 1
+    assert df_result.loc['a4', 'time_since_root'] == timedelta(minutes=20)
+
+
+def test_vectorized_matches_networkx_on_edge_cases():
+    """Cycles, self-parents, orphans and NaT dates resolve identically in both engines."""
+    data = {
+        'company_name': ['A'] * 9 + ['B'] * 3,
+        'post_date': ['2024-01-01 10:00:00'] * 9 + ['2024-01-02 10:00:00'] * 3,
+        'id': ['r1', 'c1', 'c2', 'c3', 'x1', 'x2', 'x3', 's1', 'o1', 'r1', 'c1', 'c2'],
+        'parent_id': [np.nan, 'r1', 'c1', 'c2', 'x2', 'x1', 'x1', 's1', 'zz', '', 'r1', 'r1'],
+        'comment_date': [
+            '2024-01-01 10:05:00', '2024-01-01 10:00:00', None, '2024-01-01 12:00:30',
+            '2024-01-01 10:05:00', '2024-01-01 10:06:00', '2024-01-01 10:07:00',
+            None, '2024-01-01 10:09:00',
+            '2024-01-02 10:05:00', '2024-01-02 10:06:00', '2024-01-02 10:07:00',
+        ],
+    }
+    df_input = pd.DataFrame(data)
+
+    key = ['id', 'root_id']
+    expected = calculate_graph_features(df_input, engine="networkx").sort_values(key).reset_index(drop=True)
+    result = calculate_graph_features(df_input, engine="vectorized").sort_values(key).reset_index(drop=True)
+    pd.testing.assert_frame_equal(result, expected)
+
+    # c1 was posted before its root, so its offset is clamped to zero
+    by_id = result[result['root_id'] == 'r1'].drop_duplicates('id').set_index('id')
+    assert by_id.loc['c1', 'time_since_root'] == timedelta(0)
+    # x1/x2 form a reply cycle; they and x3 (hanging off the cycle) become isolated roots
+    isolated = result[result['id'].isin(['x1', 'x2', 'x3', 's1'])]
+    assert (isolated['depth'] == 0).all()
+    assert (isolated['root_id'] == isolated['id']).all()
+
+
+def test_unknown_engine(sample_comments_df):
+    with pytest.raises(ValueError, match="Unknown engine"):
+        calculate_graph_features(sample_comments_df, engine="igraph")
+
+
+@pytest.mark.parametrize("engine", ["vectorized", "networkx"])
+def test_parallel_workers_match_serial(sample_comments_df, engine):
+    """Sharding posts over a process pool returns the serial result in input order."""
+    serial = calculate_graph_features(sample_comments_df, engine="vectorized")
+    parallel = calculate_graph_features(sample_comments_df, engine=engine, workers=2)
+    pd.testing.assert_frame_equal(parallel, serial)
+
+
+def test_balance_shards_isolates_viral_post():
+    """The largest post gets its own shard; the long tail fills the others evenly."""
+    sizes = pd.Series({'viral': 1000, 'p1': 300, 'p2': 300, 'p3': 200, 'p4': 200, 'p5': 100})
+    shards = _balance_shards(sizes, 3)
+    assert shards[0] == ['viral']
+    loads = sorted(sum(sizes[p] for p in shard) for shard in shards)
+    assert loads == [500, 600, 1000]
+
+
+def test_incremental_cache_recomputes_only_changed_posts(sample_comments_df, tmp_path, monkeypatch):
+    """A second run with one edited post only recomputes that post and matches a full run."""
+    cache = tmp_path / "graph_cache.parquet"
+    first = calculate_graph_features(sample_comments_df, cache_path=cache)
+    pd.testing.assert_frame_equal(first, calculate_graph_features(sample_comments_df))
+    assert cache.exists()
+
+    # New reply arrives on post B; post A is untouched
+    new_row = sample_comments_df[sample_comments_df['id'] == 'b2'].assign(
+        id='b5', parent_id='b2', comment_date=pd.Timestamp('2024-02-15 13:00:00')
+    )
+    updated = pd.concat([sample_comments_df, new_row], ignore_index=True)
+
+    seen = []
+    engine = graph_features._ENGINE_FUNCS["vectorized"]
+    def spy(df):
+        seen.extend(df['id'])
+        return engine(df)
+    monkeypatch.setitem(graph_features._ENGINE_FUNCS, "vectorized", spy)
+
+    second = calculate_graph_features(updated, cache_path=cache)
+    assert sorted(seen) == ['b1', 'b2', 'b3', 'b5']
+    monkeypatch.undo()
+    pd.testing.assert_frame_equal(second, calculate_graph_features(updated))
+
+    # Nothing changed: everything is served from the cache
+    seen.clear()
+    monkeypatch.setitem(graph_features._ENGINE_FUNCS, "vectorized", spy)
+    third = calculate_graph_features(updated, cache_path=cache)
+    assert seen == []
+    pd.testing.assert_frame_equal(third, second)
+
 # Consider adding more tests:
 # - Test with only root comments
 # - Test with very deep nesting
@@ -0,0 +1,49 @@
+import os
+
+import numpy as np
+import pytest
+
+from scripts.model.inference_pool import InferencePool
+from scripts.model.relevance_inference import embed_with_cache
+
+
+class PidBody:
+    """Stand-in body: embeds a text as [len, word count] plus the encoding process id."""
+
+    def encode(self, texts, batch_size, normalize_embeddings, convert_to_numpy, show_progress_bar):
+        return np.array([[len(t), len(t.split()), os.getpid()] for t in texts], dtype=np.float64)
+
+    def get_sentence_embedding_dimension(self):
+        return 3
+
+
+class PidModel:
+    normalize_embeddings = False
+    model_body = PidBody()
+
+
+def load_pid_model(model_dir):
+    assert os.environ["OMP_NUM_THREADS"] == "1"
+    return PidModel()
+
+
+def test_pool_encodes_in_workers_in_input_order():
+    texts = [f"comment {'x ' * (i % 7)}{i}" for i in range(103)]
+    with InferencePool("unused", workers=2, shard_size=10, max_tokens=None, loader=load_pid_model) as pool:
+        embeddings = pool.encode(texts)
+
+    expected = np.array([[len(t), len(t.split())] for t in texts], dtype=np.float32)
+    np.testing.assert_array_equal(embeddings[:, :2], expected)
+    assert os.getpid() not in set(embeddings[:, 2].astype(int).tolist())
+
+
+def test_embed_with_cache_uses_pool():
+    texts = ["a b", "c", "a b"]
+    with InferencePool("unused", workers=2, max_tokens=None, loader=load_pid_model) as pool:
+        embeddings = embed_with_cache(PidModel(), texts, pool=pool)
+    np.testing.assert_array_equal(embeddings[:, :2], [[3, 2], [1, 1], [3, 2]])
+
+
+def test_pool_rejects_bad_sizes():
+    with pytest.raises(ValueError):
+        InferencePool("unused", workers=0, loader=load_pid_model)
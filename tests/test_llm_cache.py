@@ -0,0 +1,29 @@
+from scripts.model.llm_cache import ResponseCache, cache_key
+
+
+def _payload(content, system="classify", temperature=0.0):
+    return {"model": "gpt-4o", "temperature": temperature, "max_tokens": 256,
+            "messages": [{"role": "system", "content": system}, {"role": "user", "content": content}]}
+
+
+def test_cache_key_covers_prompt_content_and_params():
+    base = cache_key(_payload("hi"))
+    assert cache_key(dict(reversed(list(_payload("hi").items())))) == base # key order does not matter
+    assert cache_key(_payload("hi", system="classify!")) != base
+    assert cache_key(_payload("hi!")) != base
+    assert cache_key(_payload("hi", temperature=0.2)) != base
+    assert cache_key({**_payload("hi"), "model": "gpt-4o-mini"}) != base
+
+
+def test_response_cache_persists_and_counts(tmp_path):
+    path = tmp_path / "sub" / "llm.sqlite"
+    cache = ResponseCache(path)
+    assert cache.get(_payload("a")) is None
+    response = {"choices": [{"message": {"content": '{"stance": "pro", "pi": "buy"}'}}]}
+    cache.put(_payload("a"), response)
+    assert cache.get(_payload("a")) == response
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5, "size": 1}
+    cache.close()
+
+    reopened = ResponseCache(path)
+    assert reopened.get(_payload("a")) == response and len(reopened) == 1
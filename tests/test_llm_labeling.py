@@ -0,0 +1,376 @@
+import asyncio
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+from scripts.model.llm_cache import CacheMiss, ResponseCache
+from scripts.model.llm_labeling import (
+    ChatClient,
+    Labeler,
+    TokenBucket,
+    backoff_delay,
+    evaluation_report,
+    joined_text,
+    label_frame,
+    mode_agreement,
+    parse_labels,
+    parse_packed,
+    read_progress,
+    usage_per_comment,
+)
+
+
+def _classify(text):
+    reply = text.split("<REPLY>")[-1].lower()
+    stance = "anti" if "woke" in reply else "pro" if "dei" in reply else "neutral"
+    pi = "boycott" if "boycott" in reply else "buy" if "renew" in reply else "neutral"
+    return {"stance": stance, "pi": pi}
+
+
+def fake_answer(user_content):
+    packed = re.findall(r"^\[(\d+)\] «(.*?)»$", user_content, flags=re.M)
+    if packed:
+        # A pack containing a "garble" comment gets an answer that drops its last index
+        items = [{"index": int(i), **_classify(text)} for i, text in packed]
+        if any("garble" in text for _, text in packed):
+            items = items[:-1]
+        return json.dumps(items)
+    reply = user_content.split("<REPLY>")[-1].lower()
+    answer = json.dumps(_classify(user_content))
+    return f"```json\n{answer}\n```" if "fenced" in reply else answer
+
+
+class MockOpenAI(ThreadingHTTPServer):
+    """OpenAI-compatible /v1/chat/completions stub with scripted failures and in-flight tracking."""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, failures=(), delay=0.02):
+        super().__init__(("127.0.0.1", 0), _MockHandler)
+        self.failures = list(failures) # statuses returned (in order) before answering normally
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.in_flight = self.max_in_flight = 0
+        self.contents = []
+        self.statuses = []
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_port}/v1"
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server.lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            status = server.failures.pop(0) if server.failures else 200 # or a malformed 200, see below
+            server.statuses.append(status)
+        time.sleep(server.delay)
+        with server.lock:
+            server.in_flight -= 1
+        if status == "no_choices":
+            body = b'{"usage": {"prompt_tokens": 1, "completion_tokens": 0}}'
+            self.send_response(200)
+        elif status == "html":
+            body = b"<html><body>502 Bad Gateway</body></html>"
+            self.send_response(200)
+        elif status == "truncated":
+            self.send_response(200)
+            self.send_header("Content-Length", "100")
+            self.end_headers()
+            self.wfile.write(b'{"choices": [')
+            return
+        elif status != 200:
+            body = b'{"error": {"message": "rate limited"}}'
+            self.send_response(status)
+            if status == 429:
+                self.send_header("retry-after-ms", "10")
+        else:
+            user = payload["messages"][-1]["content"]
+            with server.lock:
+                server.contents.append(user)
+            body = json.dumps({
+                "choices": [{"message": {"role": "assistant", "content": fake_answer(user)}}],
+                "usage": {"prompt_tokens": sum(len(m["content"]) for m in payload["messages"]) // 4,
+                          "completion_tokens": len(fake_answer(user)) // 4},
+            }).encode("utf-8")
+            self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def mock_server():
+    servers = []
+
+    def start(**kwargs):
+        server = MockOpenAI(**kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _frame(n, unique=True):
+    texts = ["Go woke go broke, boycott", "Love DEI, renewing my membership", "nice weather", "fenced dei boycott"]
+    full_texts = [texts[i % 4] + (f" #{i}" if unique else "") for i in range(n)]
+    return pd.DataFrame({"id": [f"c{i}" for i in range(n)], "full_text": full_texts})
+
+
+def test_joined_text_and_parse_labels():
+    assert joined_text("parent → child") == "<CONTEXT> parent </CONTEXT> <REPLY> child </REPLY>"
+    assert joined_text("only") == "<REPLY> only </REPLY>"
+    assert joined_text(float("nan")) == ""
+    assert parse_labels('```json\n{"stance": "pro", "pi": "buy"}\n```') == ("pro", "buy")
+    assert parse_labels('{"stance": "anti"}') == ("anti", "error_key_missing")
+    with pytest.raises(ValueError):
+        parse_labels("not json")
+
+
+def test_backoff_delay_is_jittered_and_capped():
+    delays = [backoff_delay(10, base=1.0, cap=5.0) for _ in range(200)]
+    assert all(0 <= d <= 5.0 for d in delays) and len(set(delays)) > 1
+
+
+def test_token_bucket_enforces_rate():
+    async def take(n):
+        bucket = TokenBucket(per_minute=6000, capacity=1) # 100 per second, no burst
+        start = time.perf_counter()
+        for _ in range(n):
+            await bucket.acquire()
+        return time.perf_counter() - start
+
+    assert asyncio.run(take(21)) >= 0.19
+
+
+def test_labels_concurrently_and_maps_predictions(mock_server, tmp_path):
+    server = mock_server(delay=0.05)
+    df = _frame(40)
+    labeler = Labeler(ChatClient(server.base_url), concurrency=8, rpm=60000, tpm=10**8)
+    start = time.perf_counter()
+    out = label_frame(df, tmp_path / "progress.jsonl", labeler)
+    elapsed = time.perf_counter() - start
+
+    assert 1 < server.max_in_flight <= 8
+    assert elapsed < 40 * 0.05 / 2 # well under the sequential time
+    assert out["gpt4o_pred_stance_str"].tolist()[:4] == ["anti", "pro", "neutral", "pro"]
+    assert out["gpt4o_pred_pi_label"].tolist()[:4] == [-1, 1, 0, -1]
+    assert labeler.stats["ok"] == 40 and labeler.stats["requests"] == 40
+    assert len(read_progress(tmp_path / "progress.jsonl")) == 40
+
+
+def test_retries_rate_limits_and_server_errors(mock_server, tmp_path):
+    server = mock_server(failures=[429, 503, 429])
+    labeler = Labeler(ChatClient(server.base_url), concurrency=1, rpm=60000, tpm=10**8, max_retries=3,
+                      backoff_base=0.01, seed=0)
+    out = label_frame(_frame(2), tmp_path / "progress.jsonl", labeler)
+    assert server.statuses[:3] == [429, 503, 429]
+    assert labeler.stats["retries"] == 3 and labeler.stats["ok"] == 2
+    assert out["gpt4o_pred_stance_str"].tolist() == ["anti", "pro"]
+
+
+def test_gives_up_after_max_retries_and_resume_retries_api_errors(mock_server, tmp_path):
+    server = mock_server(failures=[500] * 3)
+    progress = tmp_path / "progress.jsonl"
+    labeler = Labeler(ChatClient(server.base_url), concurrency=1, rpm=60000, tpm=10**8, max_retries=2,
+                      backoff_base=0.01, seed=0)
+    out = label_frame(_frame(3), progress, labeler)
+    assert out["gpt4o_pred_stance_str"].tolist() == ["api_error", "pro", "neutral"]
+
+    server.contents.clear()
+    resumed = Labeler(ChatClient(server.base_url), concurrency=2, rpm=60000, tpm=10**8)
+    out = label_frame(_frame(3), progress, resumed)
+    assert len(server.contents) == 1 # only the failed comment is sent again
+    assert out["gpt4o_pred_stance_str"].tolist() == ["anti", "pro", "neutral"]
+
+
+def test_resume_skips_labeled_ids_and_truncated_lines(mock_server, tmp_path):
+    server = mock_server()
+    progress = tmp_path / "progress.jsonl"
+    labeler = Labeler(ChatClient(server.base_url), concurrency=2, rpm=60000, tpm=10**8)
+    done = {"id": "c0", "stance": "pro", "pi": "buy", "status": "ok", "raw": "", "run": labeler.run_key}
+    progress.write_text(json.dumps(done) + "\n" + '{"id": "c1", "sta')
+    out = label_frame(_frame(4), progress, labeler)
+    assert len(server.contents) == 3
+    assert out["gpt4o_pred_stance_str"].tolist() == ["pro", "pro", "neutral", "pro"]
+    assert set(read_progress(progress)) == {"c0", "c1", "c2", "c3"}
+
+
+def test_resume_relabels_records_from_another_configuration(mock_server, tmp_path):
+    server = mock_server()
+    progress = tmp_path / "progress.jsonl"
+    first = Labeler(ChatClient(server.base_url), model="gpt-4o", concurrency=2, rpm=60000, tpm=10**8)
+    label_frame(_frame(4), progress, first)
+    assert {r["run"] for r in read_progress(progress).values()} == {first.run_key}
+
+    server.contents.clear()
+    other = Labeler(ChatClient(server.base_url), model="gpt-4o-mini", concurrency=2, rpm=60000, tpm=10**8)
+    assert other.run_key != first.run_key
+    label_frame(_frame(4), progress, other)
+    assert len(server.contents) == 4
+    assert {r["run"] for r in read_progress(progress).values()} == {other.run_key}
+
+    # Records written before run keys existed are labeled again too
+    legacy = tmp_path / "legacy.jsonl"
+    legacy.write_text(json.dumps({"id": "c0", "stance": "pro", "pi": "buy", "status": "ok", "raw": ""}) + "\n")
+    server.contents.clear()
+    label_frame(_frame(1), legacy, other)
+    assert len(server.contents) == 1
+
+
+def test_response_without_choices_is_a_parse_error(mock_server, tmp_path):
+    server = mock_server(failures=["no_choices"])
+    labeler = Labeler(ChatClient(server.base_url), concurrency=1, rpm=60000, tpm=10**8)
+    out = label_frame(_frame(3), tmp_path / "progress.jsonl", labeler)
+    assert out["gpt4o_pred_stance_str"].tolist() == ["parse_error", "pro", "neutral"]
+    assert labeler.stats["parse_error"] == 1 and labeler.stats["ok"] == 2
+
+
+def test_non_json_and_truncated_responses_are_retried(mock_server, tmp_path):
+    server = mock_server(failures=["html", "truncated"])
+    labeler = Labeler(ChatClient(server.base_url), concurrency=1, rpm=60000, tpm=10**8, max_retries=3,
+                      backoff_base=0.01, seed=0)
+    out = label_frame(_frame(2), tmp_path / "progress.jsonl", labeler)
+    assert server.statuses[:3] == ["html", "truncated", 200]
+    assert labeler.stats["retries"] == 2 and labeler.stats["ok"] == 2
+    assert out["gpt4o_pred_stance_str"].tolist() == ["anti", "pro"]
+
+
+def test_cache_serves_reruns_and_offline_mode(mock_server, tmp_path):
+    server = mock_server()
+    cache = ResponseCache(tmp_path / "llm.sqlite")
+    df = _frame(8, unique=False) # four distinct texts, each twice
+
+    first = label_frame(df, tmp_path / "run1.jsonl", Labeler(ChatClient(server.base_url), concurrency=4,
+                                                            rpm=60000, tpm=10**8, cache=cache))
+    assert len(server.contents) == 4 # duplicates come from the cache or the identical in-flight request
+
+    server.contents.clear()
+    offline = Labeler(ChatClient("http://127.0.0.1:9"), cache=cache, offline=True)
+    second = label_frame(df, tmp_path / "run2.jsonl", offline)
+    assert server.contents == [] and offline.stats["requests"] == 0
+    pd.testing.assert_frame_equal(first, second)
+
+    with pytest.raises(CacheMiss):
+        label_frame(pd.DataFrame({"id": ["new"], "full_text": ["never seen"]}), tmp_path / "run3.jsonl", offline)
+
+
+def test_changed_system_prompt_relabels_despite_progress_and_cache(mock_server, tmp_path):
+    server = mock_server()
+    cache = ResponseCache(tmp_path / "llm.sqlite")
+    progress = tmp_path / "progress.jsonl"
+    df = _frame(8)
+
+    def run(**kwargs):
+        labeler = Labeler(ChatClient(server.base_url), concurrency=4, rpm=60000, tpm=10**8, cache=cache, **kwargs)
+        label_frame(df, progress, labeler)
+        return labeler
+
+    assert run().stats["requests"] == 8
+    changed = run(system_msg="A NEW SYSTEM PROMPT")
+    assert changed.stats["requests"] == 8 and changed.stats["ok"] == 8
+    assert {r["run"] for r in read_progress(progress).values()} == {changed.run_key}
+
+    # Back to the original prompt: labeled again, but every answer comes from the cache
+    original = run()
+    assert original.stats["requests"] == 0 and original.stats["ok"] == 8
+
+
+def test_responses_without_choices_are_not_cached(mock_server, tmp_path):
+    server = mock_server(failures=["no_choices"])
+    cache = ResponseCache(tmp_path / "llm.sqlite")
+    labeler = Labeler(ChatClient(server.base_url), concurrency=1, rpm=60000, tpm=10**8, cache=cache)
+    label_frame(_frame(3), tmp_path / "progress.jsonl", labeler)
+    assert labeler.stats["parse_error"] == 1 and len(cache) == 2
+
+
+def test_identical_requests_in_flight_are_sent_once(mock_server, tmp_path):
+    server = mock_server(delay=0.1)
+    df = pd.DataFrame({"id": ["a", "b", "c"], "full_text": ["same comment"] * 3})
+    labeler = Labeler(ChatClient(server.base_url), concurrency=3, rpm=60000, tpm=10**8)
+    out = label_frame(df, tmp_path / "progress.jsonl", labeler)
+    assert len(server.contents) == 1 and labeler.stats["deduplicated"] == 2
+    assert out["gpt4o_pred_stance_str"].nunique() == 1
+
+
+def test_evaluation_report():
+    labeled = pd.DataFrame({"stance_dei_label": [-1, 0, 1], "purchase_intention_label": [0, 0, -1],
+                            "gpt4o_pred_stance_label": [-1, 0, 0], "gpt4o_pred_pi_label": [0, 0, -1]})
+    report = evaluation_report(labeled)
+    assert "Stance Metrics" in report and "Accuracy       : 0.6667" in report and "Accuracy       : 1.0000" in report
+
+
+def test_parse_packed_is_strict():
+    answer = [{"index": 1, "stance": "anti", "pi": "boycott"}, {"index": 0, "stance": "pro", "pi": "neutral"}]
+    assert parse_packed("```json\n" + json.dumps(answer) + "\n```", 2) == [("pro", "neutral"), ("anti", "boycott")]
+    bad = [
+        json.dumps(answer[0]), # not an array
+        json.dumps(answer[:1]), # index 0 missing
+        json.dumps(answer + [answer[0]]), # repeated index
+        json.dumps([{**answer[0], "index": 2}, answer[1]]), # out of range
+        json.dumps([{**answer[0], "index": "1"}, answer[1]]), # index must be an int
+        json.dumps([{**answer[0], "stance": "against"}, answer[1]]), # unknown label
+        "[{\"index\": 0,", # truncated
+    ]
+    for content in bad:
+        with pytest.raises(ValueError):
+            parse_packed(content, 2)
+
+
+def test_packed_mode_matches_single_mode_with_fewer_requests_and_tokens(mock_server, tmp_path):
+    server = mock_server()
+    df = _frame(40)
+    packed = Labeler(ChatClient(server.base_url), concurrency=4, rpm=60000, tpm=10**8, pack_size=10)
+    packed_out = label_frame(df, tmp_path / "packed.jsonl", packed)
+    single = Labeler(ChatClient(server.base_url), concurrency=4, rpm=60000, tpm=10**8)
+    single_out = label_frame(df, tmp_path / "single.jsonl", single)
+
+    assert packed.stats["requests"] == 4 and packed.stats["ok"] == 40
+    assert mode_agreement(packed_out, single_out) == {"stance_agreement": 1.0, "stance_kappa": 1.0,
+                                                      "pi_agreement": 1.0, "pi_kappa": 1.0}
+    packed_usage, single_usage = usage_per_comment(packed.stats, 40), usage_per_comment(single.stats, 40)
+    assert packed_usage["requests"] == single_usage["requests"] / 10
+    assert packed_usage["prompt_tokens"] < single_usage["prompt_tokens"] / 5
+
+
+def test_changing_pack_size_relabels_the_progress_file(mock_server, tmp_path):
+    server = mock_server()
+    progress = tmp_path / "progress.jsonl"
+    single = Labeler(ChatClient(server.base_url), concurrency=2, rpm=60000, tpm=10**8)
+    label_frame(_frame(8), progress, single)
+
+    packed = Labeler(ChatClient(server.base_url), concurrency=2, rpm=60000, tpm=10**8, pack_size=4)
+    assert packed.run_key != single.run_key
+    label_frame(_frame(8), progress, packed)
+    assert packed.stats["requests"] == 2 and packed.stats["ok"] == 8
+    assert all(r.get("pack") == 4 for r in read_progress(progress).values())
+
+
+def test_invalid_pack_answers_are_split_and_retried(mock_server, tmp_path):
+    server = mock_server()
+    df = _frame(8)
+    df.loc[5, "full_text"] = "garble dei"
+    labeler = Labeler(ChatClient(server.base_url), concurrency=1, rpm=60000, tpm=10**8, pack_size=8)
+    out = label_frame(df, tmp_path / "progress.jsonl", labeler)
+    # 8 -> 4 + [4] -> [2] + 2 -> 1 + [1]: the garbled comment ends in a single-comment request
+    assert labeler.stats["pack_splits"] == 3 and labeler.stats["requests"] == 7
+    assert labeler.stats["ok"] == 8
+    assert out["gpt4o_pred_stance_str"].tolist()[5] == "pro"
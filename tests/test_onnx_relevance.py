@@ -0,0 +1,46 @@
+import joblib
+import numpy as np
+import pytest
+from sklearn.linear_model import LogisticRegression
+
+from scripts.model.onnx_relevance import NumpyHead, l2_normalize, mean_pool
+from scripts.model.relevance_inference import load_relevance_model
+
+MODEL_DIR = "models/relevance_setfit_model"
+
+
+def test_mean_pool_ignores_padding():
+    hidden = np.array([[[1.0, 2.0], [3.0, 4.0], [100.0, 100.0]],
+                       [[5.0, 6.0], [7.0, 8.0], [9.0, 10.0]]], dtype=np.float32)
+    mask = np.array([[1, 1, 0], [1, 1, 1]])
+    np.testing.assert_allclose(mean_pool(hidden, mask), [[2.0, 3.0], [7.0, 8.0]])
+    np.testing.assert_allclose(np.linalg.norm(l2_normalize(mean_pool(hidden, mask)), axis=1), 1.0, rtol=1e-6)
+
+
+@pytest.mark.parametrize("n_classes", [2, 3])
+def test_numpy_head_matches_sklearn(tmp_path, n_classes):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(300, 8))
+    y = rng.integers(0, n_classes, size=300)
+    sk_head = LogisticRegression().fit(X, y)
+
+    head = NumpyHead.from_sklearn(sk_head)
+    head.save(tmp_path / "head.npz")
+    reloaded = NumpyHead.load(tmp_path / "head.npz")
+    for h in (head, reloaded):
+        np.testing.assert_array_equal(h.predict(X), sk_head.predict(X))
+        np.testing.assert_allclose(h.predict_proba(X), sk_head.predict_proba(X), rtol=1e-10)
+
+
+@pytest.mark.filterwarnings("ignore::UserWarning") # head pickled with another scikit-learn version
+def test_numpy_head_matches_saved_model_head():
+    sk_head = joblib.load(f"{MODEL_DIR}/model_head.pkl")
+    X = l2_normalize(np.random.default_rng(1).normal(size=(500, sk_head.coef_.shape[1])).astype(np.float32))
+    np.testing.assert_array_equal(NumpyHead.from_sklearn(sk_head).predict(X), sk_head.predict(X))
+
+
+def test_onnx_backend_requires_export(tmp_path):
+    with pytest.raises(FileNotFoundError, match="export_relevance_model"):
+        load_relevance_model(tmp_path, "onnx")
+    with pytest.raises(ValueError):
+        load_relevance_model(tmp_path, "tensorrt")
@@ -0,0 +1,149 @@
+import json
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts.extract.process_comments_json import (
+    iter_json_array,
+    parse_relative_timestamp,
+    parse_relative_timestamps,
+    process_comment_file,
+    run_batch,
+    stream_comment_file,
+)
+
+POST_DATE = datetime(2025, 1, 24, 8, 17)
+
+
+def test_parse_relative_timestamps_matches_scalar():
+    """The vectorized parser agrees with the per-row parser on relative, absolute and junk values."""
+    now = datetime(2025, 2, 3, 10, 30, 15)
+    values = [
+        "5w", "2d", "3h", "10m", "1y", "Just now", " 7W ", "12 min", "July 25", "Dec 25",
+        "Jan 3 at 10:00 PM", "garbage", "", None, np.nan, 5, "999999999999d", "5w", "2d",
+    ]
+    expected = pd.to_datetime(pd.Series([parse_relative_timestamp(v, now) for v in values], dtype=object))
+    result = parse_relative_timestamps(pd.Series(values), now)
+    pd.testing.assert_series_equal(result, expected, check_names=False)
+
+
+@pytest.fixture
+def raw_comments_json(tmp_path):
+    """Writes a small scrape file with replies, a non-dict item and awkward text."""
+    comments = []
+    for i in range(25):
+        comments.append({
+            "id": f"c{i}",
+            "parent_id": None if i % 5 == 0 else f"c{i - i % 5}",
+            "text": f"comment {i} with ], [ and \"quotes\"",
+            "timestamp_text": ["5w", "2d", "3h", "Just now", "July 25"][i % 5],
+            "reaction_count": i,
+            "comment_type": "initial" if i % 5 == 0 else "reply",
+        })
+    comments.insert(7, "not a comment")
+    path = tmp_path / "01_24_25_0817AM.json"
+    path.write_text(json.dumps(comments, indent=2), encoding="utf-8")
+    return path
+
+
+@pytest.mark.parametrize("read_size", [1, 7, 4096])
+def test_iter_json_array_matches_json_loads(raw_comments_json, read_size):
+    """Items come out identical to json.loads regardless of the refill size."""
+    expected = json.loads(raw_comments_json.read_text(encoding="utf-8"))
+    with open(raw_comments_json, encoding="utf-8") as f:
+        assert f.read(2).strip() == "["
+        assert list(iter_json_array(f, read_size=read_size)) == expected
+
+
+def test_stream_matches_batch_csv(raw_comments_json, tmp_path, capsys):
+    """Chunked streaming writes the same CSV as the in-memory path and keeps the item warning."""
+    batch_out = tmp_path / "batch.csv"
+    stream_out = tmp_path / "stream.csv"
+    assert process_comment_file(str(raw_comments_json), str(batch_out), "Target", POST_DATE)
+    assert stream_comment_file(str(raw_comments_json), str(stream_out), "Target", POST_DATE, chunk_size=4)
+    assert stream_out.read_text(encoding="utf-8") == batch_out.read_text(encoding="utf-8")
+    assert "Found non-dictionary item" in capsys.readouterr().out
+
+
+def test_stream_parquet_output(raw_comments_json, tmp_path):
+    pytest.importorskip("pyarrow")
+    out = tmp_path / "stream.parquet"
+    assert stream_comment_file(str(raw_comments_json), str(out), "Target", POST_DATE, chunk_size=4)
+    df = pd.read_parquet(out)
+    assert len(df) == 25
+    assert df["parent_id"].isna().sum() == 5
+    assert (df["post_date"] == "2025-01-24 08:17:00").all()
+
+
+def test_stream_malformed_file_leaves_no_output(tmp_path, capsys):
+    """A decode error after some chunks were written removes the partial output."""
+    src = tmp_path / "01_24_25_0817AM.json"
+    src.write_text('[' + ','.join(json.dumps({"id": f"c{i}", "text": "x"}) for i in range(10)) + ',{"id": ', encoding="utf-8")
+    out = tmp_path / "out.csv"
+    assert not stream_comment_file(str(src), str(out), "Target", POST_DATE, chunk_size=3)
+    assert not out.exists()
+    assert "Could not decode JSON" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("tail", ['{"id": "c2"},]', '{"id": "c2"}] trailing', '{"id": "c2"}]\n]'])
+@pytest.mark.parametrize("read_size", [1, 4096])
+def test_iter_json_array_rejects_what_json_loads_rejects(tail, read_size, tmp_path):
+    """A trailing comma before ']' or data after it is an error, as with json.loads."""
+    path = tmp_path / "bad.json"
+    path.write_text('[{"id": "c1"}, ' + tail, encoding="utf-8")
+    with pytest.raises(json.JSONDecodeError):
+        json.loads(path.read_text(encoding="utf-8"))
+    with open(path, encoding="utf-8") as f:
+        f.read(1)
+        with pytest.raises(ValueError):
+            list(iter_json_array(f, read_size=read_size))
+
+
+def test_stream_parquet_keeps_non_integer_reaction_counts(tmp_path):
+    """Counts such as "1.2K" are written like the CSV path writes them instead of failing the file."""
+    pytest.importorskip("pyarrow")
+    comments = [{"id": "c1", "text": "a", "reaction_count": 3}, {"id": "c2", "text": "b", "reaction_count": "1.2K"},
+                {"id": "c3", "text": "c", "reaction_count": None}]
+    src = tmp_path / "01_24_25_0817AM.json"
+    src.write_text(json.dumps(comments), encoding="utf-8")
+    csv_out, parquet_out = tmp_path / "batch.csv", tmp_path / "stream.parquet"
+    assert process_comment_file(str(src), str(csv_out), "Target", POST_DATE)
+    assert stream_comment_file(str(src), str(parquet_out), "Target", POST_DATE, chunk_size=2)
+    expected = pd.read_csv(csv_out, dtype=str, keep_default_na=False).replace("", None)
+    pd.testing.assert_frame_equal(pd.read_parquet(parquet_out), expected, check_dtype=False)
+
+
+@pytest.mark.parametrize("content, message", [("   ", "is empty"), ('{"id": "c1"}', "Expected a list of comments")])
+def test_stream_rejects_empty_and_non_list(tmp_path, capsys, content, message):
+    src = tmp_path / "01_24_25_0817AM.json"
+    src.write_text(content, encoding="utf-8")
+    assert not stream_comment_file(str(src), str(tmp_path / "out.csv"), "Target", POST_DATE)
+    assert message in capsys.readouterr().out
+
+
+def test_run_batch_writes_manifest(raw_comments_json, tmp_path):
+    """Every <Company>/<Phase>/ file is processed and reported, including failures."""
+    raw = tmp_path / "raw"
+    good = raw / "Target" / "after_DEI"
+    good.mkdir(parents=True)
+    (good / raw_comments_json.name).write_text(raw_comments_json.read_text(encoding="utf-8"), encoding="utf-8")
+    bad = raw / "Costco" / "before_DEI"
+    bad.mkdir(parents=True)
+    (bad / "01_09_25_0900AM.json").write_text("{broken", encoding="utf-8")
+    (bad / "not_a_date.json").write_text("[]", encoding="utf-8")
+
+    manifest_path = tmp_path / "manifest.csv"
+    manifest = run_batch(str(raw), str(manifest_path), workers=2)
+
+    assert manifest_path.exists()
+    status = manifest.set_index("file")["status"].to_dict()
+    assert status == {
+        "01_24_25_0817AM.json": "success",
+        "01_09_25_0900AM.json": "failed",
+        "not_a_date.json": "failed",
+    }
+    failed = manifest.set_index("file").loc["01_09_25_0900AM.json"]
+    assert "Could not decode JSON" in failed["message"]
+    assert (good / "01_24_25_0817AM.csv").exists()
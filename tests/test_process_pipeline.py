@@ -1,4 +1,5 @@
 import pytest
+import numpy as np
 import pandas as pd
 import tempfile
 import os
@@ -6,9 +7,10 @@ import shutil
 from pathlib import Path
 
 # Import the functions/classes to be tested
-from scripts.preprocess.clean_comments import _clean_text, build_full_text, is_readable_comment
+from scripts.preprocess.clean_comments import TEXT_DTYPES, _clean_text, build_full_text, build_full_texts, clean_texts, is_readable_comment, readable_mask
 # We'll test clean_comments by running its main function
 from scripts.preprocess.clean_comments import main as clean_comments_main
+from scripts.frame_io import iter_frames, read_frame
 
 # --- Tests for _clean_text --- (Remains the same)
 
@@ -30,6 +32,22 @@ def test_clean_text(input_text, expected_output):
     """Tests the _clean_text function with various inputs."""
     assert _clean_text(input_text) == expected_output
 
+CLEAN_TEXT_INPUTS = [
+    "Hello World", "Check out https://example.com", "Thanks @user1!", "This is great 👍",
+    "  Leading/Trailing Spaces  ", "Emoji ❤️ and text", "Ｆｕｌｌ　ｗｉｄｔｈ", "ﬁne ümlaut", "", None,
+]
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_clean_texts_matches_scalar(workers):
+    """The batch cleaner returns the same strings as _clean_text, in order, for lists and Series."""
+    expected = [_clean_text(t) for t in CLEAN_TEXT_INPUTS]
+    assert clean_texts(CLEAN_TEXT_INPUTS, workers=workers, chunk_size=3) == expected
+
+    series = pd.Series(CLEAN_TEXT_INPUTS, index=range(10, 20), name="comment_text")
+    result = clean_texts(series, workers=workers, chunk_size=3)
+    assert result.index.equals(series.index)
+    assert result.tolist() == expected
+
 # --- Tests for is_readable_comment short text filtering ---
 @pytest.mark.parametrize(
     "input_text, expected",
@@ -53,6 +71,31 @@ def test_short_text_filter(input_text, expected):
     # Ensure we test the cleaned text
     assert is_readable_comment(cleaned) == expected
 
+READABILITY_INPUTS = [
+    "ok", "Hi!", "hey there", "none", "NaN", "<url>", "<URL>", "<mention> <url>", ":red_heart: :red_heart:",
+    ":thumbs_up: !!!", "!!! ???", ":) :(", "<url> real words", "  padded  ", "İi", "ab:c", "", "   ", None, float("nan"), 12345,
+]
+
+def test_readable_mask_matches_scalar():
+    """The Series filter agrees with is_readable_comment element by element."""
+    series = pd.Series(READABILITY_INPUTS, index=range(50, 50 + len(READABILITY_INPUTS)), dtype=object)
+    expected = series.apply(is_readable_comment)
+    pd.testing.assert_series_equal(readable_mask(series), expected, check_names=False)
+
+
+@pytest.mark.skipif(not os.environ.get("RUN_BENCHMARKS"), reason="timing benchmark; set RUN_BENCHMARKS=1 to run")
+def test_readable_mask_benchmark():
+    """readable_mask is not slower than the per-row apply it replaced (typically ~2x faster)."""
+    from scripts.preprocess.bench_clean_comments import _best_time, make_texts
+
+    texts = make_texts(50_000)
+    assert readable_mask(texts).equals(texts.apply(is_readable_comment).astype(bool)) # also warms up both paths
+    scalar = _best_time(lambda: texts.apply(is_readable_comment), repeat=3)
+    vector = _best_time(lambda: readable_mask(texts), repeat=3)
+    # Generous margin so a noisy machine does not fail the check
+    assert vector < scalar, f"readable_mask {vector:.3f}s vs apply {scalar:.3f}s"
+
+
 # --- Tests for clean_comments.py filtering --- 
 
 @pytest.fixture
@@ -108,7 +151,8 @@ def sample_graphed_csv_with_unreadable(tmp_path) -> tuple[str, list[str]]:
     return str(filepath), expected_remaining_ids
 
 
-def test_clean_thread_and_filter_comments(sample_graphed_csv_with_unreadable):
+@pytest.mark.parametrize("fmt, suffix", [("csv", ".csv"), ("parquet", ".parquet")])
+def test_clean_thread_and_filter_comments(sample_graphed_csv_with_unreadable, fmt, suffix):
     """Tests clean_comments.py including the filtering of unreadable comments."""
     
     input_csv_path_str, expected_ids = sample_graphed_csv_with_unreadable
@@ -116,17 +160,17 @@ def test_clean_thread_and_filter_comments(sample_graphed_csv_with_unreadable):
 
     with tempfile.TemporaryDirectory() as tmpdir:
         output_dir = Path(tmpdir)
-        expected_output_csv = output_dir / "cleaned_threaded_comments.csv"
+        expected_output_csv = output_dir / f"cleaned_threaded_comments{suffix}"
         
         # Run the main function
-        clean_comments_main(str(input_csv_path), str(output_dir))
+        clean_comments_main(str(input_csv_path), str(output_dir), fmt=fmt)
 
         # --- Assertions ---
-        # 1. Check if output CSV is created
-        assert expected_output_csv.exists(), "Output CSV file was not created."
+        # 1. Check if output file is created
+        assert expected_output_csv.exists(), "Output file was not created."
 
-        # 2. Load output CSV
-        df_out = pd.read_csv(expected_output_csv)
+        # 2. Load output file
+        df_out = read_frame(expected_output_csv)
 
         # 3. Check number of rows matches expected (now 11)
         assert len(df_out) == len(expected_ids), \
@@ -176,3 +220,96 @@ def test_build_full_text_logic():
     for idx, row in df.iterrows():
         assert row["full_text_test"] == expected[row['id']], \
             f"Mismatch for id {row['id']}. Expected: {expected[row['id']]}, Got: {row['full_text_test']}"
+
+
+def test_build_full_texts_depth():
+    """The vectorized builder supports ancestor depths other than two."""
+    df = pd.DataFrame({
+        'id': ['r1', 'r1_c1', 'r1_c1_c1', 'r1_c1_c1_c1'],
+        'parent_id': ['', 'r1', 'r1_c1', 'r1_c1_c1'],
+        'cleaned_text': ["a", "b", "c", "d"],
+    })
+    assert build_full_texts(df, depth=0).tolist() == ["a", "b", "c", "d"]
+    assert build_full_texts(df, depth=1).tolist() == ["a", "a → b", "b → c", "c → d"]
+    assert build_full_texts(df, depth=2).tolist() == ["a", "a → b", "a → b → c", "b → c → d"]
+    assert build_full_texts(df, depth=10).tolist() == ["a", "a → b", "a → b → c", "a → b → c → d"]
+
+
+def test_build_full_texts_matches_row_apply():
+    """Depth 2 reproduces build_full_text, including missing parents and duplicate ids."""
+    rng = np.random.default_rng(0)
+    n = 300
+    ids = [f"c{i}" for i in range(n)]
+    ids[5] = ids[4]  # duplicated id: the dict maps keep the last row
+    parents = [ids[rng.integers(0, i)] if i and rng.random() < 0.7 else '' for i in range(n)]
+    parents[10], parents[11] = None, 'missing'
+    df = pd.DataFrame({'id': ids, 'parent_id': parents, 'cleaned_text': [f"t{i}" for i in range(n)]},
+                      index=range(100, 100 + n))
+
+    parent_map = df.set_index('id')['parent_id'].to_dict()
+    text_map = df.set_index('id')['cleaned_text'].to_dict()
+    expected = df.apply(lambda row: build_full_text(row, parent_map, text_map), axis=1)
+    pd.testing.assert_series_equal(build_full_texts(df), expected, check_dtype=False)
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+def test_streaming_clean_matches_full(sample_graphed_csv_with_unreadable, tmp_path, fmt):
+    """--chunk-rows streams the input and writes the same rows and columns as the in-memory run."""
+    input_csv_path, expected_ids = sample_graphed_csv_with_unreadable
+    full_dir, stream_dir = tmp_path / "full", tmp_path / "stream"
+    full_dir.mkdir()
+    stream_dir.mkdir()
+
+    clean_comments_main(input_csv_path, str(full_dir), fmt=fmt)
+    # Chunks of 4 rows put parents and replies in different chunks
+    clean_comments_main(input_csv_path, str(stream_dir), fmt=fmt, chunk_rows=4)
+
+    name = f"cleaned_threaded_comments.{fmt}"
+    df_full = read_frame(full_dir / name)
+    df_stream = read_frame(stream_dir / name)
+    pd.testing.assert_frame_equal(df_stream, df_full)
+    assert set(df_stream['id']) == set(expected_ids)
+    assert df_stream.loc[df_stream['id'] == 'c3', 'full_text'].item().count(" → ") == 2
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+def test_streaming_and_full_clean_read_ids_alike(tmp_path, fmt):
+    """Numeric-looking ids are read as strings in both modes, so the artifacts have the same types."""
+    import pyarrow.parquet as pq
+
+    src = tmp_path / "graphed.csv"
+    pd.DataFrame({
+        "id": ["101", "102", "103"],
+        "parent_id": ["", "101", "102"],
+        "root_id": ["101", "101", "101"],
+        "comment_text": ["first comment here", "a reply to it", "and another reply"],
+    }).to_csv(src, index=False)
+    full_dir, stream_dir = tmp_path / "full", tmp_path / "stream"
+    full_dir.mkdir()
+    stream_dir.mkdir()
+    clean_comments_main(str(src), str(full_dir), fmt=fmt)
+    clean_comments_main(str(src), str(stream_dir), fmt=fmt, chunk_rows=2)
+
+    name = f"cleaned_threaded_comments.{fmt}"
+    if fmt == "parquet":
+        assert pq.read_schema(full_dir / name).equals(pq.read_schema(stream_dir / name))
+    df_full = read_frame(full_dir / name, dtype=TEXT_DTYPES)
+    pd.testing.assert_frame_equal(read_frame(stream_dir / name, dtype=TEXT_DTYPES), df_full)
+    assert df_full["id"].tolist() == ["101", "102", "103"]
+    assert df_full.loc[2, "full_text"].count(" → ") == 2
+
+
+def test_streaming_clean_first_pass_reads_only_text_columns(sample_graphed_csv_with_unreadable, tmp_path, monkeypatch):
+    """Pass 1 loads id, parent_id and comment_text; only pass 2 reads every column."""
+    import scripts.preprocess.clean_comments as clean_comments
+
+    requested = []
+
+    def recording_iter_frames(src, chunk_rows, columns=None, dtype=None):
+        requested.append(columns)
+        return iter_frames(src, chunk_rows, columns=columns, dtype=dtype)
+
+    monkeypatch.setattr(clean_comments, "iter_frames", recording_iter_frames)
+    input_csv_path, _ = sample_graphed_csv_with_unreadable
+    clean_comments.stream_clean(input_csv_path, tmp_path / "out.parquet", chunk_rows=4)
+    assert requested == [["id", "parent_id", "comment_text"], None]
@@ -0,0 +1,76 @@
+import numpy as np
+
+from scripts.model.relevance_inference import (
+    embed_with_cache,
+    encode_bucketed,
+    encode_texts,
+    padding_efficiency,
+    plan_batches,
+)
+
+DIM = 4
+
+
+class WhitespaceTokenizer:
+    def __call__(self, texts, add_special_tokens, truncation, max_length):
+        return {"input_ids": [list(range(min(len(t.split()) + 2, max_length))) for t in texts]}
+
+
+class RecordingBody:
+    """Stand-in sentence-transformer body: embeds a text as [word count, ...] and records batch sizes."""
+
+    max_seq_length = 16
+    tokenizer = WhitespaceTokenizer()
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def encode(self, texts, batch_size, normalize_embeddings, convert_to_numpy, show_progress_bar):
+        self.batch_sizes.append(len(texts))
+        return np.array([[len(t.split()), len(t), 0, 1] for t in texts], dtype=np.float32)
+
+    def get_sentence_embedding_dimension(self):
+        return DIM
+
+
+class RecordingModel:
+    normalize_embeddings = False
+
+    def __init__(self):
+        self.model_body = RecordingBody()
+
+
+def test_plan_batches_respects_token_budget():
+    rng = np.random.default_rng(0)
+    lengths = rng.integers(3, 256, size=500)
+    batches = plan_batches(lengths, max_tokens=1024, max_batch_size=64)
+
+    covered = np.concatenate(batches)
+    assert sorted(covered.tolist()) == list(range(500))
+    for batch in batches:
+        assert len(batch) <= 64
+        assert len(batch) == 1 or len(batch) * lengths[batch].max() <= 1024
+    assert padding_efficiency(lengths, batches) > padding_efficiency(lengths, [np.arange(i, i + 50) for i in range(0, 500, 50)])
+
+
+def test_plan_batches_oversized_text_gets_own_batch():
+    batches = plan_batches([300, 2, 2], max_tokens=100)
+    assert [b.tolist() for b in batches] == [[0], [1, 2]]
+
+
+def test_encode_bucketed_restores_input_order():
+    model = RecordingModel()
+    texts = ["a b c d e f g h", "x", "one two", "a b c d e f g h i j k l m n o p q", "y z"]
+    embeddings, stats = encode_bucketed(model, texts, max_tokens=12)
+
+    np.testing.assert_array_equal(embeddings, encode_texts(RecordingModel(), texts))
+    assert stats["comments"] == 5 and stats["batches"] == len(model.model_body.batch_sizes)
+    assert 0 < stats["padding_efficiency"] <= 1
+    assert stats["padding_efficiency"] >= stats["fixed_batch_padding_efficiency"]
+
+
+def test_embed_with_cache_bucketed_matches_fixed():
+    texts = ["short", "a much longer comment about the boycott", "short", "mid length text"]
+    fixed = embed_with_cache(RecordingModel(), texts)
+    bucketed = embed_with_cache(RecordingModel(), texts, max_tokens=8)
+    np.testing.assert_array_equal(bucketed, fixed)
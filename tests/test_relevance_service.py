@@ -0,0 +1,100 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from scripts.model.relevance_service import MicroBatcher, ScoringServer
+
+
+class SlowPredictor:
+    """Labels a text 1 if it mentions 'boycott'; records batch sizes and takes a fixed time per batch."""
+
+    def __init__(self, seconds=0.01):
+        self.seconds = seconds
+        self.batch_sizes = []
+
+    def __call__(self, texts):
+        self.batch_sizes.append(len(texts))
+        time.sleep(self.seconds)
+        return [int("boycott" in t) for t in texts]
+
+
+def test_batcher_coalesces_concurrent_submissions():
+    predictor = SlowPredictor()
+    batcher = MicroBatcher(predictor, max_batch_size=16, max_wait_ms=50)
+    try:
+        texts = [f"comment {i} boycott" if i % 3 == 0 else f"comment {i}" for i in range(40)]
+        futures = [batcher.submit(t) for t in texts]
+        assert [f.result(timeout=5) for f in futures] == [int(i % 3 == 0) for i in range(40)]
+        assert max(predictor.batch_sizes) == 16 and len(predictor.batch_sizes) < 40
+        stats = batcher.stats()
+        assert stats["comments"] == 40 and stats["batches"] == len(predictor.batch_sizes)
+        assert stats["queue_depth"] == 0 and 0 < stats["p50_ms"] <= stats["p99_ms"]
+    finally:
+        batcher.close()
+
+
+def test_lone_request_waits_at_most_the_deadline():
+    predictor = SlowPredictor(seconds=0)
+    batcher = MicroBatcher(predictor, max_batch_size=64, max_wait_ms=20)
+    try:
+        start = time.perf_counter()
+        assert batcher.submit("boycott").result(timeout=5) == 1
+        assert time.perf_counter() - start < 1.0
+        assert predictor.batch_sizes == [1]
+    finally:
+        batcher.close()
+
+
+def test_batch_errors_reach_every_caller():
+    def failing(texts):
+        raise RuntimeError("model crashed")
+
+    batcher = MicroBatcher(failing, max_wait_ms=1)
+    try:
+        with pytest.raises(RuntimeError, match="model crashed"):
+            batcher.submit("x").result(timeout=5)
+    finally:
+        batcher.close()
+
+
+@pytest.fixture
+def server():
+    batcher = MicroBatcher(SlowPredictor(seconds=0.005), max_batch_size=32, max_wait_ms=10)
+    server = ScoringServer(("127.0.0.1", 0), batcher)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+    batcher.close()
+
+
+def _request(url, payload=None):
+    data = None if payload is None else json.dumps(payload).encode("utf-8")
+    with urllib.request.urlopen(urllib.request.Request(url, data=data), timeout=5) as response:
+        return json.loads(response.read())
+
+
+def test_http_scoring_and_metrics(server):
+    assert _request(f"{server}/score", {"texts": ["boycott target", "nice shoes"]})["relevance"] == [1, 0]
+    assert _request(f"{server}/score", {"text": "boycott"})["relevance"] == [1]
+
+    with ThreadPoolExecutor(16) as ex:
+        results = list(ex.map(lambda i: _request(f"{server}/score", {"text": f"boycott {i}"}), range(64)))
+    assert all(r["relevance"] == [1] for r in results)
+
+    metrics = _request(f"{server}/metrics")
+    assert metrics["comments"] == 67 and metrics["batches"] < 67 and metrics["p99_ms"] is not None
+    assert _request(f"{server}/health")["status"] == "ok"
+
+
+def test_http_rejects_bad_payloads(server):
+    for payload in ({"texts": "not a list"}, {"texts": [1, 2]}, {"other": 1}):
+        with pytest.raises(urllib.error.HTTPError) as err:
+            _request(f"{server}/score", payload)
+        assert err.value.code == 400
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from scripts.model.train_relevance_model import (
+    HEAD_GRID,
+    body_fingerprint,
+    load_annotations,
+    search_head,
+    split_annotations,
+)
+
+
+def test_split_annotations_is_stratified_and_reproducible():
+    df = load_annotations()
+    assert list(df.columns) == ["text", "label"] and df["label"].dtype.kind == "i"
+    train_df, eval_df = split_annotations(df)
+    again = split_annotations(df)[1]
+    assert list(eval_df.index) == list(again.index)
+    assert len(eval_df) == round(0.2 * len(df))
+    assert eval_df["label"].mean() == pytest.approx(df["label"].mean(), abs=0.01)
+
+
+def test_search_head_ranks_the_grid():
+    rng = np.random.default_rng(0)
+    y = rng.integers(0, 2, size=200)
+    X = rng.normal(size=(200, 6)) + y[:, None] * 0.8
+    results, best = search_head(X, y, folds=3, n_jobs=1)
+    assert len(results) == len(HEAD_GRID["C"]) * len(HEAD_GRID["class_weight"])
+    assert results["mean_test_score"].is_monotonic_decreasing
+    assert results.loc[0, "params"] == best and results.loc[0, "mean_test_score"] > 0.7
+
+
+def test_body_fingerprint(tmp_path):
+    (tmp_path / "config.json").write_text("{}")
+    assert not body_fingerprint(str(tmp_path)).startswith("hub-")
+    assert body_fingerprint("sentence-transformers/all-MiniLM-L6-v2").startswith("hub-")
+    assert body_fingerprint("a/b") != body_fingerprint("a/c")